@@ -0,0 +1,97 @@
+# benchmarks/ann_benchmark.py
+# recall@k vs latency for the index types in src/common/vector_index/index_factory.py.
+#
+# Vectors are synthetic 768-d (the nomic-embed-text size) drawn around random
+# cluster centres, which is closer to real embeddings than uniform noise.
+# Ground truth comes from the exact flat index. Each index type is swept over
+# its search knob (nprobe for IVF, efSearch for HNSW); latency is measured one
+# query at a time, as the search handlers issue them.
+#
+# Usage (from S8/):
+#   python benchmarks/ann_benchmark.py --n 50000 --queries 200 --k 10
+#   python benchmarks/ann_benchmark.py --types flat hnsw --metric ip
+
+import argparse
+import time
+from pathlib import Path
+import sys
+ROOT = Path(__file__).resolve().parents[1]  # This gets /Users/ravi/EAG-TheShadowCloneAI/S8
+
+if str(ROOT) not in sys.path:
+    sys.path.append(str(ROOT))
+
+import faiss
+import numpy as np
+
+from src.common.vector_index.index_factory import INDEX_TYPES, IndexSpec, build_index, search_params
+
+SWEEPS = {
+    "flat": [None],
+    "ivf_flat": [1, 4, 16, 64],
+    "ivf_pq": [1, 4, 16, 64],
+    "hnsw": [16, 32, 64, 128],
+}
+
+
+def synthetic_vectors(n: int, dim: int, clusters: int, seed: int = 0) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    centres = rng.standard_normal((clusters, dim)).astype(np.float32)
+    labels = rng.integers(0, clusters, n)
+    vectors = centres[labels] + 0.35 * rng.standard_normal((n, dim)).astype(np.float32)
+    faiss.normalize_L2(vectors)  # embedding models return (near) unit vectors
+    return vectors
+
+
+def recall_at_k(found: np.ndarray, truth: np.ndarray, k: int) -> float:
+    hits = sum(len(set(f[:k]) & set(t[:k])) for f, t in zip(found, truth))
+    return hits / (len(truth) * k)
+
+
+def timed_search(index, queries: np.ndarray, k: int, params):
+    found = np.empty((len(queries), k), dtype=np.int64)
+    latencies = []
+    for i, query in enumerate(queries):
+        start = time.perf_counter()
+        _, ids = index.search(query.reshape(1, -1), k, params=params)
+        latencies.append(time.perf_counter() - start)
+        found[i] = ids[0]
+    return found, np.array(latencies) * 1000
+
+
+def main(n: int, dim: int, queries: int, k: int, types: list, metric: str):
+    spec = IndexSpec(metric=faiss.METRIC_INNER_PRODUCT if metric == "ip" else faiss.METRIC_L2)
+    data = synthetic_vectors(n + queries, dim, clusters=max(16, n // 500))
+    base, query_vectors = data[:n], data[n:]
+
+    exact = build_index(base, spec, "flat")
+    _, truth = exact.search(query_vectors, k)
+
+    print(f"{n} vectors, dim {dim}, {queries} queries, recall@{k}, metric {metric}")
+    print()
+    print(f"{'index':>9} {'param':>10} {'build s':>8} {'recall':>7} {'p50 ms':>7} {'p95 ms':>7} {'qps':>8}")
+    for index_type in types:
+        start = time.perf_counter()
+        index = exact if index_type == "flat" else build_index(base, spec, index_type)
+        build_seconds = time.perf_counter() - start
+        for value in SWEEPS[index_type]:
+            if index_type in ("ivf_flat", "ivf_pq"):
+                params, label = search_params(index, nprobe=value), f"nprobe={value}"
+            elif index_type == "hnsw":
+                params, label = search_params(index, ef_search=value), f"ef={value}"
+            else:
+                params, label = None, "exact"
+            found, latency = timed_search(index, query_vectors, k, params)
+            print(f"{index_type:>9} {label:>10} {build_seconds:>8.2f} {recall_at_k(found, truth, k):>7.3f} "
+                  f"{np.percentile(latency, 50):>7.3f} {np.percentile(latency, 95):>7.3f} {1000 / latency.mean():>8.0f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="ANN index recall@k vs latency")
+    parser.add_argument("--n", type=int, default=50000, help="corpus size")
+    parser.add_argument("--dim", type=int, default=768)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--types", nargs="+", default=list(INDEX_TYPES), choices=INDEX_TYPES)
+    parser.add_argument("--metric", choices=["l2", "ip"], default="l2")
+    args = parser.parse_args()
+    main(args.n, args.dim, args.queries, args.k, args.types, args.metric)
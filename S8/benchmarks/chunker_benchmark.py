@@ -0,0 +1,75 @@
+# benchmarks/chunker_benchmark.py
+# Benchmarks MarkdownChunker on the text/markdown files in resources/documents.
+#
+# By default the LLM boundary judge is replaced by a deterministic stub that sleeps
+# --llm-latency seconds per call, so the numbers show how many calls are made and
+# how well they overlap. Pass --ollama to use the real local model instead.
+# The legacy column estimates the old semantic_merge cost: one sequential LLM call
+# per 512-word window.
+#
+# Usage (from S8/):
+#   python benchmarks/chunker_benchmark.py --workers 1 4 8 --llm-latency 0.5
+
+import argparse
+import hashlib
+import time
+from pathlib import Path
+import sys
+ROOT = Path(__file__).resolve().parents[1]  # This gets /Users/ravi/EAG-TheShadowCloneAI/S8
+
+if str(ROOT) not in sys.path:
+    sys.path.append(str(ROOT))
+
+from src.server.rag_server.common.chunker import MarkdownChunker, llm_same_topic
+from src.server.rag_server.common.config.rag_config import DOC_PATH, CHUNK_WORD_LIMIT
+
+
+def stub_judge(latency: float):
+    def judge(first: str, second: str) -> bool:
+        time.sleep(latency)
+        # Deterministic pseudo-decision so repeated runs are comparable
+        return hashlib.md5((first[-40:] + second[:40]).encode()).digest()[0] % 3 != 0
+    return judge
+
+
+def load_documents(doc_path: Path) -> dict:
+    docs = {}
+    for path in sorted(doc_path.glob("*.*")):
+        if path.suffix.lower() in (".txt", ".md"):
+            docs[path.name] = path.read_text(encoding="utf-8", errors="ignore")
+    return docs
+
+
+def main(workers: list, latency: float, use_ollama: bool):
+    docs = load_documents(DOC_PATH)
+    total_words = sum(len(text.split()) for text in docs.values())
+    legacy_calls = sum(-(-len(text.split()) // CHUNK_WORD_LIMIT) for text in docs.values())
+    print(f"{len(docs)} documents, {total_words} words")
+    print(f"legacy semantic_merge: >= {legacy_calls} sequential LLM calls"
+          + ("" if use_ollama else f" (~{legacy_calls * latency:.1f}s at {latency}s/call)"))
+    print()
+    print(f"{'workers':>7} {'chunks':>7} {'llm calls':>10} {'seconds':>8} {'deterministic':>14}")
+
+    for n in workers:
+        judge = llm_same_topic if use_ollama else stub_judge(latency)
+        start = time.perf_counter()
+        chunker = MarkdownChunker(max_workers=n, judge=judge)
+        outputs = {name: chunker.chunk(text) for name, text in docs.items()}
+        elapsed = time.perf_counter() - start
+        calls = chunker.judge_calls
+
+        # Same input must produce the same output with a fresh chunker
+        again = MarkdownChunker(max_workers=n, judge=judge)
+        deterministic = all(again.chunk(text) == outputs[name] for name, text in docs.items())
+
+        chunk_count = sum(len(chunks) for chunks in outputs.values())
+        print(f"{n:>7} {chunk_count:>7} {calls:>10} {elapsed:>8.2f} {str(deterministic):>14}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="MarkdownChunker benchmark")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 4, 8])
+    parser.add_argument("--llm-latency", type=float, default=0.5, help="seconds per stubbed LLM call")
+    parser.add_argument("--ollama", action="store_true", help="use the real local LLM judge")
+    args = parser.parse_args()
+    main(args.workers, args.llm_latency, args.ollama)
@@ -0,0 +1,160 @@
+# benchmarks/ingest_benchmark.py
+# Benchmarks multi-file ingestion: the old one-file-at-a-time loop against the
+# staged IngestPipeline (extract -> chunk -> embed -> commit with bounded queues).
+#
+# Synthetic .md/.txt files are written to a temp directory, embeddings come from a
+# local stub /api/embed server that sleeps --embed-latency seconds per request and
+# returns deterministic vectors, and both runs commit to their own temp index
+# through an IngestQueue. Chunking uses MarkdownChunker without the LLM judge, so
+# no Ollama is needed. Per-stage throughput is printed for the pipeline run.
+#
+# Usage (from S8/):
+#   python benchmarks/ingest_benchmark.py --files 40 --words 3000 --embed-latency 0.2
+
+import argparse
+import asyncio
+import hashlib
+import json
+import random
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+import numpy as np
+import sys
+ROOT = Path(__file__).resolve().parents[1]  # This gets /Users/ravi/EAG-TheShadowCloneAI/S8
+
+if str(ROOT) not in sys.path:
+    sys.path.append(str(ROOT))
+
+from src.common.embedding.embedding_cache import EmbeddingCache
+from src.common.embedding.embedding_client import EmbeddingClient
+from src.server.rag_server.common.chunk_store import ChunkStore
+from src.server.rag_server.common.chunker import MarkdownChunker
+from src.server.rag_server.common.ingest_queue import IngestQueue
+from src.server.rag_server.common.ingest_pipeline import IngestPipeline
+from src.server.rag_server.common.utils import file_hash
+
+DIM = 768
+WORDS = ("index vector query latency batch cache shard replica commit segment "
+         "token model embed chunk page image caption server client request").split()
+
+
+def stub_embed_server(latency: float) -> ThreadingHTTPServer:
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+            time.sleep(latency)
+            vectors = []
+            for text in body["input"]:
+                seed = int.from_bytes(hashlib.md5(text.encode()).digest()[:4], "little")
+                vectors.append(np.random.default_rng(seed).standard_normal(DIM).tolist())
+            payload = json.dumps({"embeddings": vectors}).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def write_documents(doc_dir: Path, files: int, words: int, seed: int) -> list:
+    rng = random.Random(seed)
+    paths = []
+    for n in range(files):
+        sections = []
+        for s in range(max(1, words // 150)):
+            paragraph = " ".join(rng.choice(WORDS) for _ in range(150)) + "."
+            sections.append(f"## Section {s}\n\n{paragraph}")
+        path = doc_dir / f"doc_{n:03d}{'.md' if n % 2 else '.txt'}"
+        path.write_text(f"# Document {n}\n\n" + "\n\n".join(sections), encoding="utf-8")
+        paths.append(path)
+    return paths
+
+
+def make_writer(work_dir: Path) -> IngestQueue:
+    work_dir.mkdir(parents=True, exist_ok=True)
+    store = ChunkStore(work_dir / "chunks.sqlite", work_dir / "metadata.json", work_dir / "doc_index_cache.json")
+    return IngestQueue(work_dir / "index.bin", work_dir / "vectors.npy", work_dir / "ingest.wal", work_dir / "index.lock", store=store)
+
+
+async def sequential(files: list, chunker: MarkdownChunker, embedder: EmbeddingClient, writer: IngestQueue) -> int:
+    """The previous process_documents loop: each file fully extracted, chunked, embedded and committed in turn"""
+    chunks_total = 0
+    for file in files:
+        fhash = file_hash(file.read_bytes())
+        markdown = file.read_text(encoding="utf-8")
+        chunks = chunker.chunk(markdown)
+        vectors = await embedder.aembed_batch(chunks)
+        records = [{"doc": file.name, "doc_id": file.stem, "chunk": chunk, "chunk_id": f"{file.stem}_{i}"}
+                   for i, chunk in enumerate(chunks)]
+        await writer.asubmit(records, vectors, {file.name: fhash})
+        chunks_total += len(chunks)
+    return chunks_total
+
+
+def main(files: int, words: int, latency: float, embed_concurrency: int, workers: int, seed: int):
+    server = stub_embed_server(latency)
+    embed_url = f"http://127.0.0.1:{server.server_address[1]}/api/embed"
+    chunker = MarkdownChunker(use_llm=False)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        doc_dir = tmp / "documents"
+        doc_dir.mkdir()
+        paths = write_documents(doc_dir, files, words, seed)
+        print(f"{files} files, ~{words} words each, stub embed latency {latency}s/request")
+
+        def embedder():
+            # Fresh in-memory cache per run so neither run benefits from the other
+            return EmbeddingClient(embed_url, max_concurrency=embed_concurrency, cache=EmbeddingCache(db_path=None))
+
+        start = time.perf_counter()
+        chunks = asyncio.run(sequential(paths, chunker, embedder(), make_writer(tmp / "sequential")))
+        baseline = time.perf_counter() - start
+        print(f"{'sequential':<12} {baseline:7.2f}s  {chunks} chunks")
+
+        writer = make_writer(tmp / "pipeline")
+        pipeline = IngestPipeline(
+            extractor=lambda file: (iter([file.read_text(encoding="utf-8")]), None),
+            chunker=chunker,
+            embedder=embedder(),
+            ingest_queue=writer,
+            store=writer.store,
+            extract_workers=workers,
+            chunk_workers=workers,
+            embed_workers=workers,
+            log=lambda level, message: None,
+        )
+        results, stages = asyncio.run(pipeline.run(paths))
+        wall = stages.pop("wall_s")
+        chunks = sum(r.get("chunks", 0) for r in results)
+        errors = [r for r in results if r["status"] == "error"]
+        print(f"{'pipeline':<12} {wall:7.2f}s  {chunks} chunks  {baseline / wall:.2f}x"
+              + (f"  {len(errors)} errors, first: {errors[0]['error']}" if errors else ""))
+
+        print()
+        print(f"{'stage':<8} {'items':>6} {'units':>7} {'units/s':>9} {'busy s':>8} {'active s':>9} {'util':>6}")
+        for name, s in stages.items():
+            print(f"{name:<8} {s['items']:>6} {s['units']:>7} {s['units_per_s']:>9} {s['busy_s']:>8} {s['active_s']:>9} {s['utilization']:>6}")
+
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark sequential vs pipelined multi-file ingestion")
+    parser.add_argument("--files", type=int, default=40)
+    parser.add_argument("--words", type=int, default=3000, help="Approximate words per file")
+    parser.add_argument("--embed-latency", type=float, default=0.2, help="Stub embedding server seconds per request")
+    parser.add_argument("--embed-concurrency", type=int, default=4, help="EmbeddingClient requests in flight")
+    parser.add_argument("--workers", type=int, default=2, help="Workers per pipeline stage")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    main(args.files, args.words, args.embed_latency, args.embed_concurrency, args.workers, args.seed)
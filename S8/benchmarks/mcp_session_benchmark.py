@@ -0,0 +1,66 @@
+# benchmarks/mcp_session_benchmark.py
+# Compares per-call latency of MultiMCP in stateless mode (new subprocess per call)
+# against pooled mode (long-lived sessions) using the local math server.
+#
+# Usage (from S8/):
+#   python benchmarks/mcp_session_benchmark.py --calls 20
+
+import argparse
+import asyncio
+import statistics
+import time
+from pathlib import Path
+import sys
+ROOT = Path(__file__).resolve().parents[1]  # This gets /Users/ravi/EAG-TheShadowCloneAI/S8
+
+if str(ROOT) not in sys.path:
+    sys.path.append(str(ROOT))
+
+from src.core.agent.common.session import MultiMCP
+
+MATH_SERVER = [{
+    "id": "math",
+    "script": "math_server.py",
+    "cwd": str(ROOT / "src" / "server" / "math_server")
+}]
+
+
+def summarize(name: str, latencies: list[float]) -> str:
+    ordered = sorted(latencies)
+    p95 = ordered[min(len(ordered) - 1, int(round(0.95 * (len(ordered) - 1))))]
+    return (
+        f"{name:<10} calls={len(latencies):<4} "
+        f"mean={statistics.mean(latencies) * 1000:8.1f}ms "
+        f"p50={statistics.median(latencies) * 1000:8.1f}ms "
+        f"p95={p95 * 1000:8.1f}ms"
+    )
+
+
+async def bench(mode: str, calls: int) -> list[float]:
+    multi_mcp = MultiMCP(server_config=MATH_SERVER, mode=mode, health_check_interval=0)
+    await multi_mcp.initialize()
+    latencies = []
+    try:
+        for i in range(calls):
+            start = time.perf_counter()
+            await multi_mcp.call_tool("add", {"input_data": {"a": i, "b": 1}})
+            latencies.append(time.perf_counter() - start)
+    finally:
+        await multi_mcp.shutdown()
+    return latencies
+
+
+async def main(calls: int):
+    stateless = await bench("stateless", calls)
+    pooled = await bench("pooled", calls)
+    print()
+    print(summarize("stateless", stateless))
+    print(summarize("pooled", pooled))
+    print(f"speedup (p50): {statistics.median(stateless) / statistics.median(pooled):.1f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="MultiMCP stateless vs pooled latency")
+    parser.add_argument("--calls", type=int, default=20, help="tool calls per mode")
+    args = parser.parse_args()
+    asyncio.run(main(args.calls))
@@ -0,0 +1,176 @@
+# benchmarks/planning_benchmark.py
+# Latency / accuracy of one agent step: separate planning (extract_perception +
+# generate_plan, two LLM calls) vs fused planning (generate_fused_plan, one call,
+# falling back to the separate path when its output cannot be parsed).
+#
+# By default the LLM is a deterministic mock: each call sleeps --llm-latency seconds
+# plus --prefill-ms per 1000 prompt characters, answers from the TASKS table, and
+# garbles every 1/--fused-error-rate-th fused response so the fallback cost shows up.
+# Accuracy is the share of steps whose plan picks the expected tool (or answers
+# directly when no tool is expected). Pass --live to use the configured model instead.
+#
+# Usage (from S8/):
+#   python benchmarks/planning_benchmark.py --llm-latency 0.8 --fused-error-rate 0.1
+#   python benchmarks/planning_benchmark.py --live
+
+import argparse
+import asyncio
+import json
+import statistics
+import time
+from pathlib import Path
+import sys
+ROOT = Path(__file__).resolve().parents[1]  # This gets /Users/ravi/EAG-TheShadowCloneAI/S8
+
+if str(ROOT) not in sys.path:
+    sys.path.append(str(ROOT))
+
+import src.core.agent.modules.decision.decision as decision
+import src.core.agent.modules.perception.perception as perception
+from src.core.agent.modules.tools.tools import filter_tools_by_hint, summarize_tools
+
+
+class Tool:
+    def __init__(self, name: str, description: str):
+        self.name = name
+        self.description = description
+
+
+TOOLS = [
+    Tool("search_documents", "Search the indexed documents for relevant passages. Usage: input={\"query\": \"...\"}"),
+    Tool("web_search", "Search the web. Usage: input={\"query\": \"...\"}"),
+    Tool("add", "Add two numbers. Usage: input={\"a\": 1, \"b\": 2}"),
+    Tool("multiply", "Multiply two numbers. Usage: input={\"a\": 1, \"b\": 2}"),
+    Tool("horizontal_range", "Projectile range. Usage: input={\"v0\": 20, \"angle\": 45, \"g\": 9.8}"),
+    Tool("strings_to_chars_to_int", "ASCII values of the characters of a string. Usage: input={\"string\": \"INDIA\"}"),
+]
+
+# (user input, intent, entities, expected tool or None for a direct answer, args)
+TASKS = [
+    ("What is the relationship between Cricket and Sachin Tendulkar?", "find relationship", ["Cricket", "Sachin Tendulkar"], "search_documents", {"query": "Cricket Sachin Tendulkar"}),
+    ("Add 17 and 25", "add numbers", ["17", "25"], "add", {"a": 17, "b": 25}),
+    ("Multiply 12 by 9", "multiply numbers", ["12", "9"], "multiply", {"a": 12, "b": 9}),
+    ("Projectile range with velocity 20m/s at 45 degrees", "projectile range", ["20", "45"], "horizontal_range", {"v0": 20, "angle": 45, "g": 9.8}),
+    ("ASCII values of INDIA", "ascii values", ["INDIA"], "strings_to_chars_to_int", {"string": "INDIA"}),
+    ("Summarize what our documents say about DLF apartments", "summarize documents", ["DLF"], "search_documents", {"query": "DLF apartments"}),
+    ("Latest news about the Mars rover", "find news", ["Mars rover"], "web_search", {"query": "Mars rover news"}),
+    ("Say hello", "greeting", [], None, {}),
+]
+
+
+class MockLLM:
+    """Deterministic stand-in for ModelManager (generate_text / stream_text)"""
+    def __init__(self, latency: float, prefill_ms: float, fused_error_rate: float):
+        self.latency = latency
+        self.prefill_ms = prefill_ms
+        self.fused_error_rate = fused_error_rate
+        self.calls = 0
+        self.fused_calls = 0
+
+    @staticmethod
+    def _task(prompt: str):
+        return next(task for task in TASKS if task[0] in prompt)
+
+    @staticmethod
+    def _plan(task) -> str:
+        _, _, _, tool, args = task
+        if tool is None:
+            return "FINAL_ANSWER: Hello!"
+        return "FUNCTION_CALL: " + json.dumps({"name": tool, "args": args})
+
+    async def generate_text(self, prompt: str, **kwargs) -> str:
+        self.calls += 1
+        await asyncio.sleep(self.latency + self.prefill_ms * len(prompt) / 1000 / 1000)
+        task = self._task(prompt)
+        user_input, intent, entities, tool, _ = task
+        facts = {"intent": intent, "entities": entities, "tool_hint": tool}
+        if "In ONE response" in prompt:
+            # spread errors evenly so every run garbles exactly that share of fused calls
+            self.fused_calls += 1
+            if int(self.fused_calls * self.fused_error_rate) > int((self.fused_calls - 1) * self.fused_error_rate):
+                return f"I think the best tool here is {tool}."  # no parsable plan line
+            return f"PERCEPTION: {json.dumps(facts)}\n{self._plan(task)}"
+        if "extracts structured facts" in prompt:
+            return json.dumps({**facts, "user_input": user_input})
+        return self._plan(task)
+
+    async def stream_text(self, prompt: str, **kwargs):
+        yield await self.generate_text(prompt, **kwargs)
+
+
+def correct(task, plan: str) -> bool:
+    tool = task[3]
+    if tool is None:
+        return plan.startswith("FINAL_ANSWER:")
+    if not plan.startswith("FUNCTION_CALL:"):
+        return False
+    try:
+        return json.loads(plan[len("FUNCTION_CALL:"):])["name"] == tool
+    except (ValueError, KeyError):
+        return False
+
+
+async def separate_step(query: str) -> str:
+    facts = await perception.extract_perception(query)
+    tools = filter_tools_by_hint(TOOLS, hint=facts.tool_hint)
+    return await decision.generate_plan(perception=facts, memory_items=[], tool_descriptions=summarize_tools(tools))
+
+
+async def fused_step(query: str):
+    fused = await decision.generate_fused_plan(user_input=query, memory_items=[], tool_descriptions=summarize_tools(TOOLS))
+    if fused is None:
+        return await separate_step(query), True
+    return fused[1], False
+
+
+async def run(mode: str, rounds: int, llm) -> dict:
+    latencies, hits, fallbacks = [], 0, 0
+    calls_before = getattr(llm, "calls", 0)
+    for _ in range(rounds):
+        for task in TASKS:
+            start = time.perf_counter()
+            if mode == "separate":
+                plan, fell_back = await separate_step(task[0]), False
+            else:
+                plan, fell_back = await fused_step(task[0])
+            latencies.append(time.perf_counter() - start)
+            hits += correct(task, plan)
+            fallbacks += fell_back
+    steps = rounds * len(TASKS)
+    ordered = sorted(latencies)
+    return {
+        "mode": mode,
+        "steps": steps,
+        "p50": statistics.median(latencies),
+        "p95": ordered[min(steps - 1, int(round(0.95 * (steps - 1))))],
+        "accuracy": hits / steps,
+        "fallbacks": fallbacks,
+        "calls": (getattr(llm, "calls", 0) - calls_before) / steps if hasattr(llm, "calls") else float("nan"),
+    }
+
+
+async def main(args):
+    if args.live:
+        llm = decision.get_model()
+    else:
+        llm = MockLLM(args.llm_latency, args.prefill_ms, args.fused_error_rate)
+        perception.model = decision.model = llm
+        # the module-level tool context was rendered from the real tool list at import
+        perception.tool_context = summarize_tools(TOOLS)
+
+    print(f"{len(TASKS)} tasks x {args.rounds} rounds, {'live model' if args.live else f'mock LLM {args.llm_latency}s/call'}")
+    print()
+    print(f"{'mode':>9} {'p50 s':>7} {'p95 s':>7} {'accuracy':>9} {'calls/step':>11} {'fallbacks':>10}")
+    for mode in ("separate", "fused"):
+        r = await run(mode, args.rounds, llm)
+        print(f"{r['mode']:>9} {r['p50']:>7.3f} {r['p95']:>7.3f} {r['accuracy']:>9.2f} {r['calls']:>11.2f} {r['fallbacks']:>10}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Separate vs fused perception+planning")
+    parser.add_argument("--rounds", type=int, default=3)
+    parser.add_argument("--llm-latency", type=float, default=0.8, help="mock seconds per LLM call")
+    parser.add_argument("--prefill-ms", type=float, default=20.0, help="mock milliseconds per 1000 prompt chars")
+    parser.add_argument("--fused-error-rate", type=float, default=0.1, help="share of mock fused replies without a plan line")
+    parser.add_argument("--live", action="store_true", help="use the configured model instead of the mock")
+    asyncio.run(main(parser.parse_args()))
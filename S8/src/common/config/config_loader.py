@@ -0,0 +1,53 @@
+import json
+import threading
+from pathlib import Path
+from typing import Any, Dict, Tuple, Union
+import sys
+ROOT = Path(__file__).resolve().parents[3]  # This gets /Users/ravi/EAG-TheShadowCloneAI/S8
+
+if str(ROOT) not in sys.path:
+    sys.path.append(str(ROOT))
+
+import yaml
+
+CONFIG_DIR = ROOT / "src" / "common" / "config"
+MODELS_JSON = CONFIG_DIR / "models.json"
+PROFILE_YAML = CONFIG_DIR / "profiles.yaml"
+
+# path -> ((mtime_ns, size), parsed content)
+_configs: Dict[Path, Tuple[Tuple[int, int], Any]] = {}
+_configs_lock = threading.Lock()
+
+
+def file_stamp(path: Union[str, Path]) -> Tuple[int, int]:
+    """(mtime_ns, size) of a config file; changes whenever the file is rewritten"""
+    stat = Path(path).stat()
+    return stat.st_mtime_ns, stat.st_size
+
+
+def load_config(path: Union[str, Path] = PROFILE_YAML) -> Any:
+    """
+    Parsed YAML/JSON config file, cached per process. The file is only
+    re-parsed when its (mtime, size) changes, so callers can ask for it on
+    every request. Treat the result as read-only: it is shared.
+    """
+    path = Path(path).resolve()
+    stamp = file_stamp(path)
+    with _configs_lock:
+        cached = _configs.get(path)
+        if cached is not None and cached[0] == stamp:
+            return cached[1]
+
+    text = path.read_text()
+    config = json.loads(text) if path.suffix == ".json" else yaml.safe_load(text)
+    with _configs_lock:
+        _configs[path] = (stamp, config)
+    return config
+
+
+def get_profile() -> Dict[str, Any]:
+    return load_config(PROFILE_YAML)
+
+
+def get_models_config() -> Dict[str, Any]:
+    return load_config(MODELS_JSON)
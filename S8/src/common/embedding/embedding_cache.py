@@ -0,0 +1,156 @@
+import hashlib
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional
+import numpy as np
+from pathlib import Path
+import sys
+ROOT = Path(__file__).resolve().parents[3]  # This gets /Users/ravi/EAG-TheShadowCloneAI/S8
+
+if str(ROOT) not in sys.path:
+    sys.path.append(str(ROOT))
+
+from src.common.logger.logger import get_logger
+
+logger = get_logger()
+
+DEFAULT_CACHE_DB = ROOT / "resources" / "embedding_cache" / "embeddings.sqlite"
+
+
+def normalize_text(text: str) -> str:
+    """Collapse whitespace so re-extracted text with different spacing maps to the same key"""
+    return " ".join(text.split())
+
+
+def cache_key(model_name: str, text: str) -> str:
+    """Content address of an embedding: (model name, normalized text hash)"""
+    return hashlib.sha256(f"{model_name}\0{normalize_text(text)}".encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """
+    Two-tier embedding cache keyed by (model, normalized text hash).
+
+    - In-memory LRU of at most max_entries vectors
+    - Optional sqlite tier that survives restarts (db_path=None disables it)
+
+    Hit/miss counters are available through stats().
+    """
+    def __init__(self, max_entries: int = 10000, db_path: Optional[Path] = DEFAULT_CACHE_DB):
+        self.max_entries = max_entries
+        self.db_path = Path(db_path) if db_path else None
+        self._memory: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+        if self.db_path is not None:
+            try:
+                self.db_path.parent.mkdir(parents=True, exist_ok=True)
+                self._conn = sqlite3.connect(str(self.db_path), check_same_thread=False)
+                self._conn.execute("PRAGMA journal_mode=WAL")
+                self._conn.execute(
+                    "CREATE TABLE IF NOT EXISTS embeddings ("
+                    "key TEXT PRIMARY KEY, model TEXT NOT NULL, dim INTEGER NOT NULL, "
+                    "vector BLOB NOT NULL, created_at REAL NOT NULL)"
+                )
+                self._conn.commit()
+            except sqlite3.Error as e:
+                logger.warning(f"Embedding cache persistence disabled ({self.db_path}): {e}")
+                self._conn = None
+
+    def _remember(self, key: str, vector: np.ndarray):
+        self._memory[key] = vector
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def get_many(self, model_name: str, texts: List[str]) -> List[Optional[np.ndarray]]:
+        """Look up each text; returns a vector or None per position"""
+        keys = [cache_key(model_name, text) for text in texts]
+        results: List[Optional[np.ndarray]] = [None] * len(texts)
+        with self._lock:
+            pending: Dict[str, List[int]] = {}
+            for i, key in enumerate(keys):
+                vector = self._memory.get(key)
+                if vector is not None:
+                    self._memory.move_to_end(key)
+                    results[i] = vector
+                    self.memory_hits += 1
+                else:
+                    pending.setdefault(key, []).append(i)
+
+            if pending and self._conn is not None:
+                found = {}
+                pending_keys = list(pending)
+                for start in range(0, len(pending_keys), 500):  # stay under sqlite's variable limit
+                    batch = pending_keys[start:start + 500]
+                    rows = self._conn.execute(
+                        f"SELECT key, vector FROM embeddings WHERE key IN ({','.join('?' * len(batch))})",
+                        batch
+                    ).fetchall()
+                    found.update(rows)
+                for key, blob in found.items():
+                    vector = np.frombuffer(blob, dtype=np.float32)
+                    self._remember(key, vector)
+                    for i in pending.pop(key):
+                        results[i] = vector
+                        self.disk_hits += 1
+
+            self.misses += sum(len(positions) for positions in pending.values())
+        return results
+
+    def get(self, model_name: str, text: str) -> Optional[np.ndarray]:
+        return self.get_many(model_name, [text])[0]
+
+    def put_many(self, model_name: str, texts: List[str], vectors: np.ndarray):
+        rows = []
+        with self._lock:
+            for text, vector in zip(texts, vectors):
+                vector = np.ascontiguousarray(vector, dtype=np.float32)
+                key = cache_key(model_name, text)
+                self._remember(key, vector)
+                rows.append((key, model_name, int(vector.shape[0]), vector.tobytes(), time.time()))
+            if rows and self._conn is not None:
+                try:
+                    self._conn.executemany("INSERT OR REPLACE INTO embeddings VALUES (?, ?, ?, ?, ?)", rows)
+                    self._conn.commit()
+                except sqlite3.Error as e:
+                    logger.warning(f"Failed to persist {len(rows)} embeddings: {e}")
+
+    def stats(self) -> dict:
+        with self._lock:
+            hits = self.memory_hits + self.disk_hits
+            lookups = hits + self.misses
+            return {
+                "hits": hits,
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": hits / lookups if lookups else 0.0,
+                "memory_entries": len(self._memory),
+            }
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+            if self._conn is not None:
+                self._conn.execute("DELETE FROM embeddings")
+                self._conn.commit()
+
+
+_default_cache: Optional[EmbeddingCache] = None
+_default_cache_lock = threading.Lock()
+
+
+def get_embedding_cache() -> EmbeddingCache:
+    """Process-wide cache shared by every EmbeddingClient"""
+    global _default_cache
+    with _default_cache_lock:
+        if _default_cache is None:
+            _default_cache = EmbeddingCache()
+        return _default_cache
@@ -0,0 +1,234 @@
+import asyncio
+import threading
+import time
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+import httpx
+import numpy as np
+import requests
+from requests.adapters import HTTPAdapter
+from pathlib import Path
+import sys
+ROOT = Path(__file__).resolve().parents[3]  # This gets /Users/ravi/EAG-TheShadowCloneAI/S8
+
+if str(ROOT) not in sys.path:
+    sys.path.append(str(ROOT))
+
+from src.common.embedding.embedding_cache import EmbeddingCache, get_embedding_cache, normalize_text
+from src.common.vector_index.index_factory import normalize
+from src.common.logger.logger import get_logger
+
+logger = get_logger()
+
+DEFAULT_EMBED_URL = "http://localhost:11434/api/embeddings"
+DEFAULT_EMBED_MODEL = "nomic-embed-text"
+
+
+class EmbeddingClient:
+    """
+    Embedding client for Ollama shared by RAG ingestion, search and agent memory.
+
+    - Keep-alive connection pool (requests.Session for sync callers,
+      one pooled httpx.AsyncClient per event loop for async callers)
+    - Batched requests through /api/embed, which accepts a list of inputs;
+      falls back to one /api/embeddings call per text on older Ollama builds
+    - Bounded concurrency across batches and retry with exponential backoff
+    - Optional EmbeddingCache: only texts missing from the cache hit the network
+
+    Note: /api/embed returns unit-length vectors, /api/embeddings does not, so every
+    vector is L2-normalized before it is cached or returned; L2 and inner-product
+    indexes then rank the same way whichever endpoint produced the vectors.
+    """
+    def __init__(self,
+                 embed_url: str = DEFAULT_EMBED_URL,
+                 model_name: str = DEFAULT_EMBED_MODEL,
+                 batch_size: int = 32,
+                 max_concurrency: int = 4,
+                 max_retries: int = 3,
+                 backoff: float = 0.5,
+                 timeout: float = 60.0,
+                 cache: Optional[EmbeddingCache] = None):
+        base_url = embed_url.rstrip("/")
+        for suffix in ("/api/embeddings", "/api/embed"):
+            if base_url.endswith(suffix):
+                base_url = base_url[:-len(suffix)]
+                break
+        self.base_url = base_url
+        self.batch_url = f"{base_url}/api/embed"
+        self.single_url = f"{base_url}/api/embeddings"
+        self.model_name = model_name
+        self.batch_size = max(1, batch_size)
+        self.max_concurrency = max(1, max_concurrency)
+        self.max_retries = max(0, max_retries)
+        self.backoff = backoff
+        self.timeout = timeout
+        self.supports_batch: Optional[bool] = None  # discovered on first request
+        self.cache = cache
+
+        self._session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.max_concurrency)
+        self._session.mount("http://", adapter)
+        self._session.mount("https://", adapter)
+        self._async_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, httpx.AsyncClient]" = weakref.WeakKeyDictionary()
+
+    # ---------- helpers ----------
+    def _batches(self, texts: List[str]) -> List[List[str]]:
+        return [texts[i:i + self.batch_size] for i in range(0, len(texts), self.batch_size)]
+
+    def _backoff_delay(self, attempt: int) -> float:
+        return self.backoff * (2 ** attempt)
+
+    @staticmethod
+    def _to_array(vectors: List[List[float]]) -> np.ndarray:
+        return normalize(vectors)
+
+    def _lookup(self, texts: List[str]) -> Tuple[list, List[str]]:
+        """Cached vectors per position, plus the distinct texts that still need embedding"""
+        cached = self.cache.get_many(self.model_name, texts) if self.cache else [None] * len(texts)
+        missing = {}
+        for text, vector in zip(texts, cached):
+            if vector is None:
+                missing.setdefault(normalize_text(text), text)
+        return cached, list(missing.values())
+
+    def _merge(self, texts: List[str], cached: list, missing: List[str], fetched: np.ndarray) -> np.ndarray:
+        if missing:
+            if self.cache:
+                self.cache.put_many(self.model_name, missing, fetched)
+            by_text = {normalize_text(text): vector for text, vector in zip(missing, fetched)}
+            cached = [vector if vector is not None else by_text[normalize_text(text)] for text, vector in zip(texts, cached)]
+        # Cache entries written before normalization are renormalized on the way out
+        return normalize(np.stack(cached))
+
+    def _async_client(self) -> httpx.AsyncClient:
+        loop = asyncio.get_running_loop()
+        client = self._async_clients.get(loop)
+        if client is None or client.is_closed:
+            client = httpx.AsyncClient(
+                timeout=self.timeout,
+                limits=httpx.Limits(max_connections=self.max_concurrency, max_keepalive_connections=self.max_concurrency)
+            )
+            self._async_clients[loop] = client
+        return client
+
+    # ---------- sync API ----------
+    def _post_batch(self, batch: List[str]) -> List[List[float]]:
+        for attempt in range(self.max_retries + 1):
+            try:
+                if self.supports_batch is not False:
+                    response = self._session.post(
+                        self.batch_url,
+                        json={"model": self.model_name, "input": batch},
+                        timeout=self.timeout
+                    )
+                    if response.status_code == 404 and self.supports_batch is None:
+                        logger.warning("Ollama /api/embed not available, falling back to /api/embeddings")
+                        self.supports_batch = False
+                    else:
+                        response.raise_for_status()
+                        self.supports_batch = True
+                        return response.json()["embeddings"]
+
+                vectors = []
+                for text in batch:
+                    response = self._session.post(
+                        self.single_url,
+                        json={"model": self.model_name, "prompt": text},
+                        timeout=self.timeout
+                    )
+                    response.raise_for_status()
+                    vectors.append(response.json()["embedding"])
+                return vectors
+            except (requests.RequestException, KeyError, ValueError) as e:
+                if attempt == self.max_retries:
+                    raise
+                delay = self._backoff_delay(attempt)
+                logger.warning(f"Embedding request failed ({e}), retry {attempt + 1}/{self.max_retries} in {delay:.1f}s")
+                time.sleep(delay)
+
+    def _fetch(self, texts: List[str]) -> np.ndarray:
+        batches = self._batches(texts)
+        if len(batches) == 1:
+            return self._to_array(self._post_batch(batches[0]))
+        with ThreadPoolExecutor(max_workers=min(self.max_concurrency, len(batches))) as pool:
+            results = list(pool.map(self._post_batch, batches))
+        return self._to_array([vector for batch in results for vector in batch])
+
+    def embed_batch(self, texts: List[str]) -> np.ndarray:
+        """Embed a list of texts; returns an array of shape (len(texts), dim)."""
+        if not texts:
+            return np.zeros((0, 0), dtype=np.float32)
+        texts = list(texts)
+        cached, missing = self._lookup(texts)
+        fetched = self._fetch(missing) if missing else None
+        return self._merge(texts, cached, missing, fetched)
+
+    def embed(self, text: str) -> np.ndarray:
+        """Embed a single text; returns a 1-D float32 vector."""
+        return self.embed_batch([text])[0]
+
+    # ---------- async API ----------
+    async def _apost_batch(self, client: httpx.AsyncClient, batch: List[str], semaphore: asyncio.Semaphore) -> List[List[float]]:
+        async with semaphore:
+            for attempt in range(self.max_retries + 1):
+                try:
+                    if self.supports_batch is not False:
+                        response = await client.post(self.batch_url, json={"model": self.model_name, "input": batch})
+                        if response.status_code == 404 and self.supports_batch is None:
+                            logger.warning("Ollama /api/embed not available, falling back to /api/embeddings")
+                            self.supports_batch = False
+                        else:
+                            response.raise_for_status()
+                            self.supports_batch = True
+                            return response.json()["embeddings"]
+
+                    vectors = []
+                    for text in batch:
+                        response = await client.post(self.single_url, json={"model": self.model_name, "prompt": text})
+                        response.raise_for_status()
+                        vectors.append(response.json()["embedding"])
+                    return vectors
+                except (httpx.HTTPError, KeyError, ValueError) as e:
+                    if attempt == self.max_retries:
+                        raise
+                    delay = self._backoff_delay(attempt)
+                    logger.warning(f"Embedding request failed ({e}), retry {attempt + 1}/{self.max_retries} in {delay:.1f}s")
+                    await asyncio.sleep(delay)
+
+    async def _afetch(self, texts: List[str]) -> np.ndarray:
+        client = self._async_client()
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        results = await asyncio.gather(*(
+            self._apost_batch(client, batch, semaphore) for batch in self._batches(texts)
+        ))
+        return self._to_array([vector for batch in results for vector in batch])
+
+    async def aembed_batch(self, texts: List[str]) -> np.ndarray:
+        """Async variant of embed_batch; at most max_concurrency batches are in flight."""
+        if not texts:
+            return np.zeros((0, 0), dtype=np.float32)
+        texts = list(texts)
+        cached, missing = self._lookup(texts)
+        fetched = await self._afetch(missing) if missing else None
+        return self._merge(texts, cached, missing, fetched)
+
+    async def aembed(self, text: str) -> np.ndarray:
+        return (await self.aembed_batch([text]))[0]
+
+
+_clients: Dict[Tuple[str, str], EmbeddingClient] = {}
+_clients_lock = threading.Lock()
+
+
+def get_embedding_client(embed_url: str = DEFAULT_EMBED_URL, model_name: str = DEFAULT_EMBED_MODEL, **kwargs) -> EmbeddingClient:
+    """Return the process-wide client for (url, model), creating it on first use.
+    Clients share the process-wide EmbeddingCache unless cache=... is passed."""
+    key = (embed_url, model_name)
+    with _clients_lock:
+        client = _clients.get(key)
+        if client is None:
+            kwargs.setdefault("cache", get_embedding_cache())
+            client = EmbeddingClient(embed_url=embed_url, model_name=model_name, **kwargs)
+            _clients[key] = client
+        return client
@@ -1,50 +1,138 @@
+import atexit
+import copy
+import glob
 import json
 import logging
+import multiprocessing
 import os
+import queue
+import re
+import sys
 from datetime import datetime
-
-class JSONFileHandler(logging.Handler):
-    def __init__(self, filename="logs.json"):
-        super().__init__()
-        self.filename = filename
-        self.logs = []
-
-        #create the file with empty array if not exist
-        if not os.path.exists(filename):
-            with open(filename, 'w') as f:
-                json.dump([], f)
-        else:
-            # Load Existing logs
-            try:
-                with open(filename, 'r') as f:
-                    self.logs = json.load(f)
-            except json.JSONDecodeError:
-                # if the file is corrupted start fresh
-                self.logs = []
-
-    def emit(self, record):
+from pathlib import Path
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler, TimedRotatingFileHandler
+
+# JSON-lines log file (one JSON object per line), relative to the working directory.
+# Each process writes its own logs.<role>.<pid>.jsonl next to it, see process_log_file()
+LOG_FILE = os.getenv("LOG_FILE", "logs.jsonl")
+# Role in the per-process file name; defaults to the script name (or worker process name)
+LOG_ROLE = os.getenv("LOG_ROLE") or None
+# Size-based rotation: start a new file past this many bytes (0 disables it)
+LOG_MAX_BYTES = int(os.getenv("LOG_MAX_BYTES", 10 * 1024 * 1024))
+# Time-based rotation instead of size, e.g. "midnight" or "H" (see TimedRotatingFileHandler)
+LOG_ROTATE_WHEN = os.getenv("LOG_ROTATE_WHEN") or None
+# Rotated files kept next to LOG_FILE (logs.jsonl.1, ... or logs.jsonl.<date>)
+LOG_BACKUP_COUNT = int(os.getenv("LOG_BACKUP_COUNT", 5))
+
+
+class JSONFormatter(logging.Formatter):
+    """Formats a record as one line of JSON (timestamp, level, message, module, function, line, exception)"""
+    def format(self, record):
         logs_entry = {
-            "timestamp": datetime.now().isoformat(),
+            "timestamp": datetime.fromtimestamp(record.created).isoformat(),
             "level": record.levelname,
-            "message": self.format(record),
+            "message": super().format(record),
             "module": record.module,
             "function": record.funcName,
             "line": record.lineno
         }
 
         #Add exception info if present
+        exception = getattr(record, "exception", None)
+        if exception is None and record.exc_info:
+            exception = exception_entry(record.exc_info, self)
+        if exception:
+            logs_entry["exception"] = exception
+
+        return json.dumps(logs_entry, ensure_ascii=False, default=str)
+
+
+def exception_entry(exc_info, formatter: logging.Formatter) -> dict:
+    return {
+        "type": str(exc_info[0].__name__),
+        "message": str(exc_info[1]),
+        "traceback": formatter.formatException(exc_info)
+    }
+
+
+class JSONQueueHandler(QueueHandler):
+    """
+    Hands records to the background writer without touching the disk.
+    QueueHandler.prepare() flattens exc_info into the message, so the
+    structured exception entry is captured here first.
+    """
+    def prepare(self, record):
         if record.exc_info:
-            logs_entry["exception"] = {
-                "type": str(record.exc_info[0].__name__),
-                "message": str(record.exc_info[1]),
-                "traceback": self.formatter.formatException(record.exc_info)
-            }
-        
-        self.logs.append(logs_entry)
-
-        #write to file
-        with open(self.filename, 'w') as f:
-            json.dump(self.logs, f, indent=2)
+            record = copy.copy(record)
+            record.exception = exception_entry(record.exc_info, self.formatter or logging.Formatter())
+        return super().prepare(record)
+
+
+def process_role() -> str:
+    """LOG_ROLE, else the multiprocessing worker name, else the running script's name (agent, rag_server, uvicorn, ...)"""
+    if LOG_ROLE:
+        role = LOG_ROLE
+    elif multiprocessing.current_process().name != "MainProcess":
+        role = multiprocessing.current_process().name
+    else:
+        role = Path(sys.argv[0]).stem if sys.argv and sys.argv[0] else ""
+    return re.sub(r"\W+", "_", role).strip("_") or "python"
+
+
+def process_log_file(filename: str = LOG_FILE) -> str:
+    """
+    This process's own log file: logs.jsonl → logs.<role>.<pid>.jsonl.
+    The agent, MCP servers, web API and PDF workers all log at once; rotating
+    one shared file from several processes renames it under the others and
+    drops their records, so every process writes (and rotates) its own file.
+    """
+    root, ext = os.path.splitext(filename)
+    return f"{root}.{process_role()}.{os.getpid()}{ext}"
+
+
+def json_file_handler(filename: str = LOG_FILE, max_bytes: int = LOG_MAX_BYTES, when: str = LOG_ROTATE_WHEN, backup_count: int = LOG_BACKUP_COUNT) -> logging.Handler:
+    """Append-only JSON-lines file handler with size- or time-based rotation"""
+    if when:
+        handler = TimedRotatingFileHandler(filename, when=when, backupCount=backup_count, encoding="utf-8", delay=True)
+    else:
+        handler = RotatingFileHandler(filename, maxBytes=max_bytes, backupCount=backup_count, encoding="utf-8", delay=True)
+    handler.setFormatter(JSONFormatter('%(message)s'))
+    return handler
+
+
+def read_logs(filename: str = LOG_FILE, include_rotated: bool = True) -> list:
+    """
+    JSON-array view of the log (oldest first), merged across the per-process
+    files (logs.<role>.<pid>.jsonl), their rotated files and a legacy shared logs.jsonl.
+    Lines that are not valid JSON (e.g. a partially written last line) are skipped.
+    """
+    root, ext = os.path.splitext(filename)
+    patterns = [f"{glob.escape(root)}.*{glob.escape(ext)}", glob.escape(filename)]
+    if include_rotated:
+        patterns += [f"{pattern}.*" for pattern in patterns]
+    files = sorted({path for pattern in patterns for path in glob.glob(pattern)})
+
+    logs = []
+    for path in files:
+        with open(path, 'r', encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    logs.append(json.loads(line))
+                except json.JSONDecodeError:
+                    continue
+    # Records from different processes interleave; ISO timestamps sort chronologically
+    logs.sort(key=lambda entry: entry.get("timestamp", "") if isinstance(entry, dict) else "")
+    return logs
+
+
+def export_logs(out_file: str = "logs.json", filename: str = LOG_FILE):
+    """Write the JSON-array view of the log to out_file (the old logs.json format)"""
+    with open(out_file, 'w', encoding="utf-8") as f:
+        json.dump(read_logs(filename), f, indent=2, ensure_ascii=False)
+
 
 class Logger:
     _instance = None
@@ -54,30 +142,43 @@ class Logger:
             cls._instance = super(Logger, cls).__new__(cls)
             cls._instance._initialize()
         return cls._instance
-    
+
     def _initialize(self):
         self.logger = logging.getLogger("shadow_clone_agent")
         self.logger.setLevel(logging.DEBUG)
+        self.listener = None
 
         # prevent duplicate handlers
         if self.logger.handlers:
             return
-        
+
         #Console handler
         console_handler = logging.StreamHandler()
         console_handler.setLevel(logging.INFO)
         console_formatter = logging.Formatter('%(asctime)s [%(levelname)s] %(module)s:%(funcName)s - %(message)s')
         console_handler.setFormatter(console_formatter)
 
-        #JSON file handler
-        json_handler = JSONFileHandler()
+        #JSON-lines file handler (one file per process), written by a background thread so logging never waits on disk
+        json_handler = json_file_handler(process_log_file())
         json_handler.setLevel(logging.DEBUG)
-        json_formatter = logging.Formatter('%(message)s')
-        json_handler.setFormatter(json_formatter)
+        log_queue = queue.SimpleQueue()
+        queue_handler = JSONQueueHandler(log_queue)
+        queue_handler.setLevel(logging.DEBUG)
+        self.listener = QueueListener(log_queue, json_handler, respect_handler_level=True)
+        self.listener.start()
+        atexit.register(self.close)
 
         #Add handlers
         self.logger.addHandler(console_handler)
-        self.logger.addHandler(json_handler)
+        self.logger.addHandler(queue_handler)
+
+    def close(self):
+        """Drain queued records to the file and stop the writer thread"""
+        if self.listener is not None:
+            listener, self.listener = self.listener, None
+            listener.stop()
+            for handler in listener.handlers:
+                handler.close()
 
     def debug(self, message:str):
         self.logger.debug(message)
@@ -99,4 +200,10 @@ class Logger:
 logger = Logger()
 
 def get_logger():
-    return logger
\ No newline at end of file
+    return logger
+
+
+if __name__ == "__main__":
+    # python src/common/logger/logger.py [out.json] → JSON-array export of every process's logs (+ rotated files)
+    import sys
+    export_logs(*sys.argv[1:2])
@@ -0,0 +1,240 @@
+import math
+import time
+from dataclasses import dataclass
+from typing import List, Optional, Tuple
+import faiss
+import numpy as np
+from pathlib import Path
+import sys
+ROOT = Path(__file__).resolve().parents[3]  # This gets /Users/ravi/EAG-TheShadowCloneAI/S8
+
+if str(ROOT) not in sys.path:
+    sys.path.append(str(ROOT))
+
+from src.common.logger.logger import get_logger
+
+logger = get_logger()
+
+INDEX_TYPES = ("flat", "ivf_flat", "hnsw", "ivf_pq")
+TRAINED_TYPES = ("ivf_flat", "ivf_pq")
+MIN_POINTS_PER_CENTROID = 39  # below this faiss k-means warns and clusters poorly
+
+
+@dataclass
+class IndexSpec:
+    """
+    Which FAISS index to build and how to search it.
+
+    index_type "auto" stays on an exact flat index until the corpus reaches
+    train_threshold vectors, then switches to auto_type. Explicit IVF types
+    also stay flat until train_threshold, because they need training data.
+    nlist=0 / pq_m=0 pick values from the corpus size / dimension.
+    """
+    index_type: str = "auto"
+    auto_type: str = "ivf_flat"
+    train_threshold: int = 20000
+    metric: int = faiss.METRIC_L2
+    nlist: int = 0
+    nprobe: int = 16
+    hnsw_m: int = 32
+    ef_construction: int = 200
+    ef_search: int = 64
+    pq_m: int = 0
+    pq_nbits: int = 8
+
+    def __post_init__(self):
+        for name in (self.index_type, self.auto_type):
+            if name != "auto" and name not in INDEX_TYPES:
+                raise ValueError(f"Unknown index type '{name}', expected one of {INDEX_TYPES} or 'auto'")
+
+    def target_type(self, ntotal: int) -> str:
+        """Index type this spec wants for a corpus of ntotal vectors"""
+        wanted = self.auto_type if self.index_type == "auto" else self.index_type
+        if self.index_type == "auto" and ntotal < self.train_threshold:
+            return "flat"
+        if wanted in TRAINED_TYPES and ntotal < max(self.train_threshold, self.min_training_points(wanted)):
+            return "flat"
+        return wanted
+
+    def min_training_points(self, index_type: str) -> int:
+        if index_type == "ivf_pq":
+            # every PQ sub-quantizer runs its own k-means with 2**pq_nbits centroids
+            return MIN_POINTS_PER_CENTROID * (2 ** self.pq_nbits)
+        return MIN_POINTS_PER_CENTROID if index_type in TRAINED_TYPES else 0
+
+    def nlist_for(self, ntotal: int) -> int:
+        if self.nlist:
+            return self.nlist
+        suggested = int(4 * math.sqrt(max(ntotal, 1)))
+        return max(1, min(suggested, ntotal // MIN_POINTS_PER_CENTROID))
+
+    def pq_m_for(self, dim: int) -> int:
+        if self.pq_m:
+            return self.pq_m
+        # Largest sub-quantizer count <= dim / 8 that divides dim (96 for 768-d)
+        return next(m for m in range(max(1, dim // 8), 0, -1) if dim % m == 0)
+
+
+def index_type_of(index) -> str:
+    index = faiss.downcast_index(index)
+    if isinstance(index, faiss.IndexIDMap):
+        index = faiss.downcast_index(index.index)
+    if isinstance(index, faiss.IndexHNSW):
+        return "hnsw"
+    if isinstance(index, faiss.IndexIVFPQ):
+        return "ivf_pq"
+    if isinstance(index, faiss.IndexIVF):
+        return "ivf_flat"
+    return "flat"
+
+
+def create_index(dim: int, spec: IndexSpec, index_type: str, ntotal: int = 0):
+    """Empty index of the given type (IVF types still need train())"""
+    if index_type == "flat":
+        return faiss.IndexFlat(dim, spec.metric)
+    if index_type == "hnsw":
+        index = faiss.IndexHNSWFlat(dim, spec.hnsw_m, spec.metric)
+        index.hnsw.efConstruction = spec.ef_construction
+        return index
+    quantizer = faiss.IndexFlat(dim, spec.metric)
+    nlist = spec.nlist_for(ntotal)
+    if index_type == "ivf_flat":
+        return faiss.IndexIVFFlat(quantizer, dim, nlist, spec.metric)
+    if index_type == "ivf_pq":
+        return faiss.IndexIVFPQ(quantizer, dim, nlist, spec.pq_m_for(dim), spec.pq_nbits, spec.metric)
+    raise ValueError(f"Unknown index type '{index_type}'")
+
+
+def configure_search(index, spec: Optional[IndexSpec] = None, nprobe: Optional[int] = None, ef_search: Optional[int] = None):
+    """Apply nprobe (IVF) / efSearch (HNSW); explicit arguments override the spec"""
+    if index is None:
+        return index
+    spec = spec or IndexSpec()
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None:
+        ivf.nprobe = min(nprobe or spec.nprobe, ivf.nlist)
+    inner = faiss.downcast_index(index)
+    if isinstance(inner, faiss.IndexIDMap):
+        inner = faiss.downcast_index(inner.index)
+    if isinstance(inner, faiss.IndexHNSW):
+        inner.hnsw.efSearch = ef_search or spec.ef_search
+    return index
+
+
+def search_params(index, nprobe: Optional[int] = None, ef_search: Optional[int] = None, sel=None):
+    """
+    Per-query SearchParameters, so callers can tune one search without mutating a shared index.
+    sel (a faiss IDSelector) restricts the search to the selected ids; knobs not given keep
+    the index's configured values.
+    """
+    if index is None or (nprobe is None and ef_search is None and sel is None):
+        return None
+    inner = faiss.downcast_index(index)
+    if isinstance(inner, faiss.IndexIDMap):
+        inner = faiss.downcast_index(inner.index)
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None and (nprobe is not None or sel is not None):
+        return faiss.SearchParametersIVF(nprobe=nprobe or ivf.nprobe, sel=sel)
+    if isinstance(inner, faiss.IndexHNSW) and (ef_search is not None or sel is not None):
+        return faiss.SearchParametersHNSW(efSearch=ef_search or inner.hnsw.efSearch, sel=sel)
+    if sel is not None:
+        return faiss.SearchParameters(sel=sel)
+    return None
+
+
+def build_index(vectors: np.ndarray, spec: IndexSpec, index_type: Optional[str] = None, ids: Optional[np.ndarray] = None):
+    """
+    Build (train if needed) and fill an index of spec.target_type(len(vectors)).
+    With ids the vectors are added under those ids: IVF lists store ids natively,
+    other types are wrapped in an IndexIDMap2. Both support remove_ids (except HNSW).
+    """
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    ntotal, dim = vectors.shape
+    index_type = index_type or spec.target_type(ntotal)
+    start = time.perf_counter()
+    index = create_index(dim, spec, index_type, ntotal)
+    if index_type in TRAINED_TYPES:
+        # k-means does not need every point; ~256 per centroid is plenty
+        centroids = max(index.nlist, 2 ** spec.pq_nbits if index_type == "ivf_pq" else 0)
+        sample_size = min(ntotal, centroids * 256)
+        sample = vectors if sample_size == ntotal else vectors[np.random.default_rng(0).choice(ntotal, sample_size, replace=False)]
+        index.train(sample)
+    if ids is not None:
+        if index_type not in TRAINED_TYPES:
+            # IndexIDMap2 over IVF would break on remove_ids: IVF does not compact positions
+            index = faiss.IndexIDMap2(index)
+        if ntotal:
+            index.add_with_ids(vectors, np.ascontiguousarray(ids, dtype=np.int64))
+    elif ntotal:
+        index.add(vectors)
+    configure_search(index, spec)
+    logger.info(f"Built {index_type} index with {ntotal} vectors in {time.perf_counter() - start:.2f}s")
+    return index
+
+
+def needs_rebuild(index, spec: IndexSpec) -> bool:
+    """True when the metric or index type no longer matches the spec, or an auto-sized IVF has too few lists"""
+    if index.metric_type != spec.metric:
+        return True
+    current = index_type_of(index)
+    if current != spec.target_type(index.ntotal):
+        return True
+    if current in TRAINED_TYPES and not spec.nlist:
+        ivf = faiss.extract_index_ivf(index)
+        return spec.nlist_for(index.ntotal) >= 2 * ivf.nlist
+    return False
+
+
+def stored_vectors(index) -> np.ndarray:
+    """All vectors in insertion order, reconstructed from the index (lossy for PQ)"""
+    if index.ntotal == 0:
+        return np.zeros((0, index.d), dtype=np.float32)
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None:
+        ivf.make_direct_map()
+    return index.reconstruct_n(0, index.ntotal)
+
+
+def normalize(vectors) -> np.ndarray:
+    """Unit-length float32 copy, so inner product == cosine similarity"""
+    vectors = np.array(vectors, dtype=np.float32, ndmin=2, copy=True)
+    faiss.normalize_L2(vectors)
+    return vectors
+
+
+def to_similarity(index, distances: np.ndarray) -> np.ndarray:
+    """FAISS output -> cosine similarity for unit-length vectors (IP as is, squared L2 = 2 - 2cos)"""
+    if index.metric_type == faiss.METRIC_INNER_PRODUCT:
+        return distances
+    return 1.0 - distances / 2.0
+
+
+def similarity_search(index, query, k: int, min_score: Optional[float] = None, params=None) -> List[Tuple[int, float]]:
+    """
+    Top-k (id, cosine similarity) pairs for one query, best first.
+
+    Scores are absolute (not rescaled per query), so min_score means the same on
+    every query. When min_score > 0 it is pushed into FAISS as a range search and
+    nothing below it is ever fetched; index types without range search fall back
+    to a k-NN search filtered by score.
+    """
+    if index is None or index.ntotal == 0 or k <= 0:
+        return []
+    query = normalize(query)
+    if min_score is not None and min_score > 0:
+        radius = min_score if index.metric_type == faiss.METRIC_INNER_PRODUCT else 2.0 - 2.0 * min_score
+        try:
+            lims, distances, ids = index.range_search(query, radius, params=params)
+            scores = to_similarity(index, distances[lims[0]:lims[1]])
+            ids = ids[lims[0]:lims[1]]
+            order = np.argsort(-scores, kind="stable")[:k]
+            return [(int(ids[i]), float(scores[i])) for i in order]
+        except RuntimeError as e:
+            logger.debug(f"range_search not supported by {index_type_of(index)} index, using k-NN: {e}")
+
+    distances, ids = index.search(query, min(k, index.ntotal), params=params)
+    scores = to_similarity(index, distances[0])
+    return [
+        (int(i), float(score)) for i, score in zip(ids[0], scores)
+        if i >= 0 and (min_score is None or score >= min_score)
+    ]
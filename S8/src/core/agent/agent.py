@@ -1,8 +1,8 @@
 #/src/core/agent.py
 
 import asyncio
-import yaml
 from pathlib import Path
+from typing import Optional
 import sys
 ROOT = Path(__file__).resolve().parents[3]#Path(__file__).parent.parent.resolve()  # This gets /Users/ravi/EAG-TheShadowCloneAI/S8
 
@@ -11,22 +11,34 @@ if str(ROOT) not in sys.path:
 
 from src.core.agent.common.session import MultiMCP
 from src.core.agent.common.loop import AgentLoop
+from src.common.config.config_loader import get_profile
 from src.common.logger.logger import get_logger
 logger = get_logger()
 
-async def main(user_input: str, session_id: str):
-    print("🧠 Cortex-R Agent Ready")
-    # user_input = input("🧑 What do you want to solve today? → ")
-
+async def create_dispatcher() -> MultiMCP:
     #Load MCP server configs from profiles.yaml
-    with open("src/common/config/profiles.yaml", "r") as f:
-        profile = yaml.safe_load(f)
-        mcp_servers = profile.get("mcp_servers", [])
+    profile = get_profile()
+    mcp_servers = profile.get("mcp_servers", [])
+    session_config = profile.get("mcp_session", {})
 
-    multi_mcp = MultiMCP(server_config=mcp_servers)
+    multi_mcp = MultiMCP(
+        server_config=mcp_servers,
+        mode=session_config.get("mode", "stateless"),
+        pool_size=session_config.get("pool_size", 1),
+        health_check_interval=session_config.get("health_check_interval", 30)
+    )
     print("Agent before initialize")
     await multi_mcp.initialize()
     # print(multi_mcp.tool_map)
+    return multi_mcp
+
+
+async def main(user_input: str, session_id: str, dispatcher: Optional[MultiMCP] = None):
+    """Run one agent loop; a caller-owned dispatcher is reused and left open, otherwise one is built for this run"""
+    print("🧠 Cortex-R Agent Ready")
+    # user_input = input("🧑 What do you want to solve today? → ")
+
+    multi_mcp = dispatcher or await create_dispatcher()
 
     agent = AgentLoop(
         user_input=user_input,
@@ -40,6 +52,24 @@ async def main(user_input: str, session_id: str):
     except Exception as e:
         logger.error(f"fatal,Agent failed: {e}", exc_info=True)
         raise
+    finally:
+        if dispatcher is None:
+            await multi_mcp.shutdown()
+
+
+async def main_stream(user_input: str, session_id: str, dispatcher: Optional[MultiMCP] = None):
+    """Like main(), but yields AgentLoop.run_stream() events while the agent works"""
+    multi_mcp = dispatcher or await create_dispatcher()
+    agent = AgentLoop(user_input=user_input, dispatcher=multi_mcp)
+    try:
+        async for event in agent.run_stream():
+            yield event
+    except Exception as e:
+        logger.error(f"fatal,Agent failed: {e}", exc_info=True)
+        raise
+    finally:
+        if dispatcher is None:
+            await multi_mcp.shutdown()
 
 
 if __name__ == "__main__":
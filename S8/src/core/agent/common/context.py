@@ -33,15 +33,14 @@ logger = get_logger()
 
 from typing import List, Optional, Dict, Any
 from src.core.agent.common.memory_store.memory import MemoryManager, MemoryItem
+from src.common.config.config_loader import load_config
 from pathlib import Path
-import yaml
 import time
 import uuid
 
 class AgentProfile:
     def __init__(self, config_path: str = "src/common/config/profiles.yaml"):
-        with open(config_path, "r") as f:
-            config = yaml.safe_load(f)
+        config = load_config(config_path)  # cached, re-parsed only when the file changes
         print("config")
         print(config)
         
@@ -50,6 +49,9 @@ class AgentProfile:
         self.description = config["agent"]["description"]
         self.strategy = config["strategy"]["type"]
         self.max_steps = config["strategy"]["max_steps"]
+        self.planning = config["strategy"].get("planning", "separate")
+        self.max_parallel_calls = config["strategy"].get("max_parallel_calls", 3)
+        self.tool_timeout = config["strategy"].get("tool_timeout") or None
 
         self.memory_config = config["memory"]
         self.llm_config = config["llm"]
@@ -1,57 +1,141 @@
 import os
 import json
-import yaml
-import boto3
 import httpx
-import requests
 from pathlib import Path
-from google import genai
 from dotenv import load_dotenv
-from typing import Dict, Any, Optional
+from typing import Dict, Optional, AsyncIterator, Tuple
 import asyncio
+import threading
+import weakref
 
-load_dotenv()
-
-from pathlib import Path
 import sys
 ROOT = Path(__file__).resolve().parents[5]  # This gets /Users/ravi/EAG-TheShadowCloneAI/S8
-print(ROOT)
 if str(ROOT) not in sys.path:
     sys.path.append(str(ROOT))
 
 # Import required components for AI Layer integration
 from src.core.agent.common.schema.custom_llm_payload import CustomPayload
+from src.core.agent.common.llm.response_cache import DEFAULT_CACHE_DB, ResponseCache, get_response_cache, response_key
+from src.common.config.config_loader import MODELS_JSON, PROFILE_YAML, file_stamp, get_models_config, get_profile
 from src.common.logger.logger import get_logger
 
-MODELS_JSON = ROOT / "src" / "common" / "config" / "models.json"
-PROFILE_YAML = ROOT / "src" / "common" / "config" / "profiles.yaml"
-
 logger = get_logger()
 
+DEFAULT_TIMEOUT = 60.0       # seconds per LLM call (profiles.yaml llm.timeout, models.json "timeout")
+DEFAULT_MAX_CONCURRENCY = 4  # in-flight calls per provider (llm.max_concurrency, models.json "max_concurrency")
+HTTP_MAX_CONNECTIONS = 32
+
+# Process-wide, one per event loop (httpx clients and asyncio primitives are loop-bound)
+_http_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, httpx.AsyncClient]" = weakref.WeakKeyDictionary()
+_provider_limits: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[str, asyncio.Semaphore]]" = weakref.WeakKeyDictionary()
+
+
+def get_http_client() -> httpx.AsyncClient:
+    """Pooled keep-alive client shared by every HTTP-based LLM backend on the running loop"""
+    loop = asyncio.get_running_loop()
+    client = _http_clients.get(loop)
+    if client is None or client.is_closed:
+        client = httpx.AsyncClient(
+            timeout=DEFAULT_TIMEOUT,
+            limits=httpx.Limits(max_connections=HTTP_MAX_CONNECTIONS, max_keepalive_connections=HTTP_MAX_CONNECTIONS)
+        )
+        _http_clients[loop] = client
+    return client
+
+
+def provider_limit(provider: str, max_concurrency: int) -> asyncio.Semaphore:
+    """Semaphore bounding concurrent calls to one provider across all ModelManagers"""
+    limits = _provider_limits.setdefault(asyncio.get_running_loop(), {})
+    if provider not in limits:
+        limits[provider] = asyncio.Semaphore(max_concurrency)
+    return limits[provider]
+
+
+_env_loaded = False
+_models: Dict[Tuple[Tuple[int, int], Tuple[int, int]], "ModelManager"] = {}
+_models_lock = threading.Lock()
+
+
+def _load_env():
+    """Read .env once per process, on first use rather than at import"""
+    global _env_loaded
+    if not _env_loaded:
+        load_dotenv()
+        _env_loaded = True
+
+
+def get_model_manager() -> "ModelManager":
+    """
+    Process-wide ModelManager, created on first use. SDK clients are built
+    once per process; a new manager replaces it only after models.json or
+    profiles.yaml changes on disk.
+    """
+    stamp = (file_stamp(MODELS_JSON), file_stamp(PROFILE_YAML))
+    with _models_lock:
+        manager = _models.get(stamp)
+        if manager is None:
+            _models.clear()
+            manager = _models[stamp] = ModelManager()
+        return manager
+
+
 class ModelManager:
+    """
+    Text generation over the model configured in profiles.yaml (llm.text_generation).
+
+    Every backend is non-blocking for the event loop: Ollama and AI Layer go
+    through the pooled httpx.AsyncClient, Gemini uses the SDK's async client,
+    and the sync boto3 Bedrock client runs in a worker thread. Calls are bounded
+    per provider (max_concurrency) and each is cancelled after timeout seconds.
+
+    max_tokens and temperature reach every backend (Gemini GenerateContentConfig,
+    Ollama options, Bedrock and AI Layer request bodies), top_p all but Bedrock,
+    so the temperature=0.0 calls that opt in to caching are actually greedy.
+
+    Call sites can opt in to the process-wide ResponseCache (llm.response_cache
+    in profiles.yaml) with cache=True. Sampled calls (temperature > 0) bypass it
+    unless cache_sampled=True.
+    """
     def __init__(self):
-        self.config = json.loads(MODELS_JSON.read_text())
-        self.profile = yaml.safe_load(PROFILE_YAML.read_text())
+        _load_env()
+        self.config = get_models_config()
+        self.profile = get_profile()
 
-        self.text_model_key = self.profile["llm"]["text_generation"]
+        llm_profile = self.profile["llm"]
+        self.text_model_key = llm_profile["text_generation"]
         self.model_info = self.config["models"][self.text_model_key]
         self.model_type = self.model_info["type"]
+        self.timeout = float(self.model_info.get("timeout", llm_profile.get("timeout", DEFAULT_TIMEOUT)))
+        self.max_concurrency = int(self.model_info.get("max_concurrency", llm_profile.get("max_concurrency", DEFAULT_MAX_CONCURRENCY)))
+
+        cache_config = llm_profile.get("response_cache") or {}
+        self.cache: Optional[ResponseCache] = None
+        if cache_config.get("enabled", True):
+            self.cache = get_response_cache(
+                max_entries=int(cache_config.get("max_entries", 1000)),
+                db_path=DEFAULT_CACHE_DB if cache_config.get("persist", True) else None,
+                ttl=float(cache_config["ttl"]) if cache_config.get("ttl") else None
+            )
 
         # Initialize different clients based on model type
         if self.model_type == "gemini":
+            from google import genai
             api_key = os.getenv("GEMINI_API_KEY")
             self.client = genai.Client(api_key=api_key)
         
         elif self.model_type == "bedrock":
+            import boto3
+            from botocore.config import Config
             self.bedrock_client = boto3.client(
                 service_name='bedrock-runtime',
                 region_name=os.getenv(self.model_info["aws_region"]),
                 aws_access_key_id=os.getenv(self.model_info["aws_access_key"]),
-                aws_secret_access_key=os.getenv(self.model_info["aws_secret_key"])
+                aws_secret_access_key=os.getenv(self.model_info["aws_secret_key"]),
+                config=Config(read_timeout=self.timeout, max_pool_connections=self.max_concurrency)
             )
             logger.info("Initialized AWS Bedrock client")
         
-        # For AI-Layer, we'll initialize the client during request time
+        # Ollama and AI-Layer share the pooled HTTP client, see get_http_client()
         
     async def generate_text(self, 
                            prompt: str, 
@@ -59,7 +143,9 @@ class ModelManager:
                            temperature: float = 0.7, 
                            top_p: float = 0.95, 
                            domain: str = "general",
-                           system_prompt: str = "") -> str:
+                           system_prompt: str = "",
+                           cache: bool = False,
+                           cache_sampled: bool = False) -> str:
         """
         Generate text using the configured model.
         
@@ -77,17 +163,61 @@ class ModelManager:
             Domain/context for the response
         system_prompt : str, optional
             Additional system instructions for the model
+        cache : bool, optional
+            Serve/store the response through the response cache
+        cache_sampled : bool, optional
+            Allow caching even when temperature > 0
             
         Returns:
         --------
         str
             The generated text response
         """
+        key = self._cache_key(cache, cache_sampled, prompt, max_tokens, temperature, top_p, domain, system_prompt)
+        if key is not None:
+            # The cache may hit sqlite; keep that off the event loop
+            cached = await asyncio.to_thread(self.cache.get, key)
+            if cached is not None:
+                logger.debug(f"{self.text_model_key} response served from cache")
+                return cached
+        
+        async with provider_limit(self.model_type, self.max_concurrency):
+            try:
+                response = await asyncio.wait_for(
+                    self._dispatch(prompt, max_tokens, temperature, top_p, domain, system_prompt),
+                    timeout=self.timeout
+                )
+            except asyncio.TimeoutError:
+                logger.error(f"{self.text_model_key} generation timed out after {self.timeout}s")
+                raise TimeoutError(f"{self.text_model_key} generation timed out after {self.timeout}s")
+        
+        if key is not None and response:
+            await asyncio.to_thread(self.cache.put, key, self.text_model_key, response)
+        return response
+    
+    def _cache_key(self, cache: bool, cache_sampled: bool, prompt: str, max_tokens: int, temperature: float,
+                   top_p: float, domain: str, system_prompt: str) -> Optional[str]:
+        """Cache key for an opted-in call, or None when the cache must not be used"""
+        if not cache or self.cache is None:
+            return None
+        if temperature > 0 and not cache_sampled:
+            self.cache.record_bypass()
+            return None
+        return response_key(
+            f"{self.text_model_key}:{self.model_info.get('model', '')}", prompt,
+            max_tokens=max_tokens, temperature=temperature, top_p=top_p, domain=domain, system_prompt=system_prompt
+        )
+    
+    def cache_stats(self) -> dict:
+        """Hit-rate metrics of the shared response cache"""
+        return self.cache.stats() if self.cache is not None else {"enabled": False}
+    
+    async def _dispatch(self, prompt: str, max_tokens: int, temperature: float, top_p: float, domain: str, system_prompt: str) -> str:
         if self.model_type == "gemini":
-            return self._gemini_generate(prompt)
+            return await self._gemini_generate(prompt, max_tokens, temperature, top_p)
         
         elif self.model_type == "ollama":
-            return self._ollama_generate(prompt)
+            return await self._ollama_generate(prompt, max_tokens, temperature, top_p)
         
         elif self.model_type == "bedrock":
             return await self._bedrock_generate(
@@ -102,11 +232,21 @@ class ModelManager:
         else:
             raise ValueError(f"Unsupported model type: {self.model_type}")
         
-    def _gemini_generate(self, prompt: str) -> str:
+    @staticmethod
+    def _gemini_config(max_tokens: int, temperature: float, top_p: float):
+        from google.genai import types
+        return types.GenerateContentConfig(temperature=temperature, top_p=top_p, max_output_tokens=max_tokens)
+    
+    @staticmethod
+    def _ollama_options(max_tokens: int, temperature: float, top_p: float) -> dict:
+        return {"temperature": temperature, "top_p": top_p, "num_predict": max_tokens}
+    
+    async def _gemini_generate(self, prompt: str, max_tokens: int = 1000, temperature: float = 0.7, top_p: float = 0.95) -> str:
         """Generate text using Google's Gemini API"""
-        response = self.client.models.generate_content(
+        response = await self.client.aio.models.generate_content(
             model=self.model_info["model"],
-            contents=prompt
+            contents=prompt,
+            config=self._gemini_config(max_tokens, temperature, top_p)
         )
         # Safely extract response text
         try:
@@ -114,11 +254,13 @@ class ModelManager:
         except AttributeError:
             return str(response)
         
-    def _ollama_generate(self, prompt: str) -> str:
+    async def _ollama_generate(self, prompt: str, max_tokens: int = 1000, temperature: float = 0.7, top_p: float = 0.95) -> str:
         """Generate text using Ollama local model"""
-        response = requests.post(
+        response = await get_http_client().post(
             self.model_info["url"]["generate"],
-            json={"model": self.model_info["model"], "prompt": prompt, "stream": False}
+            json={"model": self.model_info["model"], "prompt": prompt, "stream": False,
+                  "options": self._ollama_options(max_tokens, temperature, top_p)},
+            timeout=self.timeout
         )
         response.raise_for_status()
         return response.json()["response"].strip()
@@ -150,14 +292,8 @@ class ModelManager:
             
             logger.debug(f"Sending request to Bedrock: {json.dumps(request)[:200]}...")
             
-            # Invoke the model
-            response = self.bedrock_client.invoke_model(
-                modelId=self.model_info["model"],
-                body=json.dumps(request)
-            )
-            
-            # Parse the response
-            response_body = json.loads(response["body"].read())
+            # Invoke the model (boto3 is sync: run it off the event loop)
+            response_body = await asyncio.to_thread(self._bedrock_invoke, request)
             generated_text = response_body["content"][0]["text"]
             
             # Clean up any thinking blocks if they appear
@@ -171,6 +307,13 @@ class ModelManager:
             logger.error(f"Bedrock generation error: {str(e)}")
             raise Exception(f"Bedrock generation error: {str(e)}")
     
+    def _bedrock_invoke(self, request: dict) -> dict:
+        response = self.bedrock_client.invoke_model(
+            modelId=self.model_info["model"],
+            body=json.dumps(request)
+        )
+        return json.loads(response["body"].read())
+    
     async def _ai_layer_generate(self,
                                 prompt: str,
                                 max_tokens: int = 1000,
@@ -202,20 +345,154 @@ class ModelManager:
             
             logger.info(f"Sending request to AI Layer-> model: '{custom_payload.provider}'  max_tokens: {custom_payload.max_tokens}  temperature: {custom_payload.temperature}")
             
-            async with httpx.AsyncClient(timeout=20) as client:
-                response = await client.post(
-                    api_url,
-                    json=custom_payload.model_dump(),
-                    headers=headers,
-                )
+            response = await get_http_client().post(
+                api_url,
+                json=custom_payload.model_dump(),
+                headers=headers,
+                timeout=self.timeout
+            )
 
-                response.raise_for_status()
-                return response.json()["generated_text"]
+            response.raise_for_status()
+            return response.json()["generated_text"]
                 
         except Exception as e:
             logger.error(f"AI Layer invoke failed: {str(e)}")
             raise RuntimeError(f"AI Layer invoke failed: {str(e)}")
 
+    # ---------- streaming ----------
+    async def stream_text(self,
+                          prompt: str,
+                          max_tokens: int = 1000,
+                          temperature: float = 0.7,
+                          top_p: float = 0.95,
+                          domain: str = "general",
+                          system_prompt: str = "",
+                          cache: bool = False,
+                          cache_sampled: bool = False) -> AsyncIterator[str]:
+        """
+        Stream generated text as it arrives (same parameters as generate_text).
+
+        Ollama streams NDJSON, Gemini uses generate_content_stream, Bedrock
+        invoke_model_with_response_stream. AI Layer has no streaming API and
+        yields the whole response once. The provider slot is held until the
+        stream ends; timeout applies to the wait for each chunk. A cache hit is
+        yielded as one chunk; a stream is cached only once it completed.
+        """
+        key = self._cache_key(cache, cache_sampled, prompt, max_tokens, temperature, top_p, domain, system_prompt)
+        if key is not None:
+            cached = await asyncio.to_thread(self.cache.get, key)
+            if cached is not None:
+                yield cached
+                return
+        
+        parts = []
+        async with provider_limit(self.model_type, self.max_concurrency):
+            if self.model_type == "gemini":
+                chunks = self._gemini_stream(prompt, max_tokens, temperature, top_p)
+            elif self.model_type == "ollama":
+                chunks = self._ollama_stream(prompt, max_tokens, temperature, top_p)
+            elif self.model_type == "bedrock":
+                chunks = self._bedrock_stream(prompt, max_tokens, temperature, system_prompt)
+            elif self.model_type == "endpoint" and self.text_model_key == "ai-layer":
+                chunks = self._single_chunk(self._ai_layer_generate(prompt, max_tokens, temperature, top_p, domain, system_prompt))
+            else:
+                raise ValueError(f"Unsupported model type: {self.model_type}")
+            
+            try:
+                while True:
+                    try:
+                        # asyncio.timeout keeps __anext__ in this task (httpx streams are task-bound)
+                        async with asyncio.timeout(self.timeout):
+                            chunk = await chunks.__anext__()
+                    except StopAsyncIteration:
+                        break
+                    except asyncio.TimeoutError:
+                        logger.error(f"{self.text_model_key} stream stalled for {self.timeout}s")
+                        raise TimeoutError(f"{self.text_model_key} stream stalled for {self.timeout}s")
+                    if chunk:
+                        parts.append(chunk)
+                        yield chunk
+            finally:
+                await chunks.aclose()
+        
+        if key is not None and parts:
+            await asyncio.to_thread(self.cache.put, key, self.text_model_key, "".join(parts))
+    
+    @staticmethod
+    async def _single_chunk(coro) -> AsyncIterator[str]:
+        yield await coro
+    
+    async def _gemini_stream(self, prompt: str, max_tokens: int, temperature: float, top_p: float) -> AsyncIterator[str]:
+        stream = await self.client.aio.models.generate_content_stream(
+            model=self.model_info["model"],
+            contents=prompt,
+            config=self._gemini_config(max_tokens, temperature, top_p)
+        )
+        async for chunk in stream:
+            yield getattr(chunk, "text", None) or ""
+    
+    async def _ollama_stream(self, prompt: str, max_tokens: int, temperature: float, top_p: float) -> AsyncIterator[str]:
+        async with get_http_client().stream(
+            "POST",
+            self.model_info["url"]["generate"],
+            json={"model": self.model_info["model"], "prompt": prompt, "stream": True,
+                  "options": self._ollama_options(max_tokens, temperature, top_p)},
+            timeout=self.timeout
+        ) as response:
+            response.raise_for_status()
+            async for line in response.aiter_lines():
+                if not line.strip():
+                    continue
+                chunk = json.loads(line)
+                yield chunk.get("response", "")
+                if chunk.get("done"):
+                    break
+    
+    async def _bedrock_stream(self, prompt: str, max_tokens: int, temperature: float, system_prompt: str) -> AsyncIterator[str]:
+        request = {
+            "anthropic_version": "bedrock-2023-05-31",
+            "max_tokens": max_tokens,
+            "temperature": temperature,
+            "messages": [{
+                "role": "user",
+                "content": [{"type": "text", "text": f"System: {system_prompt}\n\nUser: {prompt}" if system_prompt else prompt}]
+            }]
+        }
+        # boto3's event stream is a blocking iterator: drain it on a thread into a queue
+        loop = asyncio.get_running_loop()
+        queue: asyncio.Queue = asyncio.Queue()
+        cancelled = threading.Event()
+        done = object()
+        
+        def pump():
+            try:
+                response = self.bedrock_client.invoke_model_with_response_stream(
+                    modelId=self.model_info["model"],
+                    body=json.dumps(request)
+                )
+                for event in response["body"]:
+                    if cancelled.is_set():
+                        break
+                    payload = json.loads(event["chunk"]["bytes"]) if "chunk" in event else {}
+                    if payload.get("type") == "content_block_delta":
+                        loop.call_soon_threadsafe(queue.put_nowait, payload["delta"].get("text", ""))
+                loop.call_soon_threadsafe(queue.put_nowait, done)
+            except Exception as e:
+                loop.call_soon_threadsafe(queue.put_nowait, e)
+        
+        loop.run_in_executor(None, pump)
+        try:
+            while True:
+                item = await queue.get()
+                if item is done:
+                    break
+                if isinstance(item, Exception):
+                    logger.error(f"Bedrock stream error: {str(item)}")
+                    raise RuntimeError(f"Bedrock stream error: {str(item)}")
+                yield item
+        finally:
+            cancelled.set()  # the thread stops at the next event
+    
     # Add embedding functionality if needed
     async def get_embeddings(self, text: str) -> list:
         """
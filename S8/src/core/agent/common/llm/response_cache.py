@@ -0,0 +1,148 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional, Tuple
+from pathlib import Path
+import sys
+ROOT = Path(__file__).resolve().parents[5]  # This gets /Users/ravi/EAG-TheShadowCloneAI/S8
+
+if str(ROOT) not in sys.path:
+    sys.path.append(str(ROOT))
+
+from src.common.logger.logger import get_logger
+
+logger = get_logger()
+
+DEFAULT_CACHE_DB = ROOT / "resources" / "llm_cache" / "responses.sqlite"
+
+
+def normalize_prompt(prompt: str) -> str:
+    """Collapse whitespace so prompts differing only in indentation/blank lines share an entry"""
+    return " ".join(prompt.split())
+
+
+def response_key(model: str, prompt: str, **params) -> str:
+    """Content address of a response: (model, normalized prompt hash, sampling params)"""
+    material = json.dumps({"model": model, "params": params}, sort_keys=True, default=str)
+    return hashlib.sha256(f"{material}\0{normalize_prompt(prompt)}".encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """
+    Two-tier LLM response cache keyed by (model, normalized prompt hash, sampling params).
+
+    - In-memory LRU of at most max_entries responses
+    - Optional sqlite tier that survives restarts (db_path=None disables it)
+    - Entries older than ttl seconds are misses and are dropped (ttl=None keeps them)
+
+    Hit/miss/bypass counters are available through stats().
+    """
+    def __init__(self, max_entries: int = 1000, db_path: Optional[Path] = DEFAULT_CACHE_DB, ttl: Optional[float] = 3600.0):
+        self.max_entries = max_entries
+        self.db_path = Path(db_path) if db_path else None
+        self.ttl = ttl
+        self._memory: "OrderedDict[str, Tuple[str, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.bypassed = 0
+
+        if self.db_path is not None:
+            try:
+                self.db_path.parent.mkdir(parents=True, exist_ok=True)
+                self._conn = sqlite3.connect(str(self.db_path), check_same_thread=False)
+                self._conn.execute("PRAGMA journal_mode=WAL")
+                self._conn.execute(
+                    "CREATE TABLE IF NOT EXISTS responses ("
+                    "key TEXT PRIMARY KEY, model TEXT NOT NULL, response TEXT NOT NULL, created_at REAL NOT NULL)"
+                )
+                self._conn.commit()
+            except sqlite3.Error as e:
+                logger.warning(f"Response cache persistence disabled ({self.db_path}): {e}")
+                self._conn = None
+
+    def _fresh(self, created_at: float) -> bool:
+        return self.ttl is None or time.time() - created_at < self.ttl
+
+    def _remember(self, key: str, response: str, created_at: float):
+        self._memory[key] = (response, created_at)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                if self._fresh(entry[1]):
+                    self._memory.move_to_end(key)
+                    self.memory_hits += 1
+                    return entry[0]
+                del self._memory[key]
+
+            if self._conn is not None:
+                row = self._conn.execute("SELECT response, created_at FROM responses WHERE key = ?", (key,)).fetchone()
+                if row is not None:
+                    if self._fresh(row[1]):
+                        self._remember(key, row[0], row[1])
+                        self.disk_hits += 1
+                        return row[0]
+                    self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                    self._conn.commit()
+
+            self.misses += 1
+            return None
+
+    def put(self, key: str, model: str, response: str):
+        created_at = time.time()
+        with self._lock:
+            self._remember(key, response, created_at)
+            if self._conn is not None:
+                try:
+                    self._conn.execute("INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?)", (key, model, response, created_at))
+                    self._conn.commit()
+                except sqlite3.Error as e:
+                    logger.warning(f"Failed to persist LLM response: {e}")
+
+    def record_bypass(self):
+        with self._lock:
+            self.bypassed += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            hits = self.memory_hits + self.disk_hits
+            lookups = hits + self.misses
+            return {
+                "hits": hits,
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "bypassed": self.bypassed,
+                "hit_rate": hits / lookups if lookups else 0.0,
+                "memory_entries": len(self._memory),
+            }
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+            if self._conn is not None:
+                self._conn.execute("DELETE FROM responses")
+                self._conn.commit()
+
+
+_default_cache: Optional[ResponseCache] = None
+_default_cache_lock = threading.Lock()
+
+
+def get_response_cache(**kwargs) -> ResponseCache:
+    """Process-wide cache shared by every ModelManager (kwargs only apply on first use)"""
+    global _default_cache
+    with _default_cache_lock:
+        if _default_cache is None:
+            _default_cache = ResponseCache(**kwargs)
+        return _default_cache
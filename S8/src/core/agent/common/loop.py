@@ -8,13 +8,17 @@ if str(ROOT) not in sys.path:
 import asyncio
 from src.core.agent.common.context import AgentContext
 from src.core.agent.common.session import MultiMCP
-from src.core.agent.modules.strategy.strategy import decide_next_action
+from src.core.agent.modules.strategy.strategy import decide_next_action, decide_fused_action
 
 from src.core.agent.modules.perception.perception import extract_perception, PerceptionResult
 from src.core.agent.modules.action.action_updated import ToolCallResult, parse_function_call
 from src.core.agent.common.memory_store.memory import MemoryItem
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Optional, Tuple
 import json
 
+# emit(event, data) receives progress events from AgentLoop.run()
+EventSink = Callable[[str, Dict[str, Any]], Awaitable[None]]
+
 
 class AgentLoop:
     def __init__(self, user_input: str, dispatcher: MultiMCP):
@@ -28,7 +32,75 @@ class AgentLoop:
             return False
         parameters = getattr(tool, "parameters", {})
         return list(parameters.keys()) == ["input"]
-    async def run(self) -> str:
+
+    async def _execute(self, call: str) -> Tuple[str, Any, str]:
+        """Run one FUNCTION_CALL line, cancelling it after the profile's tool_timeout"""
+        tool_name, arguments = parse_function_call(call, self.mcp.tool_map)
+
+        if self.tool_expects_input(tool_name):
+            tool_input = {'input': arguments} if not (isinstance(arguments, dict) and 'input' in arguments) else arguments
+        else:
+            tool_input = arguments
+
+        timeout = self.context.agent_profile.tool_timeout
+        try:
+            response = await asyncio.wait_for(self.mcp.call_tool(tool_name, tool_input), timeout)
+        except asyncio.TimeoutError:
+            raise TimeoutError(f"{tool_name} timed out after {timeout}s")
+
+        # ✅ Safe TextContent parsing
+        raw = getattr(response.content, 'text', str(response.content))
+        try:
+            result_obj = json.loads(raw) if raw.strip().startswith("{") else raw
+        except json.JSONDecodeError:
+            result_obj = raw
+
+        result_str = result_obj.get("markdown") if isinstance(result_obj, dict) else str(result_obj)
+        return tool_name, arguments, result_str
+
+    async def _retrieve_memories(self, query: str, notify):
+        retrieved = self.context.memory.retrieve(
+            query=query,
+            top_k=self.context.agent_profile.memory_config["top_k"],
+            type_filter=self.context.agent_profile.memory_config.get("type_filter", None),
+            session_filter=self.context.session_id
+        )
+        print(f"[memory] Retrieved {len(retrieved)} memories")
+        await notify("memory", retrieved=len(retrieved))
+        return retrieved
+
+    async def run_stream(self) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Run the loop, yielding {"event": ..., "data": ...} dicts as it goes:
+        step, perception, memory, plan, action, token (final-answer text as the
+        LLM produces it), error and finally final.
+        """
+        queue: asyncio.Queue = asyncio.Queue()
+
+        async def emit(event: str, data: Dict[str, Any]):
+            await queue.put({"event": event, "data": data})
+
+        async def produce():
+            try:
+                answer = await self.run(emit)
+                await emit("final", {"answer": answer})
+            finally:
+                await queue.put(None)
+
+        task = asyncio.create_task(produce())
+        try:
+            while (item := await queue.get()) is not None:
+                yield item
+            await task
+        finally:
+            if not task.done():
+                task.cancel()
+
+    async def run(self, emit: Optional[EventSink] = None) -> str:
+        async def notify(event: str, **data):
+            if emit is not None:
+                await emit(event, data)
+
         print(f"[agent] Starting session: {self.context.session_id}")
 
         try:
@@ -38,69 +110,89 @@ class AgentLoop:
             for step in range(max_steps):
                 self.context.step = step
                 print(f"[loop] Step {step + 1} of {max_steps}")
+                await notify("step", step=step + 1, max_steps=max_steps)
+
+                on_token = (lambda text: notify("token", text=text)) if emit is not None else None
+                fused = None
+                retrieved = None
+                if self.context.agent_profile.planning == "fused":
+                    # 🧠📊 Perception + planning in one LLM call
+                    retrieved = await self._retrieve_memories(query, notify)
+                    fused = await decide_fused_action(
+                        context=self.context,
+                        query=query,
+                        memory_items=retrieved,
+                        all_tools=self.tools,
+                        on_token=on_token
+                    )
+                    if fused is None:
+                        print("[plan] ⚠️ Fused output unusable, falling back to perception + planning")
 
-                # 🧠 Perception
-                perception_raw = await extract_perception(query)
+                if fused is not None:
+                    perception, plan = fused
+                    print(f"[perception] Intent: {perception.intent}, Hint: {perception.tool_hint}")
+                    await notify("perception", intent=perception.intent, entities=perception.entities, tool_hint=perception.tool_hint)
+                else:
+                    # 🧠 Perception
+                    perception_raw = await extract_perception(query)
 
 
-                # ✅ Exit cleanly on FINAL_ANSWER
-                # ✅ Handle string outputs safely before trying to parse
-                if isinstance(perception_raw, str):
-                    pr_str = perception_raw.strip()
+                    # ✅ Exit cleanly on FINAL_ANSWER
+                    # ✅ Handle string outputs safely before trying to parse
+                    if isinstance(perception_raw, str):
+                        pr_str = perception_raw.strip()
                     
-                    # Clean exit if it's a FINAL_ANSWER
-                    if pr_str.startswith("FINAL_ANSWER:"):
-                        self.context.final_answer = pr_str
-                        break
-
-                    # Detect LLM echoing the prompt
-                    if "Your last tool produced this result" in pr_str or "Original user task:" in pr_str:
-                        print("[perception] ⚠️ LLM likely echoed prompt. No actionable plan.")
-                        self.context.final_answer = "FINAL_ANSWER: [no result]"
-                        break
-
-                    # Try to decode stringified JSON if it looks valid
-                    try:
-                        perception_raw = json.loads(pr_str)
-                    except json.JSONDecodeError:
-                        print("[perception] ⚠️ LLM response was neither valid JSON nor actionable text.")
-                        self.context.final_answer = "FINAL_ANSWER: [no result]"
-                        break
-
-
-                # ✅ Try parsing PerceptionResult
-                if isinstance(perception_raw, PerceptionResult):
-                    perception = perception_raw
-                else:
-                    try:
-                        # Attempt to parse stringified JSON if needed
-                        if isinstance(perception_raw, str):
-                            perception_raw = json.loads(perception_raw)
-                        perception = PerceptionResult(**perception_raw)
-                    except Exception as e:
-                        print(f"[perception] ⚠️ LLM perception failed: {e}")
-                        print(f"[perception] Raw output: {perception_raw}")
-                        break
-
-                print(f"[perception] Intent: {perception.intent}, Hint: {perception.tool_hint}")
-
-                # 💾 Memory Retrieval
-                retrieved = self.context.memory.retrieve(
-                    query=query,
-                    top_k=self.context.agent_profile.memory_config["top_k"],
-                    type_filter=self.context.agent_profile.memory_config.get("type_filter", None),
-                    session_filter=self.context.session_id
-                )
-                print(f"[memory] Retrieved {len(retrieved)} memories")
-
-                # 📊 Planning (via strategy)
-                plan = await decide_next_action(
-                    context=self.context,
-                    perception=perception,
-                    memory_items=retrieved,
-                    all_tools=self.tools
-                )
+                        # Clean exit if it's a FINAL_ANSWER
+                        if pr_str.startswith("FINAL_ANSWER:"):
+                            self.context.final_answer = pr_str
+                            break
+
+                        # Detect LLM echoing the prompt
+                        if "Your last tool produced this result" in pr_str or "Original user task:" in pr_str:
+                            print("[perception] ⚠️ LLM likely echoed prompt. No actionable plan.")
+                            self.context.final_answer = "FINAL_ANSWER: [no result]"
+                            break
+
+                        # Try to decode stringified JSON if it looks valid
+                        try:
+                            perception_raw = json.loads(pr_str)
+                        except json.JSONDecodeError:
+                            print("[perception] ⚠️ LLM response was neither valid JSON nor actionable text.")
+                            self.context.final_answer = "FINAL_ANSWER: [no result]"
+                            break
+
+
+                    # ✅ Try parsing PerceptionResult
+                    if isinstance(perception_raw, PerceptionResult):
+                        perception = perception_raw
+                    else:
+                        try:
+                            # Attempt to parse stringified JSON if needed
+                            if isinstance(perception_raw, str):
+                                perception_raw = json.loads(perception_raw)
+                            perception = PerceptionResult(**perception_raw)
+                        except Exception as e:
+                            print(f"[perception] ⚠️ LLM perception failed: {e}")
+                            print(f"[perception] Raw output: {perception_raw}")
+                            break
+
+                    print(f"[perception] Intent: {perception.intent}, Hint: {perception.tool_hint}")
+                    await notify("perception", intent=perception.intent, entities=perception.entities, tool_hint=perception.tool_hint)
+
+                    # 💾 Memory Retrieval
+                    if retrieved is None:
+                        retrieved = await self._retrieve_memories(query, notify)
+
+                    # 📊 Planning (via strategy)
+                    plan = await decide_next_action(
+                        context=self.context,
+                        perception=perception,
+                        memory_items=retrieved,
+                        all_tools=self.tools,
+                        on_token=on_token
+                    )
                 print(f"[plan] {plan}")
+                await notify("plan", plan=plan)
 
                 if "FINAL_ANSWER:" in plan:
                     # Optionally extract the final answer portion
@@ -112,26 +204,28 @@ class AgentLoop:
                     break
 
 
-                # ⚙️ Tool Execution
-                try:
-                    tool_name, arguments = parse_function_call(plan, self.mcp.tool_map)
-
-                    if self.tool_expects_input(tool_name):
-                        tool_input = {'input': arguments} if not (isinstance(arguments, dict) and 'input' in arguments) else arguments
-                    else:
-                        tool_input = arguments
-
-                    response = await self.mcp.call_tool(tool_name, tool_input)
-
-                    # ✅ Safe TextContent parsing
-                    raw = getattr(response.content, 'text', str(response.content))
+                # ⚙️ Tool Execution (explore_all plans may hold several independent calls)
+                calls = [line.strip() for line in plan.splitlines() if line.strip()]
+                if len(calls) > 1:
+                    print(f"[action] Running {len(calls)} tool calls in parallel")
+                    # gather cancels every pending call if this run is cancelled
+                    outcomes = await asyncio.gather(*(self._execute(call) for call in calls), return_exceptions=True)
+                else:
                     try:
-                        result_obj = json.loads(raw) if raw.strip().startswith("{") else raw
-                    except json.JSONDecodeError:
-                        result_obj = raw
+                        outcomes = [await self._execute(plan)]
+                    except Exception as e:
+                        outcomes = [e]
+
+                results = []
+                for call, outcome in zip(calls, outcomes):
+                    if isinstance(outcome, BaseException):
+                        print(f"[error] Tool execution failed: {outcome}")
+                        await notify("error", stage="action", message=str(outcome))
+                        continue
 
-                    result_str = result_obj.get("markdown") if isinstance(result_obj, dict) else str(result_obj)
+                    tool_name, arguments, result_str = outcome
                     print(f"[action] {tool_name} → {result_str}")
+                    await notify("action", tool=tool_name, arguments=arguments, result=result_str)
 
                     # 🧠 Add memory
                     memory_item = MemoryItem(
@@ -143,9 +237,14 @@ class AgentLoop:
                         session_id=self.context.session_id
                     )
                     self.context.add_memory(memory_item)
+                    results.append(memory_item.text if len(calls) > 1 else result_str)
 
-                    # 🔁 Next query
-                    query = f"""Original user task: {self.context.user_input}
+                if not results:
+                    break
+                result_str = "\n\n".join(results)
+
+                # 🔁 Next query
+                query = f"""Original user task: {self.context.user_input}
 
     Your last tool produced this result:
 
@@ -155,12 +254,10 @@ class AgentLoop:
     FINAL_ANSWER: your answer
 
     Otherwise, return the next FUNCTION_CALL."""
-                except Exception as e:
-                    print(f"[error] Tool execution failed: {e}")
-                    break
 
         except Exception as e:
             print(f"[agent] Session failed: {e}")
+            await notify("error", stage="session", message=str(e))
 
         return self.context.final_answer or "FINAL_ANSWER: [no result]"
 
@@ -24,9 +24,16 @@
 from typing import List, Optional, Literal
 from pydantic import BaseModel
 from datetime import datetime
-import requests
 import numpy as np
 import faiss
+from pathlib import Path
+import sys
+ROOT = Path(__file__).resolve().parents[5]  # This gets /Users/ravi/EAG-TheShadowCloneAI/S8
+
+if str(ROOT) not in sys.path:
+    sys.path.append(str(ROOT))
+
+from src.common.embedding.embedding_client import get_embedding_client
 
 
 class MemoryItem(BaseModel):
@@ -48,12 +55,7 @@ class MemoryManager:
         self.embeddings: List[np.ndarray] = []
 
     def _get_embedding(self, text: str) -> np.ndarray:
-        response = requests.post(
-            self.embedding_model_url,
-            json={"model": self.model_name, "prompt": text}
-        )
-        response.raise_for_status()
-        return np.array(response.json()["embedding"], dtype=np.float32)
+        return get_embedding_client(self.embedding_model_url, self.model_name).embed(text)
 
     def add(self, item: MemoryItem):
         embedding = self._get_embedding(item.text)
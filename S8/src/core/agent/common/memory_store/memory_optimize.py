@@ -2,15 +2,17 @@ import numpy as np
 import faiss
 from typing import List, Optional, Literal, Dict, Any
 from pydantic import BaseModel
-from datetime import datetime
+from datetime import datetime, timedelta
+import io
 import os
 import json
 import logging
 import pickle
+import atexit
+import threading
+import time
+import weakref
 
-# For embeddings - choose one approach based on your setup
-# Option 1: Local model through ollama
-import requests
 from pathlib import Path
 import sys
 ROOT = Path(__file__).resolve().parents[4]  # This gets /Users/ravi/EAG-TheShadowCloneAI/S8
@@ -20,8 +22,14 @@ if str(ROOT) not in sys.path:
 
 
 from src.common.logger.logger import get_logger
+from src.common.embedding.embedding_client import get_embedding_client
+from src.common.vector_index.index_factory import IndexSpec, build_index, configure_search, needs_rebuild, normalize, search_params, stored_vectors
 logger = get_logger()
 
+# Filtered retrieval scans the matching vectors exactly up to this many candidates,
+# above it the filter is pushed into the faiss search as an IDSelector
+EXACT_FILTER_LIMIT = 4096
+
 
 class MemoryItem(BaseModel):
     text: str
@@ -31,6 +39,7 @@ class MemoryItem(BaseModel):
     user_query: Optional[str] = None
     tags: List[str] = []
     session_id: Optional[str] = None
+    expires_at: Optional[str] = None  # ISO timestamp; expired items are dropped by the compactor
     
     def __init__(self, **data):
         if "timestamp" not in data or data["timestamp"] is None:
@@ -45,7 +54,8 @@ class MemoryItem(BaseModel):
             "tool_name": self.tool_name,
             "user_query": self.user_query,
             "tags": self.tags,
-            "session_id": self.session_id
+            "session_id": self.session_id,
+            "expires_at": self.expires_at
         }
     
     @classmethod
@@ -53,13 +63,52 @@ class MemoryItem(BaseModel):
         return cls(**data)
 
 
+def _parse_time(value: Optional[str]) -> Optional[datetime]:
+    try:
+        return datetime.fromisoformat(value) if value else None
+    except ValueError:
+        return None
+
+
+def _atomic_write(path: Path, data: bytes):
+    """Write to a temp file, fsync it and rename it over path (readers never see a partial file)"""
+    tmp = path.with_name(f"{path.name}.tmp")
+    with open(tmp, "wb") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+    if os.name == "posix":
+        fd = os.open(str(path.parent), os.O_RDONLY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+
+# Managers with unsaved changes are flushed on interpreter exit
+_live_managers: "weakref.WeakSet[MemoryManager]" = weakref.WeakSet()
+
+
+@atexit.register
+def _flush_live_managers():
+    for manager in list(_live_managers):
+        manager.close()
+
+
 class MemoryManager:
     def __init__(self, 
                  embedding_model_url="http://localhost:11434/api/embeddings",
                  model_name="nomic-embed-text",
                  collection_name="agent_memory",
                  dimension=768,  # Default dimension for embeddings
-                 save_path=ROOT / "resources" / "memory_store"):
+                 save_path=ROOT / "resources" / "memory_store",
+                 index_spec: Optional[IndexSpec] = None,
+                 flush_interval: float = 5.0,
+                 flush_threshold: int = 50,
+                 default_ttl: Optional[float] = None,
+                 session_ttl: Optional[float] = None,
+                 compact_interval: float = 300.0):
         """
         Initialize the MemoryManager with Faiss vector database
         
@@ -69,33 +118,80 @@ class MemoryManager:
             collection_name: Name of the collection/index
             dimension: Dimension of embeddings
             save_path: Directory to save the Faiss index and metadata
+            index_spec: Faiss index type / search tuning (default: flat, IVF once large)
+            flush_interval: Seconds between background saves while there are unsaved changes
+            flush_threshold: Unsaved items that trigger a background save before the interval
+            default_ttl: Seconds an item lives when it has no expires_at (None = forever)
+            session_ttl: Seconds after a session's newest memory before the whole session expires
+            compact_interval: Seconds between background expiry passes (only with a TTL set)
+
+        Writes are write-behind: add()/bulk_add() only update memory and mark the
+        store dirty; a background thread persists it. Call flush() (or use the
+        manager as a context manager) when the data must be on disk.
+
+        Items get stable ids (IndexIDMap2) and their vectors are kept next to the
+        index, so deletion and index rebuilds never re-embed anything.
         """
         self.embedding_model_url = embedding_model_url
         self.model_name = model_name
+        self.embedder = get_embedding_client(embedding_model_url, model_name)
         self.collection_name = collection_name
         self.dimension = dimension
         self.save_path = Path(save_path)
+        self.index_spec = index_spec or IndexSpec()
+        
+        self.flush_interval = flush_interval
+        self.flush_threshold = max(1, flush_threshold)
+        self.default_ttl = default_ttl
+        self.session_ttl = session_ttl
+        self.compact_interval = compact_interval
+        self._last_compaction = time.monotonic()
         
         # Create save directory if it doesn't exist
         self.save_path.mkdir(parents=True, exist_ok=True)
         
+        # Write-behind state
+        self._lock = threading.RLock()
+        self._dirty = 0  # changes since the last successful save
+        self._flush_requested = threading.Event()
+        self._closed = threading.Event()
+        self._worker: Optional[threading.Thread] = None
+        
         # Initialize Faiss index and metadata store
         self._initialize_index()
+        _live_managers.add(self)
+        if self._expiry_enabled:
+            self._ensure_worker()
         
         # For sentence-transformers (alternative embedding approach)
         # self.model = SentenceTransformer('all-MiniLM-L6-v2')
         
+    def _paths(self):
+        base = self.save_path / self.collection_name
+        return (Path(f"{base}_index.faiss"), Path(f"{base}_metadata.pkl"), Path(f"{base}_vectors.npz"))
+    
     def _initialize_index(self):
-        """Initialize or load the Faiss index and metadata"""
-        index_path = self.save_path / f"{self.collection_name}_index.faiss"
-        metadata_path = self.save_path / f"{self.collection_name}_metadata.pkl"
+        """Initialize or load the Faiss index, metadata and stored vectors"""
+        index_path, metadata_path, vectors_path = self._paths()
         
         if index_path.exists() and metadata_path.exists():
             # Load existing index and metadata
             try:
-                self.index = faiss.read_index(str(index_path))
+                index = faiss.read_index(str(index_path))
                 with open(metadata_path, 'rb') as f:
                     self.metadata = pickle.load(f)
+                self.vectors = self._load_vectors(vectors_path, index)
+                renormalized = self._renormalize_vectors()
+                self._next_id = max((int(k) for k in self.metadata), default=-1) + 1
+                if vectors_path.exists() and index.ntotal == len(self.vectors) and not renormalized:
+                    self.index = configure_search(index, self.index_spec)
+                else:
+                    # Collection from before stable ids (ids were positions), a save
+                    # interrupted between files, or vectors stored before the embedding
+                    # client normalized them: the stored vectors are authoritative
+                    self._rebuild_index()
+                    self._dirty += 1
+                self._rebuild_attribute_index()
                 logger.info(f"Loaded existing index with {self.index.ntotal} entries")
             except Exception as e:
                 logger.error(f"Error loading index: {str(e)}")
@@ -103,62 +199,195 @@ class MemoryManager:
         else:
             self._create_new_index()
     
+    def _load_vectors(self, vectors_path: Path, index) -> Dict[int, np.ndarray]:
+        """Stored vectors by id; recovered from the index when the sidecar is missing"""
+        if vectors_path.exists():
+            with np.load(vectors_path) as data:
+                ids, vectors = data["ids"], data["vectors"]
+        else:
+            # No sidecar: the collection predates stable ids, unless only the sidecar was lost
+            inner = faiss.downcast_index(index)
+            if isinstance(inner, faiss.IndexIDMap2):
+                ids, vectors = faiss.vector_to_array(inner.id_map), stored_vectors(faiss.downcast_index(inner.index))
+            else:
+                ids, vectors = np.arange(index.ntotal), stored_vectors(index)
+            logger.info(f"Recovered {len(ids)} stored vectors from the {self.collection_name} index")
+        return {int(i): v for i, v in zip(ids, vectors) if str(int(i)) in self.metadata}
+    
+    def _renormalize_vectors(self) -> bool:
+        """Scale stored vectors to unit length (older /api/embeddings vectors were not); True if any changed"""
+        if not self.vectors:
+            return False
+        ids = list(self.vectors)
+        vectors = np.stack([self.vectors[i] for i in ids])
+        norms = np.linalg.norm(vectors, axis=1)
+        if np.allclose(norms[norms > 0], 1.0, atol=1e-3):
+            return False
+        self.vectors = dict(zip(ids, normalize(vectors)))
+        logger.info(f"Renormalized {int(np.sum(~np.isclose(norms, 1.0, atol=1e-3)))} stored vectors in {self.collection_name}")
+        return True
+
     def _create_new_index(self):
         """Create a new Faiss index and metadata store"""
-        # Create a flat L2 index - you can use other index types for better performance
-        self.index = faiss.IndexFlatL2(self.dimension)
-        # Alternative: IVF index for better scaling with large collections
-        # quantizer = faiss.IndexFlatL2(self.dimension)
-        # self.index = faiss.IndexIVFFlat(quantizer, self.dimension, 100)  # 100 centroids
-        # self.index.train(np.random.random((1000, self.dimension)).astype('float32'))
+        # Flat until the collection passes index_spec.train_threshold, see _maybe_rebuild_index
+        self.index = build_index(np.zeros((0, self.dimension), dtype=np.float32), self.index_spec, ids=np.zeros(0, dtype=np.int64))
         
-        # Metadata will store our MemoryItems by ID
+        # Metadata will store our MemoryItems by ID, vectors are kept for rebuilds
         self.metadata = {}
+        self.vectors: Dict[int, np.ndarray] = {}
+        self._next_id = 0
+        self._rebuild_attribute_index()
         logger.info(f"Created new Faiss index for {self.collection_name}")
     
-    def _save_index(self):
-        """Save the index and metadata to disk"""
+    def _rebuild_index(self):
+        """Rebuild the index from stored vectors (no re-embedding); ids are preserved"""
+        ids = np.fromiter(self.vectors.keys(), dtype=np.int64, count=len(self.vectors))
+        vectors = np.stack(list(self.vectors.values())) if self.vectors else np.zeros((0, self.dimension), dtype=np.float32)
+        self.index = build_index(vectors, self.index_spec, ids=ids)
+    
+    def _maybe_rebuild_index(self):
+        """Switch index type once the collection outgrows (or shrinks below) it"""
+        if needs_rebuild(self.index, self.index_spec):
+            self._rebuild_index()
+
+    def _save_index(self) -> bool:
+        """Save the index, metadata and vectors to disk (atomic rename of fsync'd files)"""
         try:
-            index_path = self.save_path / f"{self.collection_name}_index.faiss"
-            metadata_path = self.save_path / f"{self.collection_name}_metadata.pkl"
+            index_path, metadata_path, vectors_path = self._paths()
             
-            faiss.write_index(self.index, str(index_path))
-            with open(metadata_path, 'wb') as f:
-                pickle.dump(self.metadata, f)
-            logger.info(f"Saved index with {self.index.ntotal} entries")
+            # Serialize under the lock (in-memory, fast), write outside it
+            with self._lock:
+                saved = self._dirty
+                index_bytes = faiss.serialize_index(self.index).tobytes()
+                metadata_bytes = pickle.dumps(self.metadata)
+                vectors_buffer = io.BytesIO()
+                np.savez(
+                    vectors_buffer,
+                    ids=np.fromiter(self.vectors.keys(), dtype=np.int64, count=len(self.vectors)),
+                    vectors=np.stack(list(self.vectors.values())) if self.vectors else np.zeros((0, self.dimension), dtype=np.float32)
+                )
+                ntotal = self.index.ntotal
+            
+            # Metadata first: an entry whose vector is missing is skipped, never misattributed
+            _atomic_write(metadata_path, metadata_bytes)
+            _atomic_write(vectors_path, vectors_buffer.getvalue())
+            _atomic_write(index_path, index_bytes)
+            with self._lock:
+                self._dirty -= saved
+            logger.info(f"Saved index with {ntotal} entries")
+            return True
         except Exception as e:
             logger.error(f"Error saving index: {str(e)}")
+            return False
+    
+    # ---------- write-behind persistence / compaction ----------
+    def _mark_dirty(self, count: int = 1):
+        """Record unsaved changes; the background worker persists them"""
+        with self._lock:
+            self._dirty += count
+            dirty = self._dirty
+        self._ensure_worker()
+        if dirty >= self.flush_threshold:
+            self._flush_requested.set()
+    
+    @property
+    def _expiry_enabled(self) -> bool:
+        return self.default_ttl is not None or self.session_ttl is not None
+    
+    def _ensure_worker(self):
+        with self._lock:
+            if self._worker is None or not self._worker.is_alive():
+                self._closed.clear()
+                self._worker = threading.Thread(
+                    target=self._worker_loop, args=(weakref.ref(self),),
+                    name=f"memory-worker-{self.collection_name}", daemon=True
+                )
+                self._worker.start()
+    
+    @staticmethod
+    def _worker_loop(ref):
+        # Holds only a weak reference so an unused manager can still be collected
+        while True:
+            manager = ref()
+            if manager is None:
+                return
+            requested, closed, interval = manager._flush_requested, manager._closed, manager.flush_interval
+            del manager
+            requested.wait(interval)
+            requested.clear()
+            if closed.is_set():
+                return
+            manager = ref()
+            if manager is None:
+                return
+            if manager._expiry_enabled and time.monotonic() - manager._last_compaction >= manager.compact_interval:
+                manager.expire()
+            if manager.dirty:
+                manager._save_index()
+            del manager
+    
+    @property
+    def dirty(self) -> int:
+        """Number of changes not yet on disk"""
+        with self._lock:
+            return self._dirty
     
+    def flush(self) -> bool:
+        """Persist pending changes now; returns False if the save failed"""
+        if not self.dirty:
+            return True
+        return self._save_index()
+    
+    def close(self):
+        """Flush and stop the background worker"""
+        self.flush()
+        self._closed.set()
+        self._flush_requested.set()
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+    
+    def _check_dimension(self, dimension: int) -> bool:
+        """Adopt the model's embedding dimension while the index is still empty"""
+        if dimension == self.dimension:
+            return True
+        logger.warning(f"Embedding dimension mismatch. Expected {self.dimension}, got {dimension}")
+        # Reinitialize index if dimension changed
+        if self.index.ntotal == 0:
+            self.dimension = dimension
+            self._create_new_index()
+            return True
+        logger.error("Cannot change dimension of non-empty index")
+        return False
+
     def _get_embedding(self, text: str) -> np.ndarray:
         """Get embedding vector for text using the embedding model"""
         try:
-            # Option 1: Using Ollama or similar API service
-            response = requests.post(
-                self.embedding_model_url,
-                json={"model": self.model_name, "prompt": text}
-            )
-            response.raise_for_status()
-            embedding = np.array(response.json()["embedding"], dtype=np.float32)
+            # Shared keep-alive client (Ollama); see src/common/embedding
+            embedding = self.embedder.embed(text)
             
             # Option 2: Using sentence-transformers
             # embedding = self.model.encode([text])[0].astype(np.float32)
             
             # Make sure it's the right shape
-            if embedding.shape[0] != self.dimension:
-                logger.warning(f"Embedding dimension mismatch. Expected {self.dimension}, got {embedding.shape[0]}")
-                self.dimension = embedding.shape[0]
-                # Reinitialize index if dimension changed
-                if self.index.ntotal == 0:
-                    self._create_new_index()
-                else:
-                    logger.error("Cannot change dimension of non-empty index")
-                    return np.zeros(self.dimension, dtype=np.float32)
+            if not self._check_dimension(embedding.shape[0]):
+                return np.zeros(self.dimension, dtype=np.float32)
             
             return embedding
         except Exception as e:
             logger.error(f"Error getting embedding: {str(e)}")
             # Return empty embedding if failed
             return np.zeros(self.dimension, dtype=np.float32)
+
+    def _get_embeddings(self, texts: List[str]) -> np.ndarray:
+        """Get embedding vectors for many texts in batched requests"""
+        vectors = self.embedder.embed_batch(texts)
+        if not self._check_dimension(vectors.shape[1]):
+            raise ValueError(f"Embedding dimension {vectors.shape[1]} does not match index dimension {self.dimension}")
+        return vectors
     
     def retrieve(
             self,
@@ -191,47 +420,28 @@ class MemoryManager:
             # Convert to the format Faiss expects
             query_vector = query_vector.reshape(1, -1)
             
-            # Perform search - get more results than needed to allow for filtering
-            search_k = min(top_k * 5, self.index.ntotal)  # Get more to allow for filtering
-            distances, indices = self.index.search(query_vector, search_k)
-            
-            # Flatten results
-            indices = indices[0]
-            distances = distances[0]
+            with self._lock:  # the background worker may be serializing the index
+                # Filters resolve to an id set first, so top_k is exact within the filter
+                expired = self._expired_ids(datetime.now())
+                candidates = self._candidate_ids(type_filter, tag_filter, session_filter)
+                if candidates is None:
+                    # Unfiltered: only not-yet-compacted expired items need to be skipped
+                    search_k = min(top_k + len(expired), self.index.ntotal)
+                    _, indices = self.index.search(query_vector, search_k)
+                    ids = [int(i) for i in indices[0] if i >= 0 and int(i) not in expired]
+                else:
+                    ids = self._filtered_search(query_vector, candidates - expired, top_k)
+                ids = ids[:top_k]
+                results = [self.metadata.get(str(i)) for i in ids]
             
-            # Filter and convert results
+            # Convert results
             memory_items = []
-            for idx, distance in zip(indices, distances):
-                if idx < 0:  # Faiss returns -1 for padded results
-                    continue
-                    
-                # Get memory item from metadata
-                item_id = str(idx)
-                if item_id not in self.metadata:
+            for idx, item_data in zip(ids, results):
+                if item_data is None:
                     logger.warning(f"Index {idx} not found in metadata")
                     continue
-                    
-                item_data = self.metadata[item_id]
-                
-                # Apply filters
-                if type_filter and item_data.get("type") != type_filter:
-                    continue
-                    
-                if tag_filter:
-                    item_tags = set(item_data.get("tags", []))
-                    if not any(tag in item_tags for tag in tag_filter):
-                        continue
-                        
-                if session_filter and item_data.get("session_id") != session_filter:
-                    continue
-                
-                # Create memory item
                 try:
-                    memory_item = MemoryItem.from_dict(item_data)
-                    memory_items.append(memory_item)
-                    
-                    if len(memory_items) >= top_k:
-                        break
+                    memory_items.append(MemoryItem.from_dict(item_data))
                 except Exception as e:
                     logger.error(f"Error processing memory result: {str(e)}")
                     continue
@@ -242,6 +452,93 @@ class MemoryManager:
             logger.error(f"Error retrieving from Faiss: {str(e)}")
             return []
     
+    # ---------- attribute index (pre-filtering) ----------
+    def _rebuild_attribute_index(self):
+        """Per-session / per-type / per-tag id sets, expiry times and newest timestamp per session, derived from metadata"""
+        self._by_session: Dict[str, set] = {}
+        self._by_type: Dict[str, set] = {}
+        self._by_tag: Dict[str, set] = {}
+        self._expiry: Dict[int, datetime] = {}
+        self._session_seen: Dict[str, datetime] = {}  # session -> newest item timestamp (session_ttl)
+        for key, item_data in self.metadata.items():
+            self._index_attributes(int(key), item_data)
+    
+    def _index_attributes(self, item_id: int, item_data: Dict[str, Any]):
+        if item_data.get("session_id"):
+            self._by_session.setdefault(item_data["session_id"], set()).add(item_id)
+        self._by_type.setdefault(item_data.get("type"), set()).add(item_id)
+        for tag in item_data.get("tags") or []:
+            self._by_tag.setdefault(tag, set()).add(item_id)
+        expires_at = _parse_time(item_data.get("expires_at"))
+        if expires_at:
+            self._expiry[item_id] = expires_at
+        session_id, seen = item_data.get("session_id"), _parse_time(item_data.get("timestamp"))
+        if session_id and seen and (session_id not in self._session_seen or seen > self._session_seen[session_id]):
+            self._session_seen[session_id] = seen
+    
+    def _unindex_attributes(self, item_id: int, item_data: Dict[str, Any]):
+        keys = [(self._by_session, item_data.get("session_id")), (self._by_type, item_data.get("type"))]
+        keys += [(self._by_tag, tag) for tag in item_data.get("tags") or []]
+        for attribute_index, value in keys:
+            ids = attribute_index.get(value)
+            if ids is not None:
+                ids.discard(item_id)
+                if not ids:
+                    del attribute_index[value]
+        self._expiry.pop(item_id, None)
+        session_id = item_data.get("session_id")
+        if session_id in self._session_seen and _parse_time(item_data.get("timestamp")) == self._session_seen[session_id]:
+            # The session's newest item is gone: fall back to the newest remaining one
+            seen = [t for t in (_parse_time(self.metadata.get(str(i), {}).get("timestamp"))
+                                for i in self._by_session.get(session_id, ()) if i != item_id) if t]
+            if seen:
+                self._session_seen[session_id] = max(seen)
+            else:
+                del self._session_seen[session_id]
+    
+    def _expired_ids(self, now: datetime) -> set:
+        """Items past their expires_at plus every item of sessions idle for longer than session_ttl"""
+        expired = {item_id for item_id, expires_at in self._expiry.items() if expires_at <= now}
+        if self.session_ttl is not None:
+            cutoff = now - timedelta(seconds=self.session_ttl)
+            for session_id, seen in self._session_seen.items():
+                if seen <= cutoff:
+                    expired.update(self._by_session.get(session_id, ()))
+        return expired
+    
+    def _candidate_ids(self, type_filter: Optional[str], tag_filter: Optional[List[str]], session_filter: Optional[str]) -> Optional[set]:
+        """Ids matching every given filter (any of the tags), or None when nothing is filtered"""
+        selections = []
+        if session_filter:
+            selections.append(self._by_session.get(session_filter, set()))
+        if type_filter:
+            selections.append(self._by_type.get(type_filter, set()))
+        if tag_filter:
+            selections.append(set().union(*(self._by_tag.get(tag, set()) for tag in tag_filter)))
+        if not selections:
+            return None
+        selections.sort(key=len)
+        return selections[0].intersection(*selections[1:])
+    
+    def _filtered_search(self, query_vector: np.ndarray, candidates: set, top_k: int) -> List[int]:
+        """Exact top_k among candidates: brute force over stored vectors for small sets, IDSelector otherwise"""
+        if not candidates:
+            return []
+        if len(candidates) <= EXACT_FILTER_LIMIT:
+            # IVF/HNSW can miss a small selection entirely (unprobed lists, graph pruning)
+            ids = np.array([i for i in candidates if i in self.vectors], dtype=np.int64)
+            if not ids.size:
+                return []
+            vectors = np.stack([self.vectors[i] for i in ids.tolist()])
+            if self.index.metric_type == faiss.METRIC_INNER_PRODUCT:
+                order = np.argsort(-(vectors @ query_vector[0]), kind="stable")
+            else:
+                order = np.argsort(((vectors - query_vector) ** 2).sum(axis=1), kind="stable")
+            return ids[order[:top_k]].tolist()
+        selector = faiss.IDSelectorBatch(np.fromiter(candidates, dtype=np.int64, count=len(candidates)))
+        _, indices = self.index.search(query_vector, min(top_k, len(candidates)), params=search_params(self.index, sel=selector))
+        return [int(i) for i in indices[0] if i >= 0]
+    
     def add(self, item: MemoryItem):
         """
         Add a memory item to the vector database
@@ -256,17 +553,22 @@ class MemoryManager:
             # Add to Faiss index
             vector = vector.reshape(1, -1)  # Reshape to 2D for Faiss
             
-            # Get the current index size as the ID
-            item_id = str(self.index.ntotal)
-            
-            # Add to index
-            self.index.add(vector)
-            
-            # Store metadata
-            self.metadata[item_id] = item.to_dict()
+            with self._lock:
+                # Stable id: never reused, survives deletes and rebuilds
+                item_id = self._next_id
+                self._next_id += 1
+                
+                # Add to index
+                self.index.add_with_ids(vector, np.array([item_id], dtype=np.int64))
+                self.vectors[item_id] = vector[0]
+                
+                # Store metadata
+                self.metadata[str(item_id)] = self._item_data(item)
+                self._index_attributes(item_id, self.metadata[str(item_id)])
+                self._maybe_rebuild_index()
             
-            # Save index periodically (can be optimized to save less frequently)
-            self._save_index()
+            # Persisted by the background flusher
+            self._mark_dirty()
             
             logger.info(f"Added memory item to Faiss: {item.text[:30]}...")
             
@@ -284,29 +586,27 @@ class MemoryManager:
             return
             
         try:
-            # Prepare vectors and metadata
-            vectors = []
-            
-            for item in items:
-                vector = self._get_embedding(item.text)
-                vectors.append(vector)
-            
-            # Convert to numpy array
-            vectors_array = np.array(vectors, dtype=np.float32)
-            
-            # Get starting item ID
-            start_id = self.index.ntotal
-            
-            # Add to index
-            self.index.add(vectors_array)
+            # Embed all items in batched requests
+            vectors_array = self._get_embeddings([item.text for item in items])
             
-            # Store metadata
-            for i, item in enumerate(items):
-                item_id = str(start_id + i)
-                self.metadata[item_id] = item.to_dict()
+            with self._lock:
+                # Get starting item ID
+                start_id = self._next_id
+                ids = np.arange(start_id, start_id + len(items), dtype=np.int64)
+                self._next_id += len(items)
+                
+                # Add to index
+                self.index.add_with_ids(vectors_array, ids)
+                
+                # Store vectors and metadata
+                for item_id, item, vector in zip(ids.tolist(), items, vectors_array):
+                    self.vectors[item_id] = vector
+                    self.metadata[str(item_id)] = self._item_data(item)
+                    self._index_attributes(item_id, self.metadata[str(item_id)])
+                self._maybe_rebuild_index()
             
-            # Save index
-            self._save_index()
+            # Persisted by the background flusher
+            self._mark_dirty(len(items))
             
             logger.info(f"Bulk added {len(items)} memory items to Faiss")
             
@@ -319,37 +619,80 @@ class MemoryManager:
                 except Exception as e2:
                     logger.error(f"Error in fallback add: {str(e2)}")
 
-    def delete_by_session(self, session_id: str):
+    def _item_data(self, item: MemoryItem) -> Dict[str, Any]:
+        data = item.to_dict()
+        if data["expires_at"] is None and self.default_ttl is not None:
+            created = _parse_time(data["timestamp"]) or datetime.now()
+            data["expires_at"] = (created + timedelta(seconds=self.default_ttl)).isoformat()
+        return data
+    
+    def remove_ids(self, ids: List[int]) -> int:
+        """
+        Remove items by id from the index, metadata and stored vectors.
+        
+        Returns:
+            Number of items removed
+        """
+        with self._lock:
+            ids = [int(i) for i in ids if int(i) in self.vectors or str(int(i)) in self.metadata]
+            if not ids:
+                return 0
+            try:
+                self.index.remove_ids(faiss.IDSelectorBatch(np.array(ids, dtype=np.int64)))
+                rebuild = False
+            except RuntimeError:
+                # HNSW cannot delete in place; rebuild from the stored vectors instead
+                rebuild = True
+            for item_id in ids:
+                item_data = self.metadata.pop(str(item_id), None)
+                if item_data is not None:
+                    self._unindex_attributes(item_id, item_data)
+                self.vectors.pop(item_id, None)
+            if rebuild:
+                self._rebuild_index()
+            else:
+                self._maybe_rebuild_index()
+        self._mark_dirty(len(ids))
+        return len(ids)
+    
+    def delete_by_session(self, session_id: str) -> int:
         """
         Delete all memory items for a specific session
         
         Args:
             session_id: Session ID to delete
             
-        Note: Faiss doesn't support direct deletion. We need to rebuild the index.
+        Returns:
+            Number of items deleted
         """
         try:
-            # Find items to keep (not matching session_id)
-            items_to_keep = []
-            new_metadata = {}
-            
-            for item_id, item_data in self.metadata.items():
-                if item_data.get("session_id") != session_id:
-                    items_to_keep.append(MemoryItem.from_dict(item_data))
-            
-            # Count how many items we're removing
-            removed_count = len(self.metadata) - len(items_to_keep)
+            with self._lock:
+                ids = list(self._by_session.get(session_id, ()))
+            removed_count = self.remove_ids(ids)
             
             if removed_count > 0:
-                # Create a new index
-                self._create_new_index()
-                
-                # Re-add all items to keep
-                self.bulk_add(items_to_keep)
-                
                 logger.info(f"Deleted {removed_count} memory items for session {session_id}")
             else:
                 logger.info(f"No items found for session {session_id}")
+            return removed_count
                 
         except Exception as e:
-            logger.error(f"Error deleting session memories: {str(e)}")
\ No newline at end of file
+            logger.error(f"Error deleting session memories: {str(e)}")
+            return 0
+    
+    def expire(self, now: Optional[datetime] = None) -> int:
+        """
+        Drop items past their expires_at, and every item of sessions idle for
+        longer than session_ttl. Runs periodically on the background worker.
+        
+        Returns:
+            Number of items removed
+        """
+        now = now or datetime.now()
+        with self._lock:
+            self._last_compaction = time.monotonic()
+            expired = self._expired_ids(now)
+            removed = self.remove_ids(list(expired))
+        if removed:
+            logger.info(f"Expired {removed} memory items from {self.collection_name}")
+        return removed
@@ -2,6 +2,8 @@
 
 import os
 import sys
+import asyncio
+import anyio
 from typing import Optional, Any, List, Dict
 from mcp import ClientSession, StdioServerParameters
 from mcp.client.stdio import stdio_client
@@ -50,18 +52,208 @@ class MCP:
                 await session.initialize()
                 return await session.call_tool(tool_name, arguments=arguments)
             
+class PersistentMCPSession:
+    """
+    Long-lived MCP session over stdio transport.
+    A dedicated owner task keeps the stdio_client/ClientSession contexts open
+    (anyio requires they are closed by the task that opened them) while any
+    number of callers share the initialized session.
+    """
+    def __init__(self, config: dict, health_check_timeout: float = 5.0):
+        self.config = config
+        self.health_check_timeout = health_check_timeout
+        self.session: Optional[ClientSession] = None
+        self.restarts = 0
+        self._runner: Optional[asyncio.Task] = None
+        self._ready: Optional[asyncio.Event] = None
+        self._closing: Optional[asyncio.Event] = None
+        self._error: Optional[BaseException] = None
+        self._lock = asyncio.Lock()
+
+    def is_alive(self) -> bool:
+        return (
+            self._runner is not None
+            and not self._runner.done()
+            and self.session is not None
+        )
+
+    async def start(self):
+        async with self._lock:
+            if self.is_alive():
+                return
+            await self._stop_runner()
+            self._error = None
+            self._ready = asyncio.Event()
+            self._closing = asyncio.Event()
+            self._runner = asyncio.create_task(self._run())
+            await self._ready.wait()
+            if self.session is None:
+                raise RuntimeError(
+                    f"Failed to start MCP server {self.config['script']}: {self._error}"
+                )
+
+    async def _run(self):
+        params = StdioServerParameters(
+            command=sys.executable,
+            args=[self.config["script"]],
+            cwd=self.config.get("cwd", os.getcwd())
+        )
+        try:
+            async with stdio_client(params) as (read, write):
+                async with ClientSession(read, write) as session:
+                    await session.initialize()
+                    self.session = session
+                    self._ready.set()
+                    await self._closing.wait()
+        except Exception as e:
+            self._error = e
+            print(f"❌ MCP session for {self.config['script']} terminated: {e}")
+        finally:
+            self.session = None
+            self._ready.set()
+
+    async def _stop_runner(self):
+        if self._runner is None:
+            return
+        if not self._runner.done():
+            self._closing.set()
+            try:
+                await asyncio.wait_for(self._runner, timeout=self.health_check_timeout)
+            except (asyncio.TimeoutError, Exception):
+                self._runner.cancel()
+        self._runner = None
+        self.session = None
+
+    async def restart(self, stale: Optional[ClientSession] = None):
+        """Respawn the server unless another caller already replaced the stale session."""
+        async with self._lock:
+            if self.is_alive() and self.session is not stale:
+                return
+            print(f"🔁 Respawning MCP server {self.config['script']}")
+            await self._stop_runner()
+            self.restarts += 1
+        await self.start()
+
+    async def health_check(self) -> bool:
+        if not self.is_alive():
+            return False
+        try:
+            await asyncio.wait_for(self.session.send_ping(), timeout=self.health_check_timeout)
+            return True
+        except Exception:
+            return False
+
+    async def list_tools(self):
+        if not self.is_alive():
+            await self.start()
+        tools_result = await self.session.list_tools()
+        return tools_result.tools
+
+    async def call_tool(self, tool_name: str, arguments: dict) -> Any:
+        if not self.is_alive():
+            await self.restart(stale=self.session)
+        session = self.session
+        try:
+            return await session.call_tool(tool_name, arguments)
+        except (anyio.ClosedResourceError, anyio.BrokenResourceError):
+            # The session's write stream was already closed, so the request was
+            # never sent: replaying it on a fresh server cannot run the tool twice.
+            await self.restart(stale=session)
+            return await self.session.call_tool(tool_name, arguments)
+        except Exception:
+            # The request may have reached the server (and the tool may have run),
+            # so never replay it; just respawn a dead server for the next call.
+            if not await self.health_check():
+                try:
+                    await self.restart(stale=session)
+                except Exception as e:
+                    print(f"❌ Could not respawn MCP server {self.config['script']}: {e}")
+            raise
+
+    async def close(self):
+        async with self._lock:
+            await self._stop_runner()
+
+
+class MCPServerPool:
+    """
+    Fixed-size pool of persistent sessions for one MCP server config.
+    Calls are spread round-robin; a single ClientSession already multiplexes
+    concurrent requests, so pool_size > 1 only helps CPU-bound servers.
+    """
+    def __init__(self, config: dict, pool_size: int = 1, health_check_timeout: float = 5.0):
+        self.config = config
+        self.sessions = [
+            PersistentMCPSession(config, health_check_timeout=health_check_timeout)
+            for _ in range(max(1, pool_size))
+        ]
+        self._next = 0
+
+    async def start(self):
+        await asyncio.gather(*(session.start() for session in self.sessions))
+
+    def _pick(self) -> PersistentMCPSession:
+        session = self.sessions[self._next % len(self.sessions)]
+        self._next += 1
+        return session
+
+    async def list_tools(self):
+        return await self.sessions[0].list_tools()
+
+    async def call_tool(self, tool_name: str, arguments: dict) -> Any:
+        return await self._pick().call_tool(tool_name, arguments)
+
+    async def health_check(self):
+        """Ping every session and respawn the ones that crashed or stopped answering."""
+        for session in self.sessions:
+            stale = session.session
+            if not await session.health_check():
+                try:
+                    await session.restart(stale=stale)
+                except Exception as e:
+                    print(f"❌ Could not respawn MCP server {self.config['script']}: {e}")
+
+    async def close(self):
+        await asyncio.gather(*(session.close() for session in self.sessions), return_exceptions=True)
+
+
 class MultiMCP:
     """
-    Stateless version: discovers tools from multiple MCP servers, but reconnects per tool call.
-    Each call_tool() uses a fresh session based on tool-to-server mapping.
+    Discovers tools from multiple MCP servers and routes each tool call to its server.
+
+    mode="stateless": reconnects per tool call (a fresh subprocess + session each time).
+    mode="pooled": keeps pool_size long-lived sessions per server, health-checks them
+    every health_check_interval seconds and respawns crashed servers.
     """
     
-    def __init__(self, server_config: List[dict]):
+    def __init__(
+            self,
+            server_config: List[dict],
+            mode: str = "stateless",
+            pool_size: int = 1,
+            health_check_interval: float = 30.0,
+            health_check_timeout: float = 5.0
+            ):
+        if mode not in ("stateless", "pooled"):
+            raise ValueError(f"Unsupported MCP session mode: {mode}")
         self.server_config = server_config
+        self.mode = mode
+        self.pool_size = pool_size
+        self.health_check_interval = health_check_interval
+        self.health_check_timeout = health_check_timeout
         self.tool_map: Dict[str, Dict[str, Any]] = {} # tool_name -> {config, tool}
+        self.pools: Dict[str, MCPServerPool] = {} # server id -> pool (pooled mode only)
+        self._monitor: Optional[asyncio.Task] = None
+
+    @staticmethod
+    def _server_key(config: dict) -> str:
+        return config.get("id", config["script"])
 
     async def initialize(self):
         print("In MultiMCP initialize")
+        if self.mode == "pooled":
+            await self._initialize_pooled()
+            return
         for config in self.server_config:
             try:
                 params = StdioServerParameters(
@@ -89,12 +281,47 @@ class MultiMCP:
             except Exception as e:
                 print(f"❌ Error initializing MCP server {config['script']}: {e}")
 
+    async def _initialize_pooled(self):
+        for config in self.server_config:
+            pool = MCPServerPool(
+                config,
+                pool_size=self.pool_size,
+                health_check_timeout=self.health_check_timeout
+            )
+            try:
+                print(f"→ Starting {len(pool.sessions)} session(s) for: {config['script']} in {config.get('cwd', '')}")
+                await pool.start()
+                tools = await pool.list_tools()
+                print(f"→ Tools received: {[tool.name for tool in tools]}")
+            except Exception as e:
+                print(f"❌ Error initializing MCP server {config['script']}: {e}")
+                await pool.close()
+                continue
+            self.pools[self._server_key(config)] = pool
+            for tool in tools:
+                self.tool_map[tool.name] = {
+                    "config": config,
+                    "tool": tool
+                }
+        if self.pools and self.health_check_interval and self.health_check_interval > 0:
+            self._monitor = asyncio.create_task(self._monitor_pools())
+
+    async def _monitor_pools(self):
+        while True:
+            await asyncio.sleep(self.health_check_interval)
+            for pool in list(self.pools.values()):
+                await pool.health_check()
+
     async def call_tool(self, tool_name: str, arguments: dict) -> Any:
         entry = self.tool_map.get(tool_name)
         if not entry:
             raise ValueError(f"Tool '{tool_name}' not found on any server.")
 
         config = entry["config"]
+        pool = self.pools.get(self._server_key(config))
+        if pool is not None:
+            return await pool.call_tool(tool_name, arguments)
+
         params = StdioServerParameters(
             command=sys.executable,
             args=[config["script"]],
@@ -113,8 +340,13 @@ class MultiMCP:
         return [entry["tool"] for entry in self.tool_map.values()]
 
     async def shutdown(self):
-        pass  # no persistent sessions to close      
-
-            
-
-        
\ No newline at end of file
+        """Stop the health monitor and close every pooled session (no-op in stateless mode)."""
+        if self._monitor is not None:
+            self._monitor.cancel()
+            try:
+                await self._monitor
+            except asyncio.CancelledError:
+                pass
+            self._monitor = None
+        pools, self.pools = list(self.pools.values()), {}
+        await asyncio.gather(*(pool.close() for pool in pools), return_exceptions=True)
@@ -8,12 +8,78 @@ if str(ROOT) not in sys.path:
 
 from src.core.agent.modules.perception.perception import PerceptionResult
 from src.core.agent.common.memory_store.memory import MemoryItem
-from src.core.agent.common.llm.model_manager import ModelManager
-from typing import List, Optional
+from src.core.agent.common.llm.model_manager import ModelManager, get_model_manager
+from typing import Awaitable, Callable, List, Optional, Tuple
+import json
 from src.common.logger.logger import get_logger
 logger = get_logger()
 
-model = ModelManager()
+model: Optional[ModelManager] = None  # None → the shared get_model_manager(); assign to override
+
+
+def get_model() -> ModelManager:
+    return model or get_model_manager()
+
+
+class FinalAnswerStream:
+    """
+    Incremental version of the line scan at the end of generate_plan: feed it
+    LLM chunks and it returns the part of the first FINAL_ANSWER line to show
+    the user. A first marker line of FUNCTION_CALL means nothing is forwarded.
+    """
+    def __init__(self):
+        self.line = ""
+        self.in_answer = False
+        self.started = False  # leading spaces after the marker are dropped
+        self.finished = False
+
+    def feed(self, chunk: str) -> str:
+        out = []
+        for char in chunk:
+            if self.finished:
+                break
+            if self.in_answer:
+                if char == "\n":
+                    self.finished = True
+                elif self.started or not char.isspace():
+                    self.started = True
+                    out.append(char)
+                continue
+            if char == "\n":
+                self.line = ""
+                continue
+            self.line += char
+            head = self.line.lstrip()
+            if head.startswith("FINAL_ANSWER:"):
+                self.in_answer = True
+            elif head.startswith("FUNCTION_CALL:"):
+                self.finished = True
+        return "".join(out)
+
+
+# Examples and rules shared by the planning prompts (generate_plan, generate_fused_plan)
+PLAN_RULES = """✅ Examples: 
+- User asks: calculate projectile range Velocity=20m/s and angle=45°
+- FUNCTION_CALL: {"name": "horizontal_range", "args": {"v0": 20, "angle": 45, "g": 9.8}}  
+- FINAL_ANSWER: The projectile will travel approximately 40.8 meters horizontally.
+
+✅ Examples:
+- User asks: "What's the relationship between Cricket and Sachin Tendulkar"
+  - FUNCTION_CALL: {"name": "search_documents", "args": {"query": "relationship between Cricket and Sachin Tendulkar"}}
+  - [receives a detailed document]
+  - FINAL_ANSWER: Sachin Tendulkar is widely regarded as the "God of Cricket" due to his exceptional skills, longevity, and impact on the sport in India. He is the leading run-scorer in both Test and ODI cricket, and the first to score 100 centuries in international cricket. His influence extends beyond his statistics, as he is seen as a symbol of passion, perseverance, and a national icon.
+
+IMPORTANT:
+- 🚫 Do NOT invent tools. Use only the tools listed below.
+- 📄 If the question may relate to factual knowledge, use the 'search_documents' tool to look for the answer.
+- 🧮 If the question is mathematical or needs calculation, use the appropriate math tool.
+- 🤖 NEVER REPEAT THE SAME EXACT TOOL CALL. If you called a tool and got a result, either extract the answer from it or try a different tool/parameters.
+- If the previous tool output already contains factual information, DO NOT search again. Instead, summarize the relevant facts and respond with: FINAL_ANSWER: [your answer]
+- ❌ Do NOT output unstructured responses.
+- 🧠 Think before each step. Verify intermediate results mentally before proceeding.
+- 💥 If unsure or no tool fits, skip to FINAL_ANSWER: [unknown]
+- ✅ You have only 3 attempts. Final attempt must be FINAL_ANSWER
+"""
 
 
 async def generate_plan(
@@ -21,12 +87,28 @@ async def generate_plan(
     memory_items: List[MemoryItem],
     tool_descriptions: Optional[str] = None,
     step_num: int = 1,
-    max_steps: int = 3
+    max_steps: int = 3,
+    on_token: Optional[Callable[[str], Awaitable[None]]] = None,
+    max_calls: int = 1
 ) -> str:
-    """Generates the next step plan for the agent: either tool usage or final answer."""
+    """
+    Generates the next step plan for the agent: either tool usage or final answer.
+    With on_token the LLM output is streamed and the FINAL_ANSWER text is passed
+    to on_token as it arrives; the returned plan is the same either way.
+    With max_calls > 1 the plan may hold up to max_calls independent
+    FUNCTION_CALL lines (newline separated) to be run in parallel.
+    """
 
     memory_texts = "\n".join(f"- {m.text}" for m in memory_items) or "None"
     tool_context = f"\nYou have access to the following tools:\n{tool_descriptions}" if tool_descriptions else ""
+    if max_calls > 1:
+        format_rule = (
+            f"- Respond with EXACTLY ONE FINAL_ANSWER, or with 1 to {max_calls} FUNCTION_CALL lines (one per line) when the calls\n"
+            "  are independent of each other (e.g. search_documents and web_search for the same question). They run in parallel,\n"
+            "  so never put a call that needs another call's result in the same step."
+        )
+    else:
+        format_rule = "- Respond using EXACTLY ONE of the formats above per step."
 
     prompt = f"""
 You are a reasoning-driven AI agent with access to tools. Your job is to solve the user's request step-by-step by reasoning
@@ -52,7 +134,7 @@ Always follow the loop:
 {memory_texts}
 
 Guidelines:
-- Respond using EXACTLY ONE of the formats above per step.
+{format_rule}
 - Do NOT include extra text, explanation, or formatting.
 - Use nested keys (e.g., input.string) and square brackets and lists.
 
@@ -65,38 +147,37 @@ Input Summary:
 - Entities: {', '.join(perception.entities)}
 - Tool hint: {perception.tool_hint or 'None'}
 
-✅ Examples: 
-- User asks: calculate projectile range Velocity=20m/s and angle=45°
-- FUNCTION_CALL: {{"name": "horizontal_range", "args": {{"v0": 20, "angle": 45, "g": 9.8}}}}  
-- FINAL_ANSWER: The projectile will travel approximately 40.8 meters horizontally.
-
-✅ Examples:
-- User asks: "What's the relationship between Cricket and Sachin Tendulkar"
-  - FUNCTION_CALL: {{"name": "search_documents", "args": {{"query": "relationship between Cricket and Sachin Tendulkar"}}}}
-  - [receives a detailed document]
-  - FINAL_ANSWER: Sachin Tendulkar is widely regarded as the "God of Cricket" due to his exceptional skills, longevity, and impact on the sport in India. He is the leading run-scorer in both Test and ODI cricket, and the first to score 100 centuries in international cricket. His influence extends beyond his statistics, as he is seen as a symbol of passion, perseverance, and a national icon.
-
-IMPORTANT:
-- 🚫 Do NOT invent tools. Use only the tools listed below.
-- 📄 If the question may relate to factual knowledge, use the 'search_documents' tool to look for the answer.
-- 🧮 If the question is mathematical or needs calculation, use the appropriate math tool.
-- 🤖 NEVER REPEAT THE SAME EXACT TOOL CALL. If you called a tool and got a result, either extract the answer from it or try a different tool/parameters.
-- If the previous tool output already contains factual information, DO NOT search again. Instead, summarize the relevant facts and respond with: FINAL_ANSWER: [your answer]
-- ❌ Do NOT output unstructured responses.
-- 🧠 Think before each step. Verify intermediate results mentally before proceeding.
-- 💥 If unsure or no tool fits, skip to FINAL_ANSWER: [unknown]
-- ✅ You have only 3 attempts. Final attempt must be FINAL_ANSWER
-"""
+{PLAN_RULES}"""
 
 
 
     try:
-        raw = (await model.generate_text(prompt)).strip()
+        if on_token is None:
+            raw = (await get_model().generate_text(prompt, temperature=0.0, cache=True)).strip()
+        else:
+            answer, parts = FinalAnswerStream(), []
+            async for chunk in get_model().stream_text(prompt, temperature=0.0, cache=True):
+                parts.append(chunk)
+                text = answer.feed(chunk)
+                if text:
+                    await on_token(text)
+            raw = "".join(parts).strip()
         logger.info(f"plan, LLM output: {raw}")
 
+        calls = []
         for line in raw.splitlines():
-            if line.strip().startswith("FUNCTION_CALL:") or line.strip().startswith("FINAL_ANSWER:"):
-                return line.strip()
+            line = line.strip()
+            if line.startswith("FINAL_ANSWER:"):
+                if not calls:
+                    return line
+                break
+            if line.startswith("FUNCTION_CALL:"):
+                if line not in calls:
+                    calls.append(line)
+                if len(calls) >= max_calls:
+                    break
+        if calls:
+            return "\n".join(calls)
 
         return "FINAL_ANSWER: [unknown]"
 
@@ -104,3 +185,111 @@ IMPORTANT:
         logger.error(f"plan, ⚠️ Planning failed: {e}", exc_info=True)
         return "FINAL_ANSWER: [unknown]"
 
+
+def _function_call_payload(plan: str) -> Optional[dict]:
+    """JSON payload of a FUNCTION_CALL line, with the same clean-up parse_function_call applies"""
+    json_str = plan[len("FUNCTION_CALL:"):].strip()
+    json_str = json_str.replace("'", '"').replace("None", "null").replace("True", "true").replace("False", "false")
+    try:
+        payload = json.loads(json_str)
+    except json.JSONDecodeError:
+        return None
+    return payload if isinstance(payload, dict) and payload.get("name") else None
+
+
+def parse_fused_output(raw: str, user_input: str) -> Optional[Tuple[PerceptionResult, str]]:
+    """
+    Split a fused response into (perception, plan). Returns None when there is no
+    usable plan line (or its FUNCTION_CALL JSON is malformed), so the caller can
+    fall back to the two-call path. A missing or malformed PERCEPTION line only
+    costs the hint: the plan is still used.
+    """
+    perception, plan = None, None
+    for line in raw.splitlines():
+        line = line.strip().strip("`")
+        if perception is None and line.startswith("PERCEPTION:"):
+            try:
+                parsed = json.loads(line[len("PERCEPTION:"):].strip())
+                if isinstance(parsed, dict):
+                    if isinstance(parsed.get("entities"), dict):
+                        parsed["entities"] = list(parsed["entities"].values())
+                    parsed["entities"] = [str(e) for e in parsed.get("entities") or []]
+                    parsed["user_input"] = user_input
+                    perception = PerceptionResult(**parsed)
+            except Exception as e:
+                logger.warning(f"plan, fused PERCEPTION line unusable: {e}")
+        elif plan is None and (line.startswith("FUNCTION_CALL:") or line.startswith("FINAL_ANSWER:")):
+            plan = line
+    if plan is None or (plan.startswith("FUNCTION_CALL:") and _function_call_payload(plan) is None):
+        return None
+    return perception or PerceptionResult(user_input=user_input), plan
+
+
+async def generate_fused_plan(
+    user_input: str,
+    memory_items: List[MemoryItem],
+    tool_descriptions: Optional[str] = None,
+    step_num: int = 1,
+    max_steps: int = 3,
+    on_token: Optional[Callable[[str], Awaitable[None]]] = None
+) -> Optional[Tuple[PerceptionResult, str]]:
+    """
+    Perception and planning in one LLM call: returns (perception, plan), or None
+    when the output cannot be parsed and the two-call path should run instead.
+    Only a FINAL_ANSWER line is streamed to on_token, so a fallback never
+    follows streamed text.
+    """
+
+    memory_texts = "\n".join(f"- {m.text}" for m in memory_items) or "None"
+    tool_context = f"\nYou have access to the following tools:\n{tool_descriptions}" if tool_descriptions else ""
+
+    prompt = f"""
+You are a reasoning-driven AI agent with access to tools. In ONE response, first extract structured
+facts from the user input, then decide the next step.
+
+Respond with EXACTLY two lines:
+PERCEPTION: {{"intent": "brief phrase about what the user wants", "entities": ["keywords or values"], "tool_hint": "name of the most useful tool, or null"}}
+then either
+FUNCTION_CALL: {{"name": "function name", "args": {{}}}}
+or
+FINAL_ANSWER: [your final result]
+
+
+🧠 Context:
+- Step: {step_num} of {max_steps}
+
+- Tool Context:
+{tool_context}
+
+- You can reference these relevant memories:
+{memory_texts}
+
+Guidelines:
+- The PERCEPTION line is a single-line JSON object.
+- Do NOT include extra text, explanation, or formatting.
+- Use nested keys (e.g., input.string) and square brackets and lists.
+
+Static Case:
+- Atleast perform search_documents tool once before using web_search tool
+
+User input: "{user_input}"
+
+{PLAN_RULES}"""
+
+    try:
+        if on_token is None:
+            raw = (await get_model().generate_text(prompt, temperature=0.0, cache=True)).strip()
+        else:
+            answer, parts = FinalAnswerStream(), []
+            async for chunk in get_model().stream_text(prompt, temperature=0.0, cache=True):
+                parts.append(chunk)
+                text = answer.feed(chunk)
+                if text:
+                    await on_token(text)
+            raw = "".join(parts).strip()
+        logger.info(f"plan, fused LLM output: {raw}")
+        return parse_fused_output(raw, user_input)
+
+    except Exception as e:
+        logger.error(f"plan, ⚠️ Fused planning failed: {e}", exc_info=True)
+        return None
@@ -7,15 +7,18 @@ if str(ROOT) not in sys.path:
     sys.path.append(str(ROOT))
 
 
-from src.core.agent.modules.tools.tools import summarize_tools
-from src.core.agent.common.llm.model_manager import ModelManager
+from src.core.agent.common.llm.model_manager import ModelManager, get_model_manager
 from typing import List, Optional
 from pydantic import BaseModel
 import re
 
 
-model = ModelManager()
-tool_context = summarize_tools(model.get_all_tools()) if hasattr(model, "get_all_tools") else ""
+model: Optional[ModelManager] = None  # None → the shared get_model_manager(); assign to override
+tool_context = ""  # ModelManager exposes no tools; set to summarize_tools(...) to list them in the prompt
+
+
+def get_model() -> ModelManager:
+    return model or get_model_manager()
 
 
 class PerceptionResult(BaseModel):
@@ -50,7 +53,8 @@ Output only the dictionary on a single line. Do NOT wrap it in ```json or other
 """
 
     try:
-        response = await model.generate_text(prompt)
+        # Deterministic and cached: identical questions reuse the extraction
+        response = await get_model().generate_text(prompt, temperature=0.0, cache=True)
 
         # Clean up raw if wrapped in markdown-style ```json
         raw = response.strip()
@@ -33,11 +33,11 @@ if str(ROOT) not in sys.path:
 
 
 from src.core.agent.modules.perception.perception import PerceptionResult
-from src.core.agent.modules.decision.decision import generate_plan
+from src.core.agent.modules.decision.decision import generate_plan, generate_fused_plan
 from src.core.agent.common.memory_store.memory import MemoryItem
 from src.core.agent.modules.tools.tools import summarize_tools, filter_tools_by_hint
 from src.core.agent.common.context import AgentContext
-from typing import Any
+from typing import Any, Awaitable, Callable, Optional, Tuple
 
 async def decide_next_action(
         context: AgentContext,
@@ -45,16 +45,33 @@ async def decide_next_action(
         memory_items: list[Any],
         all_tools: list[Any],
         last_result: str = "",
+        on_token: Optional[Callable[[str], Awaitable[None]]] = None,
 ) -> str:
     """
     Decides what to do next using the planning strategy defined in agent profile.
     Wraps around the `generate_plan()` logic with strategy-aware control.
+    on_token streams final-answer text from the plan that will be returned
+    (with retry_once only the retry streams, so a discarded [unknown] is never sent).
     """
     strategy = context.agent_profile.strategy
     step = context.step +1
     max_steps = context.agent_profile.max_steps
     tool_hint = perception.tool_hint
 
+    if strategy == "explore_all":
+        # Offer every tool and let the planner fan out independent calls in one step
+        plan = await generate_plan(
+            perception=perception,
+            memory_items=memory_items,
+            tool_descriptions=summarize_tools(all_tools),
+            step_num=step,
+            max_steps=max_steps,
+            on_token=on_token,
+            max_calls=context.agent_profile.max_parallel_calls
+        )
+        print(plan)
+        return plan
+
     # print("In decision")
     # Step 1: Try hint-based filtered tools first
     filtered_tools = filter_tools_by_hint(all_tools, hint=tool_hint)
@@ -66,7 +83,8 @@ async def decide_next_action(
         memory_items=memory_items,
         tool_descriptions=filtered_summary,
         step_num=step,
-        max_steps=max_steps
+        max_steps=max_steps,
+        on_token=None if strategy == "retry_once" else on_token
     )
     print(plan)
     # Strategy enforcement
@@ -76,16 +94,42 @@ async def decide_next_action(
     if strategy == "retry_once" and "unknown" in plan.lower():
         # Retry with all tools if hint-based filtering failed
         full_summary = summarize_tools(all_tools)
-        return generate_plan(
+        return await generate_plan(
             perception=perception,
             memory_items=memory_items,
             tool_descriptions=full_summary,
             step_num=step,
             max_steps=max_steps,
+            on_token=on_token,
         )
 
-    # Placeholder for future "explore_all" parallel planner
     return plan
 
 
-
+async def decide_fused_action(
+        context: AgentContext,
+        query: str,
+        memory_items: list[Any],
+        all_tools: list[Any],
+        on_token: Optional[Callable[[str], Awaitable[None]]] = None,
+) -> Optional[Tuple[PerceptionResult, str]]:
+    """
+    Perception and planning in one LLM call (strategy.planning: fused).
+    Returns (perception, plan), or None when the caller should fall back to
+    extract_perception() + decide_next_action().
+    """
+    strategy = context.agent_profile.strategy
+    fused = await generate_fused_plan(
+        user_input=query,
+        memory_items=memory_items,
+        tool_descriptions=summarize_tools(all_tools),  # no hint yet, so every tool is offered
+        step_num=context.step + 1,
+        max_steps=context.agent_profile.max_steps,
+        on_token=None if strategy == "retry_once" else on_token
+    )
+    if fused is not None:
+        print(fused[1])
+    if fused is not None and strategy == "retry_once" and "unknown" in fused[1].lower():
+        # Let the two-call path run its hint-filtered attempt and retry
+        return None
+    return fused
@@ -21,6 +21,9 @@ if str(ROOT) not in sys.path:
     sys.path.append(str(ROOT))
 
 from src.server.example3.schema.models import *
+from src.server.rag_server.common.index_store import get_index_snapshot
+from src.common.vector_index.index_factory import similarity_search
+from src.common.embedding.embedding_client import get_embedding_client
 from src.common.logger.logger import get_logger
 
 logger = get_logger()
@@ -52,9 +55,7 @@ class SearchResponse(BaseModel):
 def get_embedding(text: str):
     """Get embedding for text using local Ollama API"""
     try:
-        response = requests.post(EMBED_URL, json={"model": EMBED_MODEL, "prompt": text})
-        response.raise_for_status()
-        return np.array(response.json()["embedding"], dtype=np.float32)
+        return get_embedding_client(EMBED_URL, EMBED_MODEL).embed(text)
     except Exception as e:
         logger.error(f"Error getting embedding: {e}")
         raise
@@ -97,19 +98,16 @@ def vector_search(query_params: SearchQuery) -> SearchResponse:
     # query = input_data.query
     try:
         # Load index and metadata
-        if not INDEX_FILE.exists() or not METADATA_FILE.exists():
+        if not INDEX_FILE.exists():
             logger.error("Search index files not found")
             return SearchResponse(
                 results=[]
             )
         
         try:
-            # Load metadata
-            metadata = json.loads(METADATA_FILE.read_text())
-            # Load index
-            index = faiss.read_index(str(INDEX_FILE))
-            
-            logger.info(f"Successfully loaded index with {index.ntotal} vectors and {len(metadata)} metadata entries")
+            # Resident index: only re-read from disk when a new version was written
+            snapshot = get_index_snapshot()
+            index, metadata = snapshot.index, snapshot.metadata
             
             if index.ntotal == 0:
                 logger.warning("Index exists but contains no vectors")
@@ -131,16 +129,14 @@ def vector_search(query_params: SearchQuery) -> SearchResponse:
                 results=[]
             )
         
-        # Search
+        # Search (scores are cosine similarities)
         top_k = 3
-        k = min(top_k * 2, index.ntotal)  # Fetch more results than needed for filtering
-        D, I = index.search(query_embedding, k)
+        hits = similarity_search(index, query_embedding, top_k)
         
-        logger.info(f"Search returned {len(I[0])} initial results")
-        logger.info(f"Raw distances: {D[0]}")  # Log the raw distances for debugging
+        logger.info(f"Search returned {len(hits)} results, scores: {[round(score, 3) for _, score in hits]}")
         
         results = []
-        for i, (distance, idx) in enumerate(zip(D[0], I[0])):
+        for i, (idx, score) in enumerate(hits):
             if idx >= len(metadata) or idx < 0:
                 logger.warning(f"Invalid index {idx} found in search results (metadata length: {len(metadata)})")
                 continue
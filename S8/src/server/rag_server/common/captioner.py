@@ -0,0 +1,334 @@
+import base64
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from typing import Dict, List, Optional, Tuple
+import requests
+from PIL import Image
+from requests.adapters import HTTPAdapter
+import sys
+from pathlib import Path
+ROOT = Path(__file__).resolve().parents[4]
+
+if str(ROOT) not in sys.path:
+    sys.path.append(str(ROOT))
+
+from src.server.rag_server.common.config.rag_config import (
+    OLLAMA_BASE_URL, OLLAMA_CHAT_URL, OLLAMA_MODEL, MAX_IMAGE_SIZE, IMAGE_QUALITY,
+    CAPTION_MAX_SIZE, CAPTION_MAX_CONCURRENCY, CAPTION_TIMEOUT, CAPTION_CACHE_DB, OLLAMA_LIVENESS_TTL
+)
+from src.common.logger.logger import get_logger
+
+logger = get_logger()
+
+IMAGE_REF = re.compile(r'!\[(.*?)\]\((.*?)\)')
+
+CAPTION_PROMPT = "If there is lot of text in the image, then ONLY reply back with exact text in the image, else describe the image such that your response can replace 'alt-text' for it. Only explain the contents of the image and provide no further explanation."
+
+OLLAMA_UNAVAILABLE = "[Ollama service not available]"
+
+
+def resize_image(image_data, max_size=MAX_IMAGE_SIZE, quality=IMAGE_QUALITY):
+    """Resize image if it's too large."""
+    try:
+        img = Image.open(BytesIO(image_data))
+
+        # Only resize if either dimension is larger than max_size
+        if max(img.width, img.height) > max_size:
+            # Preserve aspect ratio
+            if img.width > img.height:
+                new_width = max_size
+                new_height = int(img.height * (max_size / img.width))
+            else:
+                new_height = max_size
+                new_width = int(img.width * (max_size / img.height))
+
+            logger.info(f"Resized image from {img.width}x{img.height} to {new_width}x{new_height}")
+            img = img.resize((new_width, new_height), Image.LANCZOS)
+
+        # JPEG has no alpha channel or palette
+        if img.mode not in ('RGB', 'L'):
+            img = img.convert('RGB')
+
+        # Save to BytesIO
+        output = BytesIO()
+        img.save(output, format="JPEG", quality=quality)
+        return output.getvalue()
+    except Exception as e:
+        logger.error(f"Error resizing image: {e}")
+        return image_data  # Return original if resize fails
+
+
+def caption_key(model_name: str, image_data: bytes) -> str:
+    """Content address of a caption: (vision model, image bytes hash)"""
+    return hashlib.sha256(model_name.encode("utf-8") + b"\0" + image_data).hexdigest()
+
+
+class CaptionCache:
+    """
+    Captions keyed by (model, image content hash): an in-memory LRU in front of
+    a sqlite table, so re-ingesting a document (or one that embeds the same
+    logo on every page) never captions the same image twice.
+    """
+    def __init__(self, max_entries: int = 10000, db_path: Optional[Path] = CAPTION_CACHE_DB):
+        self.max_entries = max_entries
+        self.db_path = Path(db_path) if db_path else None
+        self._memory: "OrderedDict[str, str]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self.hits = 0
+        self.misses = 0
+
+        if self.db_path is not None:
+            try:
+                self.db_path.parent.mkdir(parents=True, exist_ok=True)
+                self._conn = sqlite3.connect(str(self.db_path), check_same_thread=False)
+                self._conn.execute("PRAGMA journal_mode=WAL")
+                self._conn.execute(
+                    "CREATE TABLE IF NOT EXISTS captions ("
+                    "key TEXT PRIMARY KEY, model TEXT NOT NULL, caption TEXT NOT NULL, created_at REAL NOT NULL)"
+                )
+                self._conn.commit()
+            except sqlite3.Error as e:
+                logger.warning(f"Caption cache persistence disabled ({self.db_path}): {e}")
+                self._conn = None
+
+    def _remember(self, key: str, caption: str):
+        self._memory[key] = caption
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            caption = self._memory.get(key)
+            if caption is None and self._conn is not None:
+                row = self._conn.execute("SELECT caption FROM captions WHERE key = ?", (key,)).fetchone()
+                if row is not None:
+                    caption = row[0]
+                    self._remember(key, caption)
+            if caption is None:
+                self.misses += 1
+            else:
+                self._memory.move_to_end(key)
+                self.hits += 1
+            return caption
+
+    def put(self, key: str, model: str, caption: str):
+        with self._lock:
+            self._remember(key, caption)
+            if self._conn is not None:
+                try:
+                    self._conn.execute("INSERT OR REPLACE INTO captions VALUES (?, ?, ?, ?)", (key, model, caption, time.time()))
+                    self._conn.commit()
+                except sqlite3.Error as e:
+                    logger.warning(f"Failed to persist caption: {e}")
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "memory_entries": len(self._memory),
+            }
+
+
+_ollama_checked_at = 0.0
+_ollama_lock = threading.Lock()
+
+
+def ollama_available(session: requests.Session, ttl: float = OLLAMA_LIVENESS_TTL) -> bool:
+    """/api/version liveness check; a success is trusted for ttl seconds, a failure is not cached"""
+    global _ollama_checked_at
+    with _ollama_lock:
+        if time.monotonic() - _ollama_checked_at < ttl:
+            return True
+        try:
+            check_response = session.get(f"{OLLAMA_BASE_URL}/api/version", timeout=5)
+            if check_response.status_code != 200:
+                logger.error(f"❌ Ollama service not available: HTTP {check_response.status_code}")
+                return False
+        except requests.exceptions.RequestException:
+            logger.error("❌ Failed to connect to Ollama service. Is it running?")
+            return False
+        _ollama_checked_at = time.monotonic()
+        return True
+
+
+class ImageCaptioner:
+    """
+    Batch image captioning for markdown extracted from PDFs and web pages.
+
+    caption_sources() loads every referenced image once, serves repeats from
+    the CaptionCache, checks Ollama liveness once for the whole batch, then
+    downsizes the remaining images in a thread pool and captions them with
+    at most max_concurrency vision requests in flight.
+    """
+    def __init__(self,
+                 model_name: str = OLLAMA_MODEL,
+                 max_concurrency: int = CAPTION_MAX_CONCURRENCY,
+                 max_size: int = CAPTION_MAX_SIZE,
+                 timeout: float = CAPTION_TIMEOUT,
+                 cache: Optional[CaptionCache] = None):
+        self.model_name = model_name
+        self.max_concurrency = max(1, max_concurrency)
+        self.max_size = max_size
+        self.timeout = timeout
+        self.cache = cache if cache is not None else CaptionCache()
+        self._session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.max_concurrency + 4)
+        self._session.mount("http://", adapter)
+        self._session.mount("https://", adapter)
+
+    def _load(self, src: str) -> Tuple[Optional[bytes], Optional[str]]:
+        """(image bytes, None) or (None, placeholder text for the markdown)"""
+        try:
+            if src.startswith("http"):
+                response = self._session.get(src, timeout=30)
+                if response.status_code != 200:
+                    logger.error(f"❌ Failed to download image: HTTP {response.status_code}")
+                    return None, f"[Image download failed: {src}]"
+                return response.content, None
+
+            full_path = (ROOT / "resources" / "documents" / src).resolve()
+            if not full_path.exists():
+                logger.error(f"❌ Image file not found: {full_path}")
+                return None, f"[Image file not found: {src}]"
+            return full_path.read_bytes(), None
+        except Exception as e:
+            logger.error(f"⚠️ Failed to load image {src}: {e}", exc_info=True)
+            return None, f"[Image could not be processed: {src}]"
+
+    def _caption(self, image_data: bytes, max_retries: int = 1) -> Tuple[str, bool]:
+        """(caption, True) or (error placeholder, False); retries use smaller images"""
+        sizes = [self.max_size, 800, 600]
+        for attempt in range(max_retries):
+            try:
+                if attempt > 0:
+                    max_size = sizes[min(attempt, len(sizes) - 1)]
+                    image_data = resize_image(image_data, max_size=max_size)
+                    logger.info(f"Retry {attempt+1}/{max_retries} with max size {max_size}px")
+
+                chat_request_data = {
+                    "model": self.model_name,
+                    "messages": [
+                        {
+                            "role": "user",
+                            "content": CAPTION_PROMPT,
+                            "images": [base64.b64encode(image_data).decode("utf-8")]
+                        }
+                    ],
+                    "stream": False
+                }
+                response = self._session.post(OLLAMA_CHAT_URL, json=chat_request_data, timeout=self.timeout)
+                if response.status_code != 200:
+                    error_text = response.text
+                    logger.error(f"❌ Ollama API error: HTTP {response.status_code}, Response: {error_text}")
+                    if attempt < max_retries - 1:
+                        time.sleep(1)
+                        continue
+                    return f"[LLM API error: {response.status_code}] - {error_text[:100]}", False
+
+                data = response.json()
+                caption = (data.get("message", {}).get("content") or data.get("response") or "").strip()
+                logger.info(f"✅ Caption generated: {caption}")
+                return (caption, True) if caption else ("[No caption returned]", False)
+            except Exception as e:
+                logger.error(f"⚠️ Error during attempt {attempt+1}: {e}", exc_info=True)
+                if attempt < max_retries - 1:
+                    time.sleep(1)
+        return "[Image could not be processed]", False
+
+    def caption_sources(self, sources: List[str], max_retries: int = 1) -> Dict[str, str]:
+        """Caption every image URL/path in sources; returns {source: caption or placeholder}"""
+        unique = list(dict.fromkeys(sources))
+        if not unique:
+            return {}
+        logger.info(f"🖼️ Captioning {len(unique)} image(s)")
+
+        io_workers = min(len(unique), self.max_concurrency + 4)
+        with ThreadPoolExecutor(max_workers=io_workers) as pool:
+            loaded = list(pool.map(self._load, unique))
+
+        results: Dict[str, str] = {}
+        pending: Dict[str, Tuple[bytes, List[str]]] = {}  # cache key -> (image bytes, sources sharing it)
+        for src, (image_data, error) in zip(unique, loaded):
+            if image_data is None:
+                results[src] = error
+                continue
+            key = caption_key(self.model_name, image_data)
+            cached = self.cache.get(key)
+            if cached is not None:
+                results[src] = cached
+            elif key in pending:
+                pending[key][1].append(src)
+            else:
+                pending[key] = (image_data, [src])
+
+        if not pending:
+            return results
+
+        if not ollama_available(self._session):
+            for _, srcs in pending.values():
+                results.update((src, OLLAMA_UNAVAILABLE) for src in srcs)
+            return results
+
+        logger.info(f"🖼️ {len(unique) - len(pending)} caption(s) reused, {len(pending)} to generate")
+        with ThreadPoolExecutor(max_workers=min(len(pending), os.cpu_count() or 1)) as resize_pool, \
+                ThreadPoolExecutor(max_workers=min(len(pending), self.max_concurrency)) as caption_pool:
+            resized = {key: resize_pool.submit(resize_image, image_data, self.max_size) for key, (image_data, _) in pending.items()}
+            captions = {key: caption_pool.submit(lambda future: self._caption(future.result(), max_retries), future) for key, future in resized.items()}
+
+            for key, future in captions.items():
+                caption, ok = future.result()
+                if ok:
+                    self.cache.put(key, self.model_name, caption)
+                results.update((src, caption) for src in pending[key][1])
+        return results
+
+
+_default_captioner: Optional[ImageCaptioner] = None
+_default_captioner_lock = threading.Lock()
+
+
+def get_captioner() -> ImageCaptioner:
+    """Process-wide captioner (one HTTP pool and cache for every ingestion path)"""
+    global _default_captioner
+    with _default_captioner_lock:
+        if _default_captioner is None:
+            _default_captioner = ImageCaptioner()
+        return _default_captioner
+
+
+def caption_image(img_url_or_path: str, max_retries=1) -> str:
+    return get_captioner().caption_sources([img_url_or_path], max_retries=max_retries)[img_url_or_path]
+
+
+def replace_images_with_captions(markdown: str) -> str:
+    """Replace every ![alt](src) with **Image** <caption>; local images are deleted once captioned"""
+    sources = [match.group(2) for match in IMAGE_REF.finditer(markdown)]
+    if not sources:
+        return markdown
+    captions = get_captioner().caption_sources(sources)
+
+    for src in set(sources):
+        # Attempt to delete only if local and file exists
+        if src.startswith("http") or captions[src] == OLLAMA_UNAVAILABLE:
+            continue
+        img_path = ROOT / "resources" / "documents" / src
+        try:
+            if img_path.exists():
+                img_path.unlink()
+                logger.info(f"🗑️ Deleted image after captioning: {img_path}")
+        except OSError as e:
+            logger.warning(f"Could not delete image {img_path}: {e}")
+
+    return IMAGE_REF.sub(lambda match: f"**Image** {captions[match.group(2)]}", markdown)
@@ -0,0 +1,460 @@
+import json
+import sqlite3
+import numpy as np
+import threading
+from collections.abc import Sequence
+from dataclasses import asdict, dataclass, fields
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple, Union
+import sys
+ROOT = Path(__file__).resolve().parents[4]
+
+if str(ROOT) not in sys.path:
+    sys.path.append(str(ROOT))
+
+from src.server.rag_server.common.config.rag_config import CHUNK_DB, METADATA_FILE, CACHE_FILE
+from src.common.logger.logger import get_logger
+
+logger = get_logger()
+
+DOC_CACHE_COLUMNS = ("size", "mtime_ns", "inode", "doc_id", "first_id", "end_id")
+PENDING_HASH = "pending"  # doc_cache hash of a document committed in windows that has not finished yet
+
+CHUNK_TABLES = (
+    "CREATE TABLE IF NOT EXISTS {chunks} (faiss_id INTEGER PRIMARY KEY, doc_id TEXT, chunk_id TEXT, data TEXT NOT NULL);"
+    "CREATE TABLE IF NOT EXISTS {tombstones} (faiss_id INTEGER PRIMARY KEY);"
+)
+# Id layout the chunks table is numbered for; every compaction starts a new one
+LAYOUT_EPOCH = "COALESCE((SELECT CAST(value AS INTEGER) FROM store_meta WHERE key = 'layout_epoch'), 0)"
+
+
+@dataclass
+class DocCacheEntry:
+    """
+    doc_cache row for one file (or doc id). hash identifies the content; the stat
+    fields let an unchanged file be recognised without reading it, and
+    [first_id, end_id) are the FAISS ids its chunks were committed under (filled
+    in by the ingest writer) so a changed file's old chunks can be found. A
+    document committed in windows can share that range with other documents'
+    chunks, so only the ids whose chunk carries doc_id belong to it.
+    """
+    hash: str
+    size: Optional[int] = None
+    mtime_ns: Optional[int] = None
+    inode: Optional[int] = None
+    doc_id: Optional[str] = None
+    first_id: Optional[int] = None
+    end_id: Optional[int] = None
+
+    @classmethod
+    def coerce(cls, value: Union[str, dict, "DocCacheEntry"]) -> "DocCacheEntry":
+        """Entries are passed around as bare hashes (older callers, old WAL records), dicts (WAL) or entries"""
+        if isinstance(value, cls):
+            return value
+        if isinstance(value, dict):
+            return cls(**{f.name: value.get(f.name) for f in fields(cls)})
+        return cls(hash=value)
+
+    def stat_matches(self, stat) -> bool:
+        return (self.mtime_ns is not None
+                and (self.size, self.mtime_ns, self.inode) == (stat.st_size, stat.st_mtime_ns, stat.st_ino))
+
+    def to_dict(self) -> dict:
+        return asdict(self)
+
+
+class ChunkStore:
+    """
+    Append-only chunk metadata store backed by sqlite (WAL mode).
+
+    - One row per chunk keyed by its FAISS id, so lookup by search result is a
+      primary-key read instead of indexing into a fully parsed metadata.json
+    - Appends only write the new rows; nothing is rewritten per ingest
+    - doc_cache table replaces doc_index_cache.json (file/doc -> content hash,
+      file stat and the FAISS id range of its chunks, see DocCacheEntry)
+    - tombstones table holds the FAISS ids of replaced or deleted documents'
+      chunks; searches exclude them until compact() renumbers the survivors
+    - compact() starts a new id layout (layout_epoch) and keeps the previous
+      layout's rows as chunks_prev / tombstones_prev, so a snapshot of the
+      pre-compaction index.bin still reads the chunks its ids refer to (see
+      the epoch argument of the reads and ChunkView)
+    - On first open, an existing metadata.json / doc_index_cache.json is imported
+      once; the JSON files are left in place untouched
+    """
+    def __init__(self, db_path: Path = CHUNK_DB, metadata_file: Path = METADATA_FILE, cache_file: Path = CACHE_FILE):
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.db_path), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(
+            CHUNK_TABLES.format(chunks="chunks", tombstones="tombstones")
+            + CHUNK_TABLES.format(chunks="chunks_prev", tombstones="tombstones_prev")
+            + "CREATE INDEX IF NOT EXISTS chunks_doc_id ON chunks(doc_id);"
+            "CREATE TABLE IF NOT EXISTS doc_cache (key TEXT PRIMARY KEY, hash TEXT NOT NULL);"
+            "CREATE INDEX IF NOT EXISTS doc_cache_hash ON doc_cache(hash);"
+            "CREATE TABLE IF NOT EXISTS store_meta (key TEXT PRIMARY KEY, value TEXT);"
+        )
+        self._add_doc_cache_columns()
+        self._conn.commit()
+        self._migrate(Path(metadata_file), Path(cache_file))
+
+    # ---------- migration ----------
+    def _add_doc_cache_columns(self):
+        """Stores created before doc_cache tracked stat / id ranges only have (key, hash)"""
+        existing = {row[1] for row in self._conn.execute("PRAGMA table_info(doc_cache)")}
+        for column in DOC_CACHE_COLUMNS:
+            if column not in existing:
+                kind = "TEXT" if column == "doc_id" else "INTEGER"
+                self._conn.execute(f"ALTER TABLE doc_cache ADD COLUMN {column} {kind}")
+
+    def _migrate(self, metadata_file: Path, cache_file: Path):
+        with self._lock:
+            done = self._conn.execute("SELECT value FROM store_meta WHERE key = 'json_migrated'").fetchone()
+            if done:
+                return
+            try:
+                metadata = json.loads(metadata_file.read_text()) if metadata_file.exists() else []
+                cache_meta = json.loads(cache_file.read_text()) if cache_file.exists() else {}
+            except (OSError, ValueError) as e:
+                logger.error(f"Chunk store migration skipped, could not read JSON metadata: {e}")
+                return
+            with self._conn:
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO chunks VALUES (?, ?, ?, ?)",
+                    (self._row(i, record) for i, record in enumerate(metadata))
+                )
+                self._conn.executemany("INSERT OR REPLACE INTO doc_cache (key, hash) VALUES (?, ?)", cache_meta.items())
+                self._conn.execute("INSERT OR REPLACE INTO store_meta VALUES ('json_migrated', '1')")
+            if metadata or cache_meta:
+                logger.info(f"Migrated {len(metadata)} chunks and {len(cache_meta)} cache entries into {self.db_path.name}")
+
+    # ---------- reads ----------
+    @staticmethod
+    def _row(faiss_id: int, record: dict) -> tuple:
+        return (faiss_id, record.get("doc_id"), record.get("chunk_id"), json.dumps(record, ensure_ascii=False))
+
+    def count(self) -> int:
+        """Number of id slots in use (highest FAISS id + 1)"""
+        with self._lock:
+            row = self._conn.execute("SELECT MAX(faiss_id) FROM chunks").fetchone()
+        return 0 if row[0] is None else row[0] + 1
+
+    @staticmethod
+    def _layout_query(template: str, args: tuple, epoch: Optional[int]) -> Tuple[str, tuple]:
+        """
+        template (ending in a WHERE clause, with {chunks} / {tombstones} for the table
+        names) against id layout `epoch`: the current tables, or the ones kept from
+        before the last compaction. One statement, so a compaction committing in
+        between cannot mix the two. epoch=None reads the current layout.
+        """
+        current = template.format(chunks="chunks", tombstones="tombstones")
+        if epoch is None:
+            return current, tuple(args)
+        previous = template.format(chunks="chunks_prev", tombstones="tombstones_prev")
+        return (f"{current} AND {LAYOUT_EPOCH} = ? UNION ALL {previous} AND {LAYOUT_EPOCH} = ?",
+                (*args, epoch, *args, epoch + 1))
+
+    def get(self, faiss_id: int, epoch: Optional[int] = None) -> Optional[dict]:
+        query, args = self._layout_query("SELECT data FROM {chunks} WHERE faiss_id = ?", (int(faiss_id),), epoch)
+        with self._lock:
+            row = self._conn.execute(query, args).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def get_many(self, faiss_ids: Iterable[int], epoch: Optional[int] = None) -> Dict[int, dict]:
+        ids = [int(i) for i in faiss_ids]
+        found: Dict[int, dict] = {}
+        with self._lock:
+            for start in range(0, len(ids), 250):  # stay under sqlite's variable limit (ids appear twice per epoch query)
+                batch = ids[start:start + 250]
+                query, args = self._layout_query(
+                    f"SELECT faiss_id, data FROM {{chunks}} WHERE faiss_id IN ({','.join('?' * len(batch))})", batch, epoch
+                )
+                rows = self._conn.execute(query, args).fetchall()
+                found.update((faiss_id, json.loads(data)) for faiss_id, data in rows)
+        return found
+
+    def iter_range(self, start: int, end: int, epoch: Optional[int] = None) -> Iterable[dict]:
+        query, args = self._layout_query("SELECT faiss_id, data FROM {chunks} WHERE faiss_id >= ? AND faiss_id < ?", (start, end), epoch)
+        with self._lock:
+            rows = self._conn.execute(query + " ORDER BY faiss_id", args).fetchall()
+        return (json.loads(data) for _, data in rows)
+
+    def document_count(self, limit: Optional[int] = None, epoch: Optional[int] = None) -> int:
+        template, args = "SELECT doc_id FROM {chunks} WHERE faiss_id NOT IN (SELECT faiss_id FROM {tombstones})", ()
+        if limit is not None:
+            template, args = template + " AND faiss_id < ?", (limit,)
+        query, args = self._layout_query(template, args, epoch)
+        with self._lock:
+            return self._conn.execute(f"SELECT COUNT(DISTINCT doc_id) FROM ({query})", args).fetchone()[0]
+
+    def tombstone_ids(self, limit: Optional[int] = None, epoch: Optional[int] = None) -> np.ndarray:
+        """Sorted FAISS ids of chunks that are no longer searchable"""
+        template, args = "SELECT faiss_id FROM {tombstones} WHERE 1", ()
+        if limit is not None:
+            template, args = template + " AND faiss_id < ?", (limit,)
+        query, args = self._layout_query(template, args, epoch)
+        with self._lock:
+            rows = self._conn.execute(query + " ORDER BY faiss_id", args).fetchall()
+        return np.array([row[0] for row in rows], dtype=np.int64)
+
+    def layout(self) -> Tuple[int, Optional[dict]]:
+        """(current layout epoch, pending compaction or None) read together"""
+        with self._lock:
+            rows = dict(self._conn.execute(
+                "SELECT key, value FROM store_meta WHERE key IN ('layout_epoch', 'compaction')"
+            ).fetchall())
+        return int(rows.get("layout_epoch") or 0), json.loads(rows["compaction"]) if rows.get("compaction") else None
+
+    def tombstone_count(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM tombstones").fetchone()[0]
+
+    def tombstone_version(self) -> int:
+        """Bumped by every transaction that changes tombstones, so readers in any process can tell"""
+        return int(self.get_meta("tombstone_version") or 0)
+
+    def replaced_chunk_ids(self, key: str, entry: DocCacheEntry) -> List[int]:
+        """Live FAISS ids committed earlier under doc_cache key: the chunks of entry.doc_id in its
+        id range, or for entries written before ranges were tracked, chunks whose doc_id (or doc
+        file name) is the key"""
+        if entry.first_id is not None:
+            where, args = "faiss_id >= ? AND faiss_id < ?", (entry.first_id, entry.end_id)
+            if entry.doc_id is not None:
+                where, args = where + " AND doc_id = ?", args + (entry.doc_id,)
+        else:
+            where, args = "(doc_id = ? OR json_extract(data, '$.doc') = ?)", (entry.doc_id or key, key)
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT faiss_id FROM chunks WHERE {where} AND faiss_id NOT IN (SELECT faiss_id FROM tombstones)", args
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def get_meta(self, key: str) -> Optional[str]:
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM store_meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def cached_hash(self, key: str) -> Optional[str]:
+        with self._lock:
+            row = self._conn.execute("SELECT hash FROM doc_cache WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def doc_cache(self) -> Dict[str, str]:
+        with self._lock:
+            return dict(self._conn.execute("SELECT key, hash FROM doc_cache").fetchall())
+
+    def cached_entry(self, key: str) -> Optional[DocCacheEntry]:
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT hash, {', '.join(DOC_CACHE_COLUMNS)} FROM doc_cache WHERE key = ?", (key,)
+            ).fetchone()
+        return DocCacheEntry(*row) if row else None
+
+    def find_by_hash(self, content_hash: str) -> Optional[Tuple[str, DocCacheEntry]]:
+        """(key, entry) of a document already committed with this content hash, if any"""
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT key, hash, {', '.join(DOC_CACHE_COLUMNS)} FROM doc_cache WHERE hash = ? LIMIT 1", (content_hash,)
+            ).fetchone()
+        return (row[0], DocCacheEntry(*row[1:])) if row else None
+
+    def doc_cache_entries(self) -> Dict[str, DocCacheEntry]:
+        with self._lock:
+            rows = self._conn.execute(f"SELECT key, hash, {', '.join(DOC_CACHE_COLUMNS)} FROM doc_cache").fetchall()
+        return {row[0]: DocCacheEntry(*row[1:]) for row in rows}
+
+    # ---------- writes ----------
+    def _upsert_doc_cache(self, doc_cache: Dict[str, Union[str, dict, DocCacheEntry]]):
+        columns = ("key", "hash") + DOC_CACHE_COLUMNS
+        rows = []
+        for key, value in doc_cache.items():
+            entry = DocCacheEntry.coerce(value)
+            rows.append((key, entry.hash) + tuple(getattr(entry, column) for column in DOC_CACHE_COLUMNS))
+        self._conn.executemany(
+            f"INSERT OR REPLACE INTO doc_cache ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})", rows
+        )
+
+    def _add_tombstones(self, faiss_ids: Iterable[int]):
+        self._conn.executemany("INSERT OR IGNORE INTO tombstones VALUES (?)", ((int(i),) for i in faiss_ids))
+        self._conn.execute(
+            "INSERT INTO store_meta VALUES ('tombstone_version', '1') "
+            "ON CONFLICT(key) DO UPDATE SET value = CAST(value AS INTEGER) + 1"
+        )
+
+    def set_meta(self, key: str, value: Optional[str]):
+        with self._lock, self._conn:
+            if value is None:
+                self._conn.execute("DELETE FROM store_meta WHERE key = ?", (key,))
+            else:
+                self._conn.execute("INSERT OR REPLACE INTO store_meta VALUES (?, ?)", (key, value))
+
+    def update_doc_cache(self, doc_cache: Dict[str, Union[str, dict, DocCacheEntry]]):
+        """Upsert cache entries without touching chunks (e.g. refreshed stat of an unchanged file)"""
+        with self._lock, self._conn:
+            self._upsert_doc_cache(doc_cache)
+
+    def append(self, start_id: int, records: List[dict],
+               doc_cache: Optional[Dict[str, Union[str, dict, DocCacheEntry]]] = None,
+               tombstones: Optional[Iterable[int]] = None):
+        """
+        Write records as FAISS ids start_id.., upsert doc_cache entries and tombstone
+        the chunks they replace, in one transaction.
+        Rows at or beyond start_id are orphans of an interrupted save (the FAISS
+        index never reached them) and are replaced.
+        """
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM chunks WHERE faiss_id >= ?", (start_id,))
+            self._conn.executemany(
+                "INSERT INTO chunks VALUES (?, ?, ?, ?)",
+                (self._row(start_id + i, record) for i, record in enumerate(records))
+            )
+            if doc_cache:
+                self._upsert_doc_cache(doc_cache)
+            if tombstones:
+                self._add_tombstones(tombstones)
+
+    def delete_document(self, doc_id: str) -> int:
+        """Tombstone every live chunk of doc_id and drop the doc_cache entries pointing at it"""
+        with self._lock, self._conn:
+            ids = [row[0] for row in self._conn.execute(
+                "SELECT faiss_id FROM chunks WHERE doc_id = ? AND faiss_id NOT IN (SELECT faiss_id FROM tombstones)", (doc_id,)
+            )]
+            self._conn.execute("DELETE FROM doc_cache WHERE key = ? OR doc_id = ?", (doc_id, doc_id))
+            if ids:
+                self._add_tombstones(ids)
+        return len(ids)
+
+    def compact(self, dead: np.ndarray, total: int, meta: Optional[Dict[str, Optional[str]]] = None):
+        """
+        Start a new id layout without the dead chunks among the first `total` ids: the
+        rest are renumbered to 0..total-len(dead)-1 in order, doc_cache id ranges are
+        shifted to match, and the tombstones start empty. The old tables are kept as
+        chunks_prev / tombstones_prev for snapshots still on the previous index.bin.
+        meta rows are written (None deletes) in the same transaction.
+        """
+        dead = np.asarray(dead, dtype=np.int64)
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM chunks WHERE faiss_id >= ?", (total,))  # orphans of an interrupted commit
+            self._conn.execute("DROP TABLE chunks_prev")
+            self._conn.execute("DROP TABLE tombstones_prev")
+            self._conn.execute("DROP INDEX IF EXISTS chunks_doc_id")
+            self._conn.execute("ALTER TABLE chunks RENAME TO chunks_prev")
+            self._conn.execute("ALTER TABLE tombstones RENAME TO tombstones_prev")
+            for statement in CHUNK_TABLES.format(chunks="chunks", tombstones="tombstones").split(";")[:-1]:
+                self._conn.execute(statement)
+            self._conn.execute("CREATE INDEX chunks_doc_id ON chunks(doc_id)")
+
+            ids = np.array([row[0] for row in self._conn.execute("SELECT faiss_id FROM chunks_prev ORDER BY faiss_id")], dtype=np.int64)
+            ids = ids[~np.isin(ids, dead)]
+            new_ids = ids - np.searchsorted(dead, ids)
+            self._conn.executemany(
+                "INSERT INTO chunks SELECT ?, doc_id, chunk_id, data FROM chunks_prev WHERE faiss_id = ?",
+                ((int(new), int(old)) for new, old in zip(new_ids, ids))
+            )
+            ranges = self._conn.execute("SELECT key, first_id, end_id FROM doc_cache WHERE first_id IS NOT NULL").fetchall()
+            self._conn.executemany(
+                "UPDATE doc_cache SET first_id = ?, end_id = ? WHERE key = ?",
+                ((first - int(np.searchsorted(dead, first)), end - int(np.searchsorted(dead, end)), key) for key, first, end in ranges)
+            )
+            self._conn.execute(
+                "INSERT INTO store_meta VALUES ('layout_epoch', '1') "
+                "ON CONFLICT(key) DO UPDATE SET value = CAST(value AS INTEGER) + 1"
+            )
+            self._add_tombstones([])
+            for key, value in (meta or {}).items():
+                if value is None:
+                    self._conn.execute("DELETE FROM store_meta WHERE key = ?", (key,))
+                else:
+                    self._conn.execute("INSERT OR REPLACE INTO store_meta VALUES (?, ?)", (key, value))
+
+    # ---------- views ----------
+    def view(self, limit: Optional[int] = None, epoch: Optional[int] = None) -> "ChunkView":
+        return ChunkView(self, self.count() if limit is None else limit, epoch)
+
+    def batch(self, base: int) -> "ChunkBatch":
+        return ChunkBatch(self, base)
+
+
+class ChunkView(Sequence):
+    """Read-only list-like view of the first `limit` chunks (one FAISS index generation).
+    With an epoch, reads stay on that id layout after a compaction renumbers the chunks."""
+    def __init__(self, store: ChunkStore, limit: int, epoch: Optional[int] = None):
+        self.store = store
+        self.limit = limit
+        self.epoch = epoch
+
+    def __len__(self) -> int:
+        return self.limit
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(self.limit))]
+        if i < 0:
+            i += self.limit
+        if not 0 <= i < self.limit:
+            raise IndexError(i)
+        record = self.store.get(i, self.epoch)
+        if record is None:
+            raise IndexError(i)
+        return record
+
+    def __iter__(self):
+        return iter(self.store.iter_range(0, self.limit, self.epoch))
+
+    def get_many(self, faiss_ids: Iterable[int]) -> Dict[int, dict]:
+        return self.store.get_many((i for i in faiss_ids if 0 <= i < self.limit), self.epoch)
+
+    def document_count(self) -> int:
+        return self.store.document_count(self.limit, self.epoch)
+
+
+class ChunkBatch(ChunkView):
+    """
+    Writable view used during ingestion: behaves like the old metadata list
+    (len / index / extend), but only the pending records are written on commit().
+    """
+    def __init__(self, store: ChunkStore, base: int):
+        super().__init__(store, base)
+        self.base = base
+        self.pending: List[dict] = []
+
+    def __len__(self) -> int:
+        return self.base + len(self.pending)
+
+    def __getitem__(self, i):
+        if isinstance(i, int) and i < 0:
+            i += len(self)
+        if isinstance(i, int) and i >= self.base:
+            return self.pending[i - self.base]
+        return super().__getitem__(i)
+
+    def __iter__(self):
+        yield from self.store.iter_range(0, self.base)
+        yield from self.pending
+
+    def append(self, record: dict):
+        self.pending.append(record)
+
+    def extend(self, records: Iterable[dict]):
+        self.pending.extend(records)
+
+    def commit(self, doc_cache: Optional[Dict[str, str]] = None):
+        self.store.append(self.base, self.pending, doc_cache)
+        self.base += len(self.pending)
+        self.limit = self.base
+        self.pending = []
+
+
+_store: Optional[ChunkStore] = None
+_store_lock = threading.Lock()
+
+
+def get_chunk_store() -> ChunkStore:
+    """Process-wide chunk store (opened, and migrated if needed, on first use)"""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = ChunkStore()
+        return _store
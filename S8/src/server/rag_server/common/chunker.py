@@ -0,0 +1,440 @@
+import hashlib
+import re
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional, Tuple
+import numpy as np
+import requests
+import sys
+from pathlib import Path
+ROOT = Path(__file__).resolve().parents[4]
+
+if str(ROOT) not in sys.path:
+    sys.path.append(str(ROOT))
+
+from src.server.rag_server.common.config.rag_config import (
+    OLLAMA_CHAT_URL, OLLAMA_MODEL, CHUNK_WORD_LIMIT, CHUNK_MIN_WORDS, CHUNK_LLM_WORKERS, CHUNK_USE_LLM, CHUNK_DECISION_CACHE,
+    CHUNKING_MODE, CHUNK_MAX_TOKENS, SIMILARITY_WINDOW, SIMILARITY_DROP_STD,
+    EMBED_URL, EMBED_MODEL, EMBED_BATCH_SIZE, EMBED_MAX_CONCURRENCY, EMBED_MAX_RETRIES
+)
+from src.common.embedding.embedding_client import get_embedding_client
+from src.common.logger.logger import get_logger
+
+logger = get_logger()
+
+SENTENCE_END = re.compile(r'(?<=[.!?])\s+(?=[A-Z0-9"“(\[])')
+SETEXT_UNDERLINE = re.compile(r'^\s*(=+|-+)\s*$')
+
+# (first text, second text) -> True if they belong to the same topic
+BoundaryJudge = Callable[[str, str], bool]
+# list of texts -> array of shape (len(texts), dim)
+EmbedBatch = Callable[[List[str]], np.ndarray]
+
+CHUNKING_MODES = ("structure", "similarity")
+WORDS_PER_TOKEN = 0.75  # rough English average, good enough for budgeting
+
+
+@dataclass
+class Block:
+    """A structural unit of a markdown document"""
+    kind: str  # heading, paragraph, table, code
+    text: str
+
+    @property
+    def words(self) -> int:
+        return len(self.text.split())
+
+
+def split_markdown_blocks(text: str) -> List[Block]:
+    """Split markdown into headings, paragraphs, tables and fenced code blocks."""
+    blocks: List[Block] = []
+    buffer: List[str] = []
+    kind = "paragraph"
+    in_code = False
+
+    def flush():
+        nonlocal buffer, kind
+        content = "\n".join(buffer).strip()
+        if content:
+            blocks.append(Block(kind, content))
+        buffer, kind = [], "paragraph"
+
+    for line in text.replace("\r\n", "\n").split("\n"):
+        stripped = line.strip()
+
+        if in_code:
+            buffer.append(line)
+            if stripped.startswith("```"):
+                in_code = False
+                flush()
+            continue
+        if stripped.startswith("```"):
+            flush()
+            kind, in_code = "code", True
+            buffer.append(line)
+            continue
+
+        if not stripped:
+            flush()
+        elif stripped.startswith("#"):
+            flush()
+            blocks.append(Block("heading", stripped))
+        elif SETEXT_UNDERLINE.match(line) and kind == "paragraph" and len(buffer) == 1:
+            # "Title\n-----" style heading
+            blocks.append(Block("heading", buffer[0].strip()))
+            buffer = []
+        elif stripped.startswith("|"):
+            if kind != "table":
+                flush()
+                kind = "table"
+            buffer.append(line)
+        else:
+            if kind == "table":
+                flush()
+            buffer.append(line)
+    flush()
+    return blocks
+
+
+def split_oversized(block: Block, word_limit: int) -> List[Block]:
+    """Split a block larger than word_limit on sentence (or row/line) boundaries."""
+    if block.words <= word_limit:
+        return [block]
+    if block.kind in ("table", "code"):
+        units, joiner = block.text.split("\n"), "\n"
+    else:
+        units, joiner = SENTENCE_END.split(block.text), " "
+
+    pieces: List[Block] = []
+    current: List[str] = []
+    current_words = 0
+    for unit in units:
+        unit_words = unit.split()
+        if len(unit_words) > word_limit:
+            # Run-on text with no usable boundary: fall back to word windows
+            for start in range(0, len(unit_words), word_limit):
+                window = unit_words[start:start + word_limit]
+                if current and current_words + len(window) > word_limit:
+                    pieces.append(Block(block.kind, joiner.join(current)))
+                    current, current_words = [], 0
+                current.append(" ".join(window))
+                current_words += len(window)
+            continue
+        if current and current_words + len(unit_words) > word_limit:
+            pieces.append(Block(block.kind, joiner.join(current)))
+            current, current_words = [], 0
+        current.append(unit)
+        current_words += len(unit_words)
+    if current:
+        pieces.append(Block(block.kind, joiner.join(current)))
+    return pieces
+
+
+def group_sections(blocks: List[Block], min_words: int) -> List[List[Block]]:
+    """Group blocks under their heading; sections shorter than min_words merge forward."""
+    sections: List[List[Block]] = []
+    for block in blocks:
+        if block.kind == "heading" or not sections:
+            sections.append([block])
+        else:
+            sections[-1].append(block)
+
+    merged: List[List[Block]] = []
+    carry: List[Block] = []
+    for section in sections:
+        section = carry + section
+        if sum(b.words for b in section) < min_words:
+            carry = section
+            continue
+        merged.append(section)
+        carry = []
+    if carry:
+        if merged:
+            merged[-1].extend(carry)
+        else:
+            merged.append(carry)
+    return merged
+
+
+_session = requests.Session()
+
+
+def llm_same_topic(first: str, second: str) -> bool:
+    """Ask the local LLM whether two adjacent passages belong to the same topic."""
+    prompt = f"""
+You are a markdown document segmenter.
+
+PASSAGE A:
+---
+{first}
+---
+
+PASSAGE B:
+---
+{second}
+---
+
+Does PASSAGE B continue the same topic or section as PASSAGE A?
+Answer with exactly one word: Yes or No.
+"""
+    response = _session.post(OLLAMA_CHAT_URL, json={
+        "model": OLLAMA_MODEL,
+        "messages": [{"role": "user", "content": prompt}],
+        "stream": False,
+        "options": {"temperature": 0, "seed": 0}
+    }, timeout=120)
+    response.raise_for_status()
+    reply = response.json().get("message", {}).get("content", "").strip().lower()
+    return not reply.startswith("no")
+
+
+class MarkdownChunker:
+    """
+    Structure-first chunking engine.
+
+    1. Split markdown into headings, paragraphs, tables and code blocks.
+    2. Headings are hard boundaries; sections that fit in word_limit become one chunk.
+    3. Inside oversized sections, a boundary between two substantial blocks (at least
+       min_words each) that could still be merged is ambiguous; only those are sent
+       to the judge (LLM by default), all at once on a pool of max_workers threads.
+       Short blocks such as list items or captions simply stay with their neighbours.
+    4. Chunks are assembled in a single pass from the collected decisions.
+
+    Decisions are cached by content hash (the last max_decisions of them) and the
+    LLM runs at temperature 0, so the same input always yields the same chunks.
+    get_chunker() shares one instance per mode, so the cache spans documents and
+    re-ingests. If a judge call fails, the two blocks are merged as plain
+    size-based packing would have done.
+    """
+    def __init__(self,
+                 word_limit: int = CHUNK_WORD_LIMIT,
+                 min_words: int = CHUNK_MIN_WORDS,
+                 max_workers: int = CHUNK_LLM_WORKERS,
+                 judge: Optional[BoundaryJudge] = None,
+                 use_llm: bool = CHUNK_USE_LLM,
+                 max_decisions: int = CHUNK_DECISION_CACHE):
+        self.word_limit = word_limit
+        self.min_words = min_words
+        self.max_workers = max(1, max_workers)
+        self.judge = judge or (llm_same_topic if use_llm else None)
+        self.judge_calls = 0
+        self.max_decisions = max(1, max_decisions)
+        self._decisions: "OrderedDict[str, bool]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _pair_key(first: str, second: str) -> str:
+        return hashlib.sha256(f"{first}\0{second}".encode("utf-8")).hexdigest()
+
+    def _judge(self, pair: Tuple[str, str]) -> bool:
+        key = self._pair_key(*pair)
+        with self._lock:
+            if key in self._decisions:
+                self._decisions.move_to_end(key)
+                return self._decisions[key]
+        try:
+            decision = self.judge(*pair)
+            with self._lock:
+                self.judge_calls += 1
+        except Exception as e:
+            logger.error(f"Semantic chunking LLM error: {e}")
+            return True
+        with self._lock:
+            self._decisions[key] = decision
+            if len(self._decisions) > self.max_decisions:
+                self._decisions.popitem(last=False)
+        return decision
+
+    def _judge_all(self, pairs: List[Tuple[str, str]]) -> List[bool]:
+        if not pairs:
+            return []
+        if self.judge is None:
+            return [True] * len(pairs)
+        logger.info(f"Resolving {len(pairs)} ambiguous chunk boundaries with {self.max_workers} workers")
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(pairs))) as pool:
+            return list(pool.map(self._judge, pairs))
+
+    def chunk(self, text: str) -> List[str]:
+        blocks: List[Block] = []
+        for block in split_markdown_blocks(text):
+            blocks.extend(split_oversized(block, self.word_limit))
+        if not blocks:
+            return []
+
+        sections = group_sections(blocks, self.min_words)
+
+        # Collect every ambiguous boundary across the document before calling the judge
+        pairs: List[Tuple[str, str]] = []
+        pair_slots: Dict[Tuple[int, int], int] = {}
+        for s, section in enumerate(sections):
+            if sum(b.words for b in section) <= self.word_limit:
+                continue
+            for b in range(1, len(section)):
+                first, second = section[b - 1], section[b]
+                if (first.words >= self.min_words and second.words >= self.min_words
+                        and first.words + second.words <= self.word_limit):
+                    pair_slots[(s, b)] = len(pairs)
+                    pairs.append((section[b - 1].text, section[b].text))
+        decisions = self._judge_all(pairs)
+
+        # Single assembly pass
+        chunks: List[str] = []
+        for s, section in enumerate(sections):
+            current: List[str] = [section[0].text]
+            current_words = section[0].words
+            for b in range(1, len(section)):
+                block = section[b]
+                slot = pair_slots.get((s, b))
+                fits = current_words + block.words <= self.word_limit
+                same_topic = True if slot is None else decisions[slot]
+                if fits and (same_topic or current_words < self.min_words):
+                    current.append(block.text)
+                    current_words += block.words
+                else:
+                    chunks.append("\n\n".join(current))
+                    current, current_words = [block.text], block.words
+            chunks.append("\n\n".join(current))
+        return [chunk.strip() for chunk in chunks if chunk.strip()]
+
+
+def approx_tokens(text: str) -> int:
+    """Cheap token estimate from the word count (no tokenizer dependency)."""
+    return int(len(text.split()) / WORDS_PER_TOKEN + 0.5)
+
+
+def window_similarities(vectors: np.ndarray, window: int) -> np.ndarray:
+    """
+    Cosine similarity across every gap between consecutive units.
+
+    Entry i compares the mean of the `window` units ending at i with the mean of
+    the `window` units starting at i + 1 (windows are clipped at the edges).
+    Computed with prefix sums, so the cost is O(n * dim) regardless of window.
+    """
+    n = len(vectors)
+    if n < 2:
+        return np.zeros(0, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    unit = vectors / np.maximum(norms, 1e-12)
+    prefix = np.vstack([np.zeros((1, unit.shape[1]), dtype=unit.dtype), np.cumsum(unit, axis=0)])
+
+    gaps = np.arange(1, n)  # gap g sits between unit g-1 and unit g
+    left = prefix[gaps] - prefix[np.maximum(gaps - window, 0)]
+    right = prefix[np.minimum(gaps + window, n)] - prefix[gaps]
+    left /= np.maximum(np.linalg.norm(left, axis=1, keepdims=True), 1e-12)
+    right /= np.maximum(np.linalg.norm(right, axis=1, keepdims=True), 1e-12)
+    return np.einsum("ij,ij->i", left, right)
+
+
+def embedding_batch() -> EmbedBatch:
+    return get_embedding_client(
+        EMBED_URL,
+        EMBED_MODEL,
+        batch_size=EMBED_BATCH_SIZE,
+        max_concurrency=EMBED_MAX_CONCURRENCY,
+        max_retries=EMBED_MAX_RETRIES
+    ).embed_batch
+
+
+class SimilarityChunker:
+    """
+    LLM-free chunking engine based on embedding similarity.
+
+    1. Split markdown into sentences (tables and code blocks stay whole, or are
+       split on rows/lines when they exceed the budget on their own).
+    2. Embed all sentences in batches through the shared embedding client.
+    3. Score each gap by cosine similarity between the sliding windows on either
+       side; a gap is a boundary where the score drops more than drop_std
+       standard deviations below the document mean. Headings always start a chunk
+       and are never left on their own.
+    4. Any segment over max_tokens is split again at its weakest gap.
+    """
+    def __init__(self,
+                 max_tokens: int = CHUNK_MAX_TOKENS,
+                 window: int = SIMILARITY_WINDOW,
+                 drop_std: float = SIMILARITY_DROP_STD,
+                 embed: Optional[EmbedBatch] = None):
+        self.max_tokens = max_tokens
+        self.window = max(1, window)
+        self.drop_std = drop_std
+        self.embed = embed
+
+    def _units(self, text: str) -> Tuple[List[str], List[str], List[bool]]:
+        """Sentence-level units, the separator to put before each one, and whether it opens a section"""
+        word_limit = max(1, int(self.max_tokens * WORDS_PER_TOKEN))
+        units: List[str] = []
+        separators: List[str] = []
+        starts: List[bool] = []
+        for block in split_markdown_blocks(text):
+            if block.kind == "heading":
+                pieces, joiner = [block.text], "\n\n"
+            elif block.kind in ("table", "code"):
+                pieces, joiner = [piece.text for piece in split_oversized(block, word_limit)], "\n"
+            else:
+                pieces, joiner = [], " "
+                for sentence in SENTENCE_END.split(block.text):
+                    pieces.extend(p.text for p in split_oversized(Block(block.kind, sentence), word_limit))
+            for i, piece in enumerate(pieces):
+                units.append(piece)
+                separators.append("\n\n" if i == 0 else joiner)
+                starts.append(block.kind == "heading")
+        return units, separators, starts
+
+    def _split(self, start: int, end: int, scores: np.ndarray, tokens: np.ndarray, cuts: List[int]):
+        """Recursively cut [start, end) at its weakest gap until every piece fits"""
+        if end - start < 2 or tokens[start:end].sum() <= self.max_tokens:
+            return
+        # gap g (between unit g-1 and g) has score index g-1
+        gap = start + 1 + int(np.argmin(scores[start:end - 1]))
+        cuts.append(gap)
+        self._split(start, gap, scores, tokens, cuts)
+        self._split(gap, end, scores, tokens, cuts)
+
+    def chunk(self, text: str) -> List[str]:
+        units, separators, starts = self._units(text)
+        if not units:
+            return []
+        if len(units) == 1:
+            return [units[0]]
+
+        embed = self.embed or embedding_batch()
+        vectors = np.asarray(embed(units), dtype=np.float32)
+        scores = window_similarities(vectors, self.window)
+        tokens = np.array([approx_tokens(unit) for unit in units])
+
+        threshold = scores.mean() - self.drop_std * scores.std()
+        starts = np.asarray(starts, dtype=bool)
+        scores[starts[:-1]] = np.inf  # never separate a heading from the text under it
+        boundary = (scores < threshold) | starts[1:]
+        cuts = (np.flatnonzero(boundary) + 1).tolist()
+
+        # Enforce the token budget inside each segment
+        edges = [0] + cuts + [len(units)]
+        for start, end in zip(edges, edges[1:]):
+            self._split(start, end, scores, tokens, cuts)
+
+        edges = [0] + sorted(set(cuts)) + [len(units)]
+        chunks = []
+        for start, end in zip(edges, edges[1:]):
+            chunk = "".join(separators[i] + units[i] for i in range(start, end)).strip()
+            if chunk:
+                chunks.append(chunk)
+        return chunks
+
+
+_chunkers: Dict[str, object] = {}
+_chunkers_lock = threading.Lock()
+
+
+def get_chunker(mode: Optional[str] = None):
+    """Process-wide chunking engine for `mode` ("structure" or "similarity"); defaults to CHUNKING_MODE.
+    Reusing one MarkdownChunker keeps its boundary-decision cache across calls."""
+    mode = (mode or CHUNKING_MODE).lower()
+    if mode not in CHUNKING_MODES:
+        raise ValueError(f"Unknown chunking mode '{mode}', expected one of {CHUNKING_MODES}")
+    with _chunkers_lock:
+        chunker = _chunkers.get(mode)
+        if chunker is None:
+            chunker = _chunkers[mode] = MarkdownChunker() if mode == "structure" else SimilarityChunker()
+        return chunker
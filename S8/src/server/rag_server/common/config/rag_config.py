@@ -23,6 +23,10 @@ INDEX_CACHE = ROOT / "resources" / "faiss_index"
 INDEX_FILE = INDEX_CACHE / "index.bin"
 METADATA_FILE = INDEX_CACHE / "metadata.json"
 CACHE_FILE = INDEX_CACHE / "doc_index_cache.json"
+CHUNK_DB = INDEX_CACHE / "chunks.sqlite"  # Append-only chunk metadata (replaces metadata.json / doc_index_cache.json)
+VECTORS_FILE = INDEX_CACHE / "vectors.f32"  # Raw float32 copy of every indexed vector, used to (re)train ANN indexes
+INGEST_WAL_FILE = INDEX_CACHE / "ingest.wal"
+INGEST_LOCK_FILE = INDEX_CACHE / "index.lock"
 GLOBAL_IMAGE_DIR = ROOT / "resources"/ "documents" / "images" / "pdf_images"
 # Create necessary directories
 DOC_PATH.mkdir(exist_ok=True, parents=True)
@@ -31,6 +35,9 @@ INDEX_CACHE.mkdir(exist_ok=True, parents=True)
 # Embedding configuration
 EMBED_URL = "http://localhost:11434/api/embeddings"
 EMBED_MODEL = "nomic-embed-text"
+EMBED_BATCH_SIZE = 32       # Texts per /api/embed request
+EMBED_MAX_CONCURRENCY = 4   # Embedding requests in flight at once
+EMBED_MAX_RETRIES = 3
 
 # Ollama configuration
 OLLAMA_BASE_URL = "http://localhost:11434"
@@ -42,6 +49,66 @@ OLLAMA_MODEL = "llama3"
 CHUNK_SIZE = 512  # Increased from 256
 CHUNK_OVERLAP = 40
 
+# Semantic chunking (see common/chunker.py)
+CHUNK_WORD_LIMIT = 512   # Max words per chunk
+CHUNK_MIN_WORDS = 30     # Sections shorter than this merge into the next one
+CHUNK_LLM_WORKERS = 4    # Concurrent LLM calls for ambiguous boundaries
+CHUNK_USE_LLM = True     # False: pure structure/size based chunking
+CHUNK_DECISION_CACHE = 10000  # Boundary decisions kept by the shared chunker (LRU)
+
+# "structure": markdown structure + LLM for ambiguous boundaries
+# "similarity": sentence embeddings, boundaries where window similarity drops (no LLM)
+CHUNKING_MODE = "structure"
+CHUNK_MAX_TOKENS = 512     # Token budget per chunk in similarity mode (approximate)
+SIMILARITY_WINDOW = 3      # Sentences on each side of a gap
+SIMILARITY_DROP_STD = 1.0  # Boundary when similarity < mean - DROP_STD * std
+
+# Ingestion writer (see common/ingest_queue.py)
+INGEST_BATCH_WINDOW = 0.05  # Seconds to wait for more documents before committing
+INGEST_MAX_BATCH = 32       # Max documents per index commit
+INGEST_COMMIT_CHUNKS = 512  # Larger documents are committed in windows of about this many chunks
+COMPACT_TOMBSTONE_RATIO = 0.2  # Compact once replaced/deleted chunks are this share of the index
+COMPACT_MIN_TOMBSTONES = 256    # ...and at least this many (small indexes are not rewritten for a few)
+
+# Multi-file ingestion pipeline (see common/ingest_pipeline.py)
+INGEST_QUEUE_SIZE = 8            # Items buffered between stages before the producer waits
+INGEST_EXTRACT_WORKERS = 2       # Files extracted at once (PDF pages also fan out to the PDF process pool)
+INGEST_CHUNK_WORKERS = 2         # Segments chunked at once
+INGEST_EMBED_WORKERS = 2         # Segments embedded at once (each is batched by EmbeddingClient)
+INGEST_MAX_PENDING_COMMITS = 8   # Commit windows handed to the ingest writer but not yet committed
+
+# Change detection for indexed files (doc_cache in chunks.sqlite)
+FILE_HASH_ALGORITHM = "auto"     # "xxh3" (needs xxhash), "blake2b" or "auto" (xxh3 when installed)
+FILE_HASH_BLOCK_SIZE = 1 << 20   # Bytes read per block while hashing; files are never read whole
+FILE_STAT_RACY_SECONDS = 2       # Files modified this recently are re-hashed next time even if stat matches
+
+# ANN index (see src/common/vector_index/index_factory.py)
+INDEX_METRIC = "ip"            # Vectors are stored unit-length; "ip" or "l2", scores are cosine either way
+INDEX_TYPE = "auto"            # "flat", "ivf_flat", "hnsw", "ivf_pq" or "auto"
+INDEX_AUTO_TYPE = "ivf_flat"   # What "auto" switches to once the corpus is large enough
+INDEX_TRAIN_THRESHOLD = 20000  # Vectors before leaving the exact flat index
+IVF_NLIST = 0                  # 0: ~4 * sqrt(n) lists
+IVF_NPROBE = 16                # Lists scanned per query (recall vs latency)
+HNSW_M = 32
+HNSW_EF_CONSTRUCTION = 200
+HNSW_EF_SEARCH = 64            # Candidate list size per query (recall vs latency)
+PQ_M = 0                       # 0: dim / 8 sub-quantizers
+PQ_NBITS = 8
+
+# Search
+SEARCH_MIN_SCORE = 0.5         # Default cosine similarity cut-off for search_documents
+
 # Image processing configuration
 MAX_IMAGE_SIZE = 1600
-IMAGE_QUALITY = 85
\ No newline at end of file
+IMAGE_QUALITY = 85
+# Image captioning (see common/captioner.py)
+CAPTION_MAX_SIZE = 1024          # Images are downsized to this many px on the long side before captioning
+CAPTION_MAX_CONCURRENCY = 2      # Caption requests in flight at once (vision models are memory hungry)
+CAPTION_TIMEOUT = 300            # Seconds per caption request
+CAPTION_CACHE_DB = INDEX_CACHE / "captions.sqlite"  # Captions keyed by model + image content hash
+OLLAMA_LIVENESS_TTL = 30         # Seconds a successful /api/version check is trusted
+
+# PDF extraction (see common/pdf_extractor.py)
+PDF_PAGES_PER_TASK = 8          # Pages converted per worker task
+PDF_EXTRACT_WORKERS = 0         # Worker processes; 0: min(4, cpu count)
+PDF_PARALLEL_MIN_PAGES = 16     # Smaller PDFs are converted in-process (no pool start-up cost)
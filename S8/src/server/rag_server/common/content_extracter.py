@@ -1,8 +1,6 @@
 from src.server.rag_server.schema.rag_model import UrlInput, MarkdownOutput, FilePathInput
 import trafilatura
-import pymupdf4llm
 import os
-import re
 import sys
 from pathlib import Path
 ROOT = Path(__file__).resolve().parents[4]
@@ -10,8 +8,8 @@ ROOT = Path(__file__).resolve().parents[4]
 if str(ROOT) not in sys.path:
     sys.path.append(str(ROOT))
 
-from src.server.rag_server.common.config.rag_config import GLOBAL_IMAGE_DIR
 from src.server.rag_server.common.utils import replace_images_with_captions
+from src.server.rag_server.common.pdf_extractor import iter_pdf_markdown
 from src.common.logger.logger import get_logger
 
 logger = get_logger()   
@@ -39,22 +37,7 @@ def extract_pdf(input: FilePathInput) -> MarkdownOutput:
 
     if not os.path.exists(input.file_path):
         return MarkdownOutput(markdown=f"File not found: {input.file_path}")
-    
-    global_image_dir = GLOBAL_IMAGE_DIR
-    global_image_dir.mkdir(parents=True, exist_ok=True)
-
-    markdown = pymupdf4llm.to_markdown(
-        input.file_path,
-        write_images = True,
-        image_path = str(global_image_dir)
-    )
 
-    #Re-point image links in the markdown
-    markdown = re.sub(
-        r'!\[\]\((.*?/images/)([^)]+)\)',
-        r'![](images/\2)',
-        markdown.replace("\\", "/")
-    )
-        
-    markdown = replace_images_with_captions(markdown)
+    # Page ranges are converted in parallel worker processes and captioned as they arrive
+    markdown = "".join(iter_pdf_markdown(input.file_path))
     return MarkdownOutput(markdown=markdown)
\ No newline at end of file
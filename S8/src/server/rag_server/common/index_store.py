@@ -0,0 +1,158 @@
+import threading
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Optional, Sequence
+import faiss
+import numpy as np
+import sys
+ROOT = Path(__file__).resolve().parents[4]
+
+if str(ROOT) not in sys.path:
+    sys.path.append(str(ROOT))
+
+from src.server.rag_server.common.config.rag_config import (
+    INDEX_FILE, INDEX_METRIC, INDEX_TYPE, INDEX_AUTO_TYPE, INDEX_TRAIN_THRESHOLD, IVF_NLIST, IVF_NPROBE,
+    HNSW_M, HNSW_EF_CONSTRUCTION, HNSW_EF_SEARCH, PQ_M, PQ_NBITS
+)
+from src.common.vector_index.index_factory import IndexSpec, build_index, configure_search, normalize, search_params, stored_vectors
+from src.server.rag_server.common.chunk_store import ChunkStore, get_chunk_store
+from src.common.logger.logger import get_logger
+
+logger = get_logger()
+
+
+def rag_index_spec() -> IndexSpec:
+    """Index type and search tuning for the document store, from rag_config"""
+    return IndexSpec(
+        index_type=INDEX_TYPE,
+        metric=faiss.METRIC_INNER_PRODUCT if INDEX_METRIC == "ip" else faiss.METRIC_L2,
+        auto_type=INDEX_AUTO_TYPE,
+        train_threshold=INDEX_TRAIN_THRESHOLD,
+        nlist=IVF_NLIST,
+        nprobe=IVF_NPROBE,
+        hnsw_m=HNSW_M,
+        ef_construction=HNSW_EF_CONSTRUCTION,
+        ef_search=HNSW_EF_SEARCH,
+        pq_m=PQ_M,
+        pq_nbits=PQ_NBITS
+    )
+
+
+@dataclass(frozen=True)
+class IndexSnapshot:
+    """Immutable view of the FAISS index and its metadata, shared by all readers.
+    metadata is a ChunkView limited to index.ntotal, so later appends stay invisible.
+    tombstones are the ids of replaced/deleted chunks; searches must go through
+    search_params() so FAISS skips them while collecting the top k."""
+    index: Optional[Any] = None
+    metadata: Sequence = field(default_factory=list)
+    cache_meta: dict = field(default_factory=dict)
+    generation: int = 0
+    tombstones: np.ndarray = field(default_factory=lambda: np.zeros(0, dtype=np.int64))
+    _selectors: tuple = ()  # (IDSelectorBatch, IDSelectorNot): the Not does not own the batch
+
+    @property
+    def live_count(self) -> int:
+        return (self.index.ntotal if self.index is not None else 0) - len(self.tombstones)
+
+    def search_params(self, nprobe: Optional[int] = None, ef_search: Optional[int] = None):
+        sel = self._selectors[1] if self._selectors else None
+        return search_params(self.index, nprobe=nprobe, ef_search=ef_search, sel=sel)
+
+
+class ResidentIndex:
+    """
+    Process-wide holder that keeps the FAISS index and metadata in memory.
+
+    Readers call get() on every query; the index is only re-read when its
+    (mtime_ns, size) stamp or the chunk store's tombstone version changes
+    (another process wrote a new version or deleted a document) or when a
+    writer in this process calls invalidate() after saving. Chunk
+    metadata is read on demand from the ChunkStore, never loaded wholesale.
+    Snapshots are never mutated, so a reader keeps a consistent view even if a
+    new version is swapped in mid-query; a snapshot's metadata and tombstones
+    are pinned to the chunk store's id layout of its index.bin, so they stay
+    right after a compaction renumbers the chunks.
+    """
+    def __init__(self, index_file: Path = INDEX_FILE, store: Optional[ChunkStore] = None):
+        self.files = (Path(index_file),)
+        self._store = store
+        self._lock = threading.Lock()
+        self._snapshot = IndexSnapshot()
+        self._stamp = None
+        self._generation = 0
+        self._stale = True
+
+    def _current_stamp(self):
+        stamp = []
+        for path in self.files:
+            try:
+                st = path.stat()
+                stamp.append((st.st_mtime_ns, st.st_size))
+            except FileNotFoundError:
+                stamp.append(None)
+        stamp.append((self._store or get_chunk_store()).tombstone_version())
+        return tuple(stamp)
+
+    def _load(self) -> IndexSnapshot:
+        index_file, = self.files
+        store = self._store or get_chunk_store()
+        spec = rag_index_spec()
+        layout = store.layout()
+        index = configure_search(faiss.read_index(str(index_file)), spec) if index_file.exists() else None
+        if store.layout() != layout:
+            raise RuntimeError("chunk store compacted while index.bin was read")
+        epoch, compaction = layout
+        if index is not None and compaction is not None and index.ntotal != compaction["total"]:
+            # Compacted index.bin installed, renumbered chunks not committed yet (see IngestQueue._compact)
+            raise RuntimeError("compaction in progress")
+        if index is not None and index.metric_type != spec.metric:
+            # Index written before normalized/IP storage: convert in memory, the next ingest rewrites it
+            logger.warning("index.bin uses a different metric than INDEX_METRIC, converting it in memory")
+            index = build_index(normalize(stored_vectors(index)), spec)
+        ntotal = index.ntotal if index is not None else 0
+        metadata = store.view(limit=ntotal, epoch=epoch)
+        cache_meta = store.doc_cache()
+        tombstones = store.tombstone_ids(limit=ntotal, epoch=epoch)
+        selectors = ()
+        if len(tombstones):
+            batch = faiss.IDSelectorBatch(tombstones)
+            selectors = (batch, faiss.IDSelectorNot(batch))
+        return IndexSnapshot(index=index, metadata=metadata, cache_meta=cache_meta, generation=self._generation,
+                             tombstones=tombstones, _selectors=selectors)
+
+    def get(self) -> IndexSnapshot:
+        """Return the current snapshot, hot-swapping to a new one if the files changed."""
+        stamp = self._current_stamp()
+        if not self._stale and stamp == self._stamp:
+            return self._snapshot
+
+        with self._lock:
+            if not self._stale and stamp == self._stamp:
+                return self._snapshot
+            try:
+                self._generation += 1
+                snapshot = self._load()
+            except Exception as e:
+                # A writer may be halfway through replacing the files; keep serving the old snapshot
+                logger.warning(f"Index reload failed, serving generation {self._snapshot.generation}: {e}")
+                return self._snapshot
+            self._snapshot = snapshot
+            self._stamp = stamp
+            self._stale = False
+            size = snapshot.index.ntotal if snapshot.index is not None else 0
+            logger.info(f"Loaded index generation {snapshot.generation} with {size} vectors and {len(snapshot.metadata)} metadata entries")
+            return snapshot
+
+    def invalidate(self):
+        """Force the next get() to reload, even if the file stamps look unchanged."""
+        with self._lock:
+            self._stale = True
+
+
+# Process-wide instance used by the search handlers
+resident_index = ResidentIndex()
+
+
+def get_index_snapshot() -> IndexSnapshot:
+    return resident_index.get()
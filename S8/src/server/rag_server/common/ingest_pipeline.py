@@ -0,0 +1,394 @@
+import asyncio
+import time
+import uuid
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+import numpy as np
+from tqdm import tqdm
+import sys
+from pathlib import Path
+ROOT = Path(__file__).resolve().parents[4]
+
+if str(ROOT) not in sys.path:
+    sys.path.append(str(ROOT))
+
+from src.server.rag_server.common.config.rag_config import (
+    INGEST_COMMIT_CHUNKS, INGEST_QUEUE_SIZE, INGEST_EXTRACT_WORKERS, INGEST_CHUNK_WORKERS, INGEST_EMBED_WORKERS, INGEST_MAX_PENDING_COMMITS
+)
+from src.server.rag_server.common.utils import (
+    embedding_client, semantic_merge, check_file_cache, extract_title_from_content, determine_source_type
+)
+from src.server.rag_server.common.chunk_store import ChunkStore, DocCacheEntry, PENDING_HASH, get_chunk_store
+from src.server.rag_server.common.ingest_queue import IngestQueue, get_ingest_queue
+from src.common.logger.logger import get_logger
+
+logger = get_logger()
+
+# file -> (markdown segments in order, source url or None); runs on a worker thread
+Extractor = Callable[[Path], Tuple[Iterator[str], Optional[str]]]
+
+_DONE = object()
+
+
+def extract_file(file: Path) -> Tuple[Iterator[str], Optional[str]]:
+    """Default extractor: PDFs stream page ranges from the process pool, other types are one segment"""
+    ext = file.suffix.lower()
+    if ext == ".pdf":
+        from src.server.rag_server.common.pdf_extractor import iter_pdf_markdown
+        return iter_pdf_markdown(str(file)), None
+    if ext == ".url":
+        from src.server.rag_server.common.content_extracter import extract_webpage
+        from src.server.rag_server.schema.rag_model import UrlInput
+        with open(file, 'r', encoding='utf-8') as f:
+            url = f.readline().strip()
+        return iter([extract_webpage(UrlInput(url=url)).markdown]), url
+    with open(file, 'r', encoding='utf-8', errors='ignore') as f:
+        content = f.read()
+    if ext in (".html", ".htm"):
+        import trafilatura
+        from src.server.rag_server.common.captioner import replace_images_with_captions
+        markdown = trafilatura.extract(
+            content,
+            include_comments=False,
+            include_tables=True,
+            include_images=True,
+            output_format='markdown'
+        ) or ""
+        return iter([replace_images_with_captions(markdown)]), None
+    return iter([content]), None
+
+
+@dataclass
+class StageStats:
+    name: str
+    items: int = 0
+    units: int = 0       # pages/segments, chunks or vectors, depending on the stage
+    busy: float = 0.0    # summed over the stage's workers
+    first_start: Optional[float] = None
+    last_end: Optional[float] = None
+
+    def record(self, start: float, units: int = 1):
+        end = time.perf_counter()
+        self.items += 1
+        self.units += units
+        self.busy += end - start
+        self.first_start = start if self.first_start is None else min(self.first_start, start)
+        self.last_end = end if self.last_end is None else max(self.last_end, end)
+
+    def summary(self, wall: float) -> dict:
+        active = (self.last_end - self.first_start) if self.items else 0.0
+        return {
+            "items": self.items,
+            "units": self.units,
+            "busy_s": round(self.busy, 3),
+            "active_s": round(active, 3),
+            "units_per_s": round(self.units / wall, 2) if wall > 0 else 0.0,
+            "utilization": round(self.busy / wall, 2) if wall > 0 else 0.0,  # > 1 when workers overlap
+        }
+
+
+@dataclass
+class Document:
+    file: Path
+    cache_entry: DocCacheEntry
+    doc_id: str = field(default_factory=lambda: str(uuid.uuid4()))
+    url: Optional[str] = None
+    title: Optional[str] = None
+    total_segments: Optional[int] = None  # known once the extractor's end marker reaches the committer
+    segments: Dict[int, Tuple[List[str], Any]] = field(default_factory=dict)  # arrived ahead of next_segment
+    next_segment: int = 0
+    arrived: int = 0
+    chunks: List[str] = field(default_factory=list)  # in order, not yet handed to the writer
+    vectors: List[Any] = field(default_factory=list)
+    committed: int = 0  # chunks handed to the writer
+    windows: List[asyncio.Future] = field(default_factory=list)
+    commit_start: Optional[float] = None
+    error: Optional[str] = None
+
+
+class IngestPipeline:
+    """
+    Staged producer/consumer ingestion for process_documents.
+
+        hash -> extract -> chunk -> embed -> commit
+
+    Each arrow is a bounded asyncio.Queue, so a slow stage back-pressures the
+    ones before it instead of buffering whole documents. Documents flow through
+    as segments (PDF page ranges, or the whole text for other types), so one
+    file's embedding overlaps the next file's extraction.
+
+    - hash: unchanged files are skipped on a doc_cache stat match, otherwise
+      after a streamed hash (check_file_cache)
+    - extract: extract_workers files at a time on threads; PDFs fan out to the
+      pdf_extractor process pool
+    - chunk: chunk_workers threads running semantic_merge (or the given chunker)
+    - embed: embed_workers concurrent batched aembed_batch calls
+    - commit: one consumer puts each document's segments back in order and
+      submits them to the single index writer (IngestQueue) in windows of
+      commit_chunks, keeping up to max_pending_commits windows in flight so the
+      writer can batch them; a large document is never held whole
+
+    run() returns per-file results plus per-stage throughput.
+    """
+    def __init__(self,
+                 chunking_mode: Optional[str] = None,
+                 extractor: Extractor = extract_file,
+                 chunker=None,
+                 embedder=None,
+                 ingest_queue: Optional[IngestQueue] = None,
+                 store: Optional[ChunkStore] = None,
+                 queue_size: int = INGEST_QUEUE_SIZE,
+                 extract_workers: int = INGEST_EXTRACT_WORKERS,
+                 chunk_workers: int = INGEST_CHUNK_WORKERS,
+                 embed_workers: int = INGEST_EMBED_WORKERS,
+                 max_pending_commits: int = INGEST_MAX_PENDING_COMMITS,
+                 commit_chunks: int = INGEST_COMMIT_CHUNKS,
+                 log: Callable[[str, str], None] = lambda level, message: logger.info(f"[{level}] {message}")):
+        self.chunking_mode = chunking_mode
+        self.extractor = extractor
+        self.chunker = chunker
+        self.embedder = embedder
+        self.ingest_queue = ingest_queue
+        self.store = store
+        self.queue_size = max(1, queue_size)
+        self.extract_workers = max(1, extract_workers)
+        self.chunk_workers = max(1, chunk_workers)
+        self.embed_workers = max(1, embed_workers)
+        self.max_pending_commits = max(1, max_pending_commits)
+        self.commit_chunks = max(1, commit_chunks)
+        self.log = log
+        self.stats = {name: StageStats(name) for name in ("hash", "extract", "chunk", "embed", "commit")}
+        self.results: List[dict] = []
+        self.progress: Optional[tqdm] = None
+
+    def _finish(self, result: Optional[dict]):
+        if result is not None:
+            self.results.append(result)
+        if self.progress is not None:
+            self.progress.update(1)
+
+    def _chunk_text(self, text: str) -> List[str]:
+        if self.chunker is not None:
+            return self.chunker.chunk(text)
+        return semantic_merge(text, self.chunking_mode)
+
+    # ---------- stages ----------
+    async def _hash(self, files: List[Path], cache: Dict[str, DocCacheEntry], out: asyncio.Queue):
+        store = self.store or get_chunk_store()
+        for file in files:
+            start = time.perf_counter()
+            cached = cache.get(file.name)
+            try:
+                entry, unchanged = await asyncio.to_thread(check_file_cache, file, cached)
+            except OSError as e:
+                self._finish({"file": file.name, "status": "error", "error": str(e)})
+                continue
+            self.stats["hash"].record(start)
+            if unchanged:
+                if entry != cached:
+                    # Same content, new stat (touched, copied, or hashed with an older algorithm)
+                    await asyncio.to_thread(store.update_doc_cache, {file.name: entry})
+                self.log("SKIP", f"Skipping unchanged file: {file.name}")
+                self._finish({"file": file.name, "status": "skipped"})
+                continue
+            await out.put(Document(file=file, cache_entry=entry))
+
+    async def _extract(self, files: asyncio.Queue, segments: asyncio.Queue, commits: asyncio.Queue):
+        while (doc := await files.get()) is not _DONE:
+            self.log("PROC", f"Processing: {doc.file.name}")
+            count = 0
+            try:
+                start = time.perf_counter()
+                parts, doc.url = await asyncio.to_thread(self.extractor, doc.file)
+                while True:
+                    segment = await asyncio.to_thread(next, parts, None)
+                    if segment is None:
+                        break
+                    if count == 0:
+                        doc.title = extract_title_from_content(segment, doc.file.name)
+                    self.stats["extract"].record(start)
+                    await segments.put((doc, count, segment))
+                    count += 1
+                    start = time.perf_counter()
+            except Exception as e:
+                doc.error = f"extract: {e}"
+            await commits.put((doc, None, count))  # segment total; only the committer updates completion state
+
+    async def _chunk(self, segments: asyncio.Queue, chunked: asyncio.Queue):
+        while (item := await segments.get()) is not _DONE:
+            doc, i, segment = item
+            chunks = []
+            if doc.error is None and segment.strip():
+                start = time.perf_counter()
+                try:
+                    if len(segment.split()) < 10:
+                        chunks = [segment.strip()]
+                    else:
+                        chunks = await asyncio.to_thread(self._chunk_text, segment)
+                    self.stats["chunk"].record(start, len(chunks))
+                except Exception as e:
+                    doc.error = f"chunk: {e}"
+            await chunked.put((doc, i, chunks))
+
+    async def _embed(self, chunked: asyncio.Queue, commits: asyncio.Queue):
+        embedder = self.embedder or embedding_client()
+        while (item := await chunked.get()) is not _DONE:
+            doc, i, chunks = item
+            vectors = None
+            if doc.error is None and chunks:
+                start = time.perf_counter()
+                try:
+                    vectors = await embedder.aembed_batch(chunks)
+                    self.stats["embed"].record(start, len(chunks))
+                except Exception as e:
+                    doc.error = f"embed: {e}"
+            await commits.put((doc, i, (chunks, vectors)))
+
+    def _records(self, doc: Document, chunks: List[str], start: int) -> List[dict]:
+        source_type = determine_source_type(doc.file.suffix.lower())
+        records = []
+        for i, chunk in enumerate(chunks, start):
+            chunk_metadata = {
+                "doc": doc.file.name,
+                "doc_id": doc.doc_id,
+                "title": doc.title,
+                "source_type": source_type,
+                "chunk": chunk,
+                "chunk_id": f"{doc.doc_id}_{i}"
+            }
+            if doc.url:
+                chunk_metadata["url"] = doc.url
+            records.append(chunk_metadata)
+        return records
+
+    async def _commit(self, commits: asyncio.Queue):
+        writer = self.ingest_queue or get_ingest_queue()
+        in_flight: set = set()
+        slots = asyncio.Semaphore(self.max_pending_commits)
+
+        async def submit_window(doc: Document, final: bool):
+            # writer.submit is synchronous, so a document's windows reach the writer in order;
+            # only the last one carries the real cache entry, see IngestQueue
+            await slots.acquire()
+            if doc.commit_start is None:
+                doc.commit_start = time.perf_counter()
+            entry = doc.cache_entry if final else DocCacheEntry(hash=PENDING_HASH)
+            try:
+                future = asyncio.wrap_future(writer.submit(
+                    self._records(doc, doc.chunks, doc.committed), np.vstack(doc.vectors),
+                    {doc.file.name: entry}, continues=doc.committed > 0
+                ))
+            except Exception:
+                slots.release()
+                raise
+            future.add_done_callback(lambda _: slots.release())
+            doc.windows.append(future)
+            doc.committed += len(doc.chunks)
+            doc.chunks, doc.vectors = [], []
+
+        async def finish(doc: Document):
+            try:
+                results = await asyncio.gather(*doc.windows)
+                if doc.error is not None:
+                    raise RuntimeError(doc.error)
+                self.stats["commit"].record(doc.commit_start, doc.committed)
+                status = "skipped" if len(results) == 1 and results[0]["status"] == "skipped" else "committed"
+                self.log("SAVE", f"Committed {doc.committed} chunks from {doc.file.name} in {len(results)} windows ({status})")
+                self._finish({"file": doc.file.name, "doc_id": doc.doc_id, "title": doc.title, "status": "success", "chunks": doc.committed})
+            except Exception as e:
+                self.log("ERROR", f"Failed to process {doc.file.name}: {str(e)}")
+                await asyncio.gather(*doc.windows, return_exceptions=True)
+                if doc.committed:
+                    # Windows already replaced the previous version; drop the half-ingested one too
+                    try:
+                        await writer.adelete(doc.doc_id)
+                    except Exception as cleanup_error:
+                        self.log("ERROR", f"Could not remove partial {doc.file.name}: {cleanup_error}")
+                self._finish({"file": doc.file.name, "status": "error", "error": str(e)})
+            finally:
+                doc.windows.clear()
+
+        while (item := await commits.get()) is not _DONE:
+            doc, i, payload = item
+            if i is None:
+                doc.total_segments = payload
+            else:
+                doc.segments[i] = payload
+                doc.arrived += 1
+            try:
+                while doc.error is None and doc.next_segment in doc.segments:
+                    segment_chunks, segment_vectors = doc.segments.pop(doc.next_segment)
+                    doc.next_segment += 1
+                    if not segment_chunks:
+                        continue
+                    if len(doc.chunks) >= self.commit_chunks:
+                        # Flushed only once more chunks follow, so the last window is never empty
+                        await submit_window(doc, final=False)
+                    doc.chunks.extend(segment_chunks)
+                    doc.vectors.append(segment_vectors)
+            except Exception as e:
+                doc.error = f"commit: {e}"
+            if doc.total_segments is None or doc.arrived < doc.total_segments:
+                continue
+
+            doc.segments.clear()
+            if doc.error is None and doc.chunks:
+                try:
+                    await submit_window(doc, final=True)
+                except Exception as e:
+                    doc.error = f"commit: {e}"
+            if doc.error is None and not doc.windows:
+                self.log("WARN", f"No content extracted from {doc.file.name}")
+                self._finish(None)
+                continue
+            if doc.error is not None and not doc.committed:
+                self.log("ERROR", f"Failed to process {doc.file.name}: {doc.error}")
+                self._finish({"file": doc.file.name, "status": "error", "error": doc.error})
+                doc.chunks, doc.vectors = [], []
+                continue
+            task = asyncio.create_task(finish(doc))
+            in_flight.add(task)
+            task.add_done_callback(in_flight.discard)
+
+        if in_flight:
+            await asyncio.gather(*in_flight)
+
+    # ---------- orchestration ----------
+    async def run(self, files: List[Path], cache: Optional[Dict[str, DocCacheEntry]] = None) -> Tuple[List[dict], Dict[str, dict]]:
+        """Ingest files that changed since their doc_cache entry (read from the store unless given);
+        returns (per-file results, per-stage throughput)"""
+        if cache is None:
+            cache = await asyncio.to_thread((self.store or get_chunk_store()).doc_cache_entries)
+        started = time.perf_counter()
+        self.results = []
+        self.progress = tqdm(total=len(files), desc="Processing documents")
+        docs, segments, chunked, commits = (asyncio.Queue(self.queue_size) for _ in range(4))
+
+        async def close(workers: List[asyncio.Task], queue: asyncio.Queue, consumers: int):
+            await asyncio.gather(*workers)
+            for _ in range(consumers):
+                await queue.put(_DONE)
+
+        hashers = [asyncio.create_task(self._hash(files, cache, docs))]
+        extractors = [asyncio.create_task(self._extract(docs, segments, commits)) for _ in range(self.extract_workers)]
+        chunkers = [asyncio.create_task(self._chunk(segments, chunked)) for _ in range(self.chunk_workers)]
+        embedders = [asyncio.create_task(self._embed(chunked, commits)) for _ in range(self.embed_workers)]
+        committer = asyncio.create_task(self._commit(commits))
+        stages = hashers + extractors + chunkers + embedders + [committer]
+
+        try:
+            await close(hashers, docs, len(extractors))
+            await close(extractors, segments, len(chunkers))
+            await close(chunkers, chunked, len(embedders))
+            await close(embedders, commits, 1)
+            await committer
+        finally:
+            for task in stages:
+                task.cancel()
+            self.progress.close()
+            self.progress = None
+
+        wall = time.perf_counter() - started
+        throughput = {name: stats.summary(wall) for name, stats in self.stats.items()}
+        throughput["wall_s"] = round(wall, 3)
+        return self.results, throughput
@@ -0,0 +1,513 @@
+import asyncio
+import json
+import os
+import queue
+import struct
+import threading
+import time
+from concurrent.futures import Future
+from dataclasses import dataclass, field, replace
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple, Union
+import faiss
+import numpy as np
+import sys
+ROOT = Path(__file__).resolve().parents[4]
+
+if str(ROOT) not in sys.path:
+    sys.path.append(str(ROOT))
+
+try:
+    import fcntl
+except ImportError:  # Windows: no cross-process lock, the in-process writer is still single
+    fcntl = None
+
+from src.server.rag_server.common.config.rag_config import (
+    INDEX_FILE, VECTORS_FILE, INGEST_WAL_FILE, INGEST_LOCK_FILE, INGEST_BATCH_WINDOW, INGEST_MAX_BATCH,
+    COMPACT_TOMBSTONE_RATIO, COMPACT_MIN_TOMBSTONES
+)
+from src.server.rag_server.common.chunk_store import ChunkStore, DocCacheEntry, PENDING_HASH, get_chunk_store
+from src.server.rag_server.common.index_store import resident_index, rag_index_spec
+from src.common.vector_index.index_factory import IndexSpec, build_index, needs_rebuild, normalize, stored_vectors
+from src.common.logger.logger import get_logger
+
+logger = get_logger()
+
+WAL_MAGIC = b"RWAL"
+WAL_HEADER = struct.Struct("<4sI")  # magic, header length
+
+
+@dataclass
+class IngestJob:
+    """One document's worth of chunks waiting for the writer."""
+    records: List[dict]
+    vectors: np.ndarray
+    cache_entries: Dict[str, DocCacheEntry] = field(default_factory=dict)
+    continues: bool = False  # a later window of the document being committed under cache_entries
+    future: Future = field(default_factory=Future)
+
+
+def _fsync_dir(path: Path):
+    if os.name != "posix":
+        return
+    fd = os.open(str(path), os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def write_index_atomic(index, index_file: Path = INDEX_FILE):
+    """Write a new index generation next to the old one, fsync it, then rename it into place.
+    Readers see either the previous or the new file, never a partial one."""
+    index_file = Path(index_file)
+    tmp = index_file.with_name(f"{index_file.name}.tmp.{os.getpid()}")
+    data = faiss.serialize_index(index)
+    with open(tmp, "wb") as f:
+        f.write(data.tobytes())
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, index_file)
+    _fsync_dir(index_file.parent)
+
+
+class IngestQueue:
+    """
+    Single writer for the RAG index.
+
+    Ingest handlers embed their chunks and submit() them; one background thread
+    drains the queue, groups whatever arrived within batch_window (up to
+    max_batch documents) and commits the group:
+
+    1. append the batch (base id, vectors, metadata, cache entries with the FAISS
+       id range of each document's chunks, ids of the chunks they replace) to the WAL and fsync
+    2. append the metadata rows to the ChunkStore and tombstone the replaced
+       chunks (one sqlite transaction)
+    3. append the vectors to vectors.f32, add them to the index (rebuilding it
+       from vectors.f32 when the corpus outgrows the configured index type, see
+       IndexSpec) and rename a new index.bin generation into place
+    4. truncate the WAL and resolve every job's future
+
+    A crash at any point is recovered on the next start by replaying the WAL
+    record whose vectors are not in index.bin yet; both steps are idempotent.
+
+    Documents are upserted by their cache keys (file name or doc_id): committing
+    a key again tombstones the chunks committed under it before, and delete()
+    tombstones a doc_id. A large document can be submitted in windows so its
+    chunks and vectors are never all in memory at once: the first window carries
+    a PENDING_HASH entry and replaces the old version, later windows pass
+    continues=True to extend its id range, and the last one carries the real
+    entry. Searches filter tombstones out (see IndexSnapshot); once they make up
+    COMPACT_TOMBSTONE_RATIO of the index, compact() drops them from the vectors,
+    the index and the chunk store and renumbers the rest.
+    Commits also take an flock on INGEST_LOCK_FILE so the MCP server and the web
+    API can write to the same index. Search readers never take a lock: they keep
+    using their snapshot until the new index.bin is in place.
+    """
+    def __init__(self,
+                 index_file: Path = INDEX_FILE,
+                 vectors_file: Path = VECTORS_FILE,
+                 wal_file: Path = INGEST_WAL_FILE,
+                 lock_file: Path = INGEST_LOCK_FILE,
+                 store: Optional[ChunkStore] = None,
+                 batch_window: float = INGEST_BATCH_WINDOW,
+                 max_batch: int = INGEST_MAX_BATCH,
+                 spec: Optional[IndexSpec] = None):
+        self.index_file = Path(index_file)
+        self.vectors_file = Path(vectors_file)
+        self.spec = spec or rag_index_spec()
+        self.wal_file = Path(wal_file)
+        self.lock_file = Path(lock_file)
+        self.store = store
+        self.batch_window = batch_window
+        self.max_batch = max(1, max_batch)
+        self.generation = 0
+        self._queue: "queue.Queue[IngestJob]" = queue.Queue()
+        self._index = None
+        self._index_stamp = None
+        self._thread: Optional[threading.Thread] = None
+        self._start_lock = threading.Lock()
+        self._write_lock = threading.Lock()  # flock alone does not exclude threads on platforms without fcntl
+
+    # ---------- public API ----------
+    def submit(self, records: List[dict], vectors, cache_entries: Optional[Dict[str, Union[str, DocCacheEntry]]] = None,
+               continues: bool = False) -> Future:
+        """Queue chunks for the writer; the future resolves to a commit summary.
+        Vectors are stored unit-length so search scores are cosine similarities.
+        cache_entries are content hashes or DocCacheEntry rows for the submitted document;
+        continues=True appends to the pending document committed under them instead of
+        replacing it. Jobs are committed in submission order."""
+        vectors = normalize(vectors)
+        if vectors.ndim != 2 or len(vectors) != len(records):
+            raise ValueError(f"Expected one vector per record, got {vectors.shape} for {len(records)} records")
+        entries = {key: DocCacheEntry.coerce(value) for key, value in (cache_entries or {}).items()}
+        job = IngestJob(records=list(records), vectors=vectors, cache_entries=entries, continues=continues)
+        self._ensure_started()
+        self._queue.put(job)
+        return job.future
+
+    async def asubmit(self, records: List[dict], vectors, cache_entries: Optional[Dict[str, Union[str, DocCacheEntry]]] = None,
+                      continues: bool = False) -> dict:
+        return await asyncio.wrap_future(self.submit(records, vectors, cache_entries, continues))
+
+    def delete(self, doc_id: str) -> dict:
+        """Tombstone every chunk of doc_id and forget its cache entries. Searches stop
+        returning the chunks immediately; they leave the index at the next compaction."""
+        with self._file_lock():
+            chunks = self._store().delete_document(doc_id)
+            if chunks:
+                resident_index.invalidate()
+                logger.info(f"Deleted document {doc_id} ({chunks} chunks tombstoned)")
+                self._maybe_compact()
+        return {"status": "deleted" if chunks else "not_found", "doc_id": doc_id, "chunks": chunks}
+
+    async def adelete(self, doc_id: str) -> dict:
+        return await asyncio.to_thread(self.delete, doc_id)
+
+    def compact(self) -> dict:
+        """Drop tombstoned chunks now, regardless of COMPACT_TOMBSTONE_RATIO"""
+        with self._file_lock():
+            return self._compact()
+
+    def pending(self) -> int:
+        return self._queue.qsize()
+
+    # ---------- writer thread ----------
+    def _ensure_started(self):
+        with self._start_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="rag-ingest-writer", daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        try:
+            with self._file_lock():
+                self._recover_compaction()
+                self._replay_wal()
+        except Exception as e:
+            logger.error(f"WAL replay failed: {e}")
+
+        while True:
+            jobs = [self._queue.get()]
+            deadline = time.monotonic() + self.batch_window
+            while len(jobs) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    jobs.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            try:
+                self._commit(jobs)
+            except Exception as e:
+                logger.error(f"Ingest commit of {len(jobs)} documents failed: {e}")
+                self._index_stamp = None  # in-memory index may be ahead of disk; reload it
+                for job in jobs:
+                    if not job.future.done():
+                        job.future.set_exception(e)
+            try:
+                with self._file_lock():
+                    self._maybe_compact()
+            except Exception as e:
+                logger.error(f"Index compaction failed: {e}")
+                self._index_stamp = None
+
+    def _file_lock(self):
+        return _FileLock(self.lock_file, self._write_lock)
+
+    def _store(self) -> ChunkStore:
+        return self.store or get_chunk_store()
+
+    def _current_index(self):
+        """Writer's in-memory index, reloaded if another process committed a new generation."""
+        try:
+            st = self.index_file.stat()
+            stamp = (st.st_mtime_ns, st.st_size, st.st_ino)
+        except FileNotFoundError:
+            stamp = None
+        if stamp is None or stamp != self._index_stamp:
+            self._index = faiss.read_index(str(self.index_file)) if stamp else None
+            self._index_stamp = stamp
+        return self._index
+
+    def _install(self, index):
+        write_index_atomic(index, self.index_file)
+        st = self.index_file.stat()
+        self._index, self._index_stamp = index, (st.st_mtime_ns, st.st_size, st.st_ino)
+        self.generation += 1
+        resident_index.invalidate()
+
+    def _commit(self, jobs: List[IngestJob]):
+        with self._file_lock():
+            index = self._current_index()
+            store = self._store()
+            cache = store.doc_cache_entries()
+            previous = dict(cache)
+
+            accepted: List[IngestJob] = []
+            for job in jobs:
+                dim = job.vectors.shape[1]
+                expected = index.d if index is not None else (accepted[0].vectors.shape[1] if accepted else dim)
+                if dim != expected:
+                    job.future.set_exception(ValueError(f"Embedding dimension {dim} does not match index dimension {expected}"))
+                elif (job.cache_entries and not job.continues
+                      and all(k in cache and v.hash != PENDING_HASH and cache[k].hash == v.hash for k, v in job.cache_entries.items())):
+                    # Same content was committed while this job was waiting
+                    job.future.set_result({"status": "skipped", "chunks": 0})
+                else:
+                    accepted.append(job)
+                    cache.update(job.cache_entries)
+            if not accepted:
+                return
+
+            base = index.ntotal if index is not None else 0
+            records = [record for job in accepted for record in job.records]
+            vectors = np.vstack([job.vectors for job in accepted])
+            cache_entries, tombstones, offset = {}, [], base
+            for job in accepted:
+                doc_id = job.records[0].get("doc_id") if job.records else None
+                for key, entry in job.cache_entries.items():
+                    old = previous.get(key)
+                    first_id = offset
+                    if job.continues and old is not None and old.hash == PENDING_HASH and old.first_id is not None:
+                        first_id = old.first_id  # later window: extend the range of the pending document
+                    elif old is not None:
+                        # Upsert: the chunks committed under this key before stop being searchable
+                        tombstones.extend(self._replaced_ids(store, key, old, base, records))
+                    cache_entries[key] = {**entry.to_dict(), "doc_id": doc_id, "first_id": first_id, "end_id": offset + len(job.records)}
+                    previous[key] = DocCacheEntry.coerce(cache_entries[key])
+                offset += len(job.records)
+
+            self._write_wal(base, records, vectors, cache_entries, tombstones)
+            index = self._apply(index, base, records, vectors, cache_entries, tombstones)
+            self._truncate_wal()
+
+        offset = base
+        for job in accepted:
+            job.future.set_result({
+                "status": "committed",
+                "chunks": len(job.records),
+                "faiss_ids": [offset, offset + len(job.records)],
+                "generation": self.generation,
+            })
+            offset += len(job.records)
+        logger.info(f"Committed {len(accepted)} documents ({len(records)} chunks, {len(tombstones)} replaced), index now has {index.ntotal} vectors")
+
+    @staticmethod
+    def _replaced_ids(store: ChunkStore, key: str, old: DocCacheEntry, base: int, records: List[dict]) -> List[int]:
+        """Chunks of the version committed under key before: ids below base are in the store,
+        ids from base on belong to an earlier job of the batch being committed"""
+        if old.first_id is None:
+            return store.replaced_chunk_ids(key, old)
+        ids = store.replaced_chunk_ids(key, replace(old, end_id=min(old.end_id, base))) if old.first_id < base else []
+        ids.extend(base + i for i in range(max(old.first_id, base) - base, old.end_id - base)
+                   if old.doc_id is None or records[i].get("doc_id") == old.doc_id)
+        return ids
+
+    def _apply(self, index, base: int, records: List[dict], vectors: np.ndarray, cache_entries: Dict[str, dict], tombstones: List[int]):
+        # Metadata first: rows beyond index.ntotal are invisible to readers until the index lands
+        self._store().append(base, records, cache_entries, tombstones)
+        self._append_vectors(index, base, vectors)
+        if index is not None:
+            index.add(vectors)
+        if index is None or needs_rebuild(index, self.spec):
+            total = base + len(vectors)
+            logger.info(f"Building {self.spec.target_type(total)} index from {total} stored vectors")
+            index = build_index(normalize(self._load_vectors(total, vectors.shape[1])), self.spec)
+        self._install(index)
+        return index
+
+    # ---------- stored vectors ----------
+    def _append_vectors(self, index, base: int, vectors: np.ndarray):
+        """Keep vectors.f32 in step with the index: rows [0, base) followed by this batch"""
+        row_bytes = vectors.shape[1] * 4
+        stored = self.vectors_file.stat().st_size // row_bytes if self.vectors_file.exists() else 0
+        with open(self.vectors_file, "r+b" if self.vectors_file.exists() else "wb") as f:
+            if stored < base:
+                # index.bin predates vectors.f32 (or the file was lost): recover rows from the index
+                f.seek(0)
+                f.write(normalize(stored_vectors(index)[:base]).tobytes())
+            f.truncate(base * row_bytes)  # drop rows of an interrupted commit
+            f.seek(base * row_bytes)
+            f.write(vectors.astype(np.float32).tobytes())
+            f.flush()
+            os.fsync(f.fileno())
+
+    def _load_vectors(self, count: int, dim: int) -> np.ndarray:
+        return np.fromfile(self.vectors_file, dtype=np.float32, count=count * dim).reshape(count, dim)
+
+    # ---------- compaction ----------
+    def _maybe_compact(self):
+        index = self._current_index()
+        dead = self._store().tombstone_count()
+        if index is not None and dead >= COMPACT_MIN_TOMBSTONES and dead >= COMPACT_TOMBSTONE_RATIO * index.ntotal:
+            self._compact()
+
+    def _compact(self) -> dict:
+        """
+        Rewrite vectors.f32, index.bin and the chunk store without tombstoned chunks.
+
+        The surviving vectors are staged in vectors.f32.compact and fsynced and the
+        pending compaction is recorded; then the file is renamed into place, the
+        compacted index.bin installed, and finally one sqlite transaction starts the
+        renumbered id layout (ChunkStore.compact). Until that transaction the chunk
+        store still matches the old index.bin, and readers that load the new
+        index.bin in between see the pending record and keep their snapshot (see
+        ResidentIndex). A crash after the record is finished by _recover_compaction()
+        on the next start; the tombstones are still there to say which chunks to drop.
+        """
+        index = self._current_index()
+        store = self._store()
+        if index is None:
+            return {"status": "empty", "removed": 0}
+        total, dim = index.ntotal, index.d
+        dead = store.tombstone_ids(limit=total)
+        if not len(dead):
+            return {"status": "clean", "removed": 0, "chunks": total}
+
+        start = time.perf_counter()
+        keep = np.ones(total, dtype=bool)
+        keep[dead] = False
+        live = self._stored_vectors(index)[keep]
+        staged = self._staged_vectors_file()
+        with open(staged, "wb") as f:
+            f.write(live.tobytes())
+            f.flush()
+            os.fsync(f.fileno())
+
+        pending = {"count": len(live), "dim": dim, "total": total}
+        store.set_meta("compaction", json.dumps(pending))
+        self._finish_compaction(pending)
+        logger.info(f"Compacted index: removed {len(dead)} tombstoned chunks, {len(live)} remain ({time.perf_counter() - start:.2f}s)")
+        return {"status": "compacted", "removed": len(dead), "chunks": len(live)}
+
+    def _stored_vectors(self, index) -> np.ndarray:
+        row_bytes = index.d * 4
+        stored = self.vectors_file.stat().st_size // row_bytes if self.vectors_file.exists() else 0
+        if stored >= index.ntotal:
+            return self._load_vectors(index.ntotal, index.d)
+        return normalize(stored_vectors(index))  # index.bin predates vectors.f32
+
+    def _staged_vectors_file(self) -> Path:
+        return self.vectors_file.with_name(self.vectors_file.name + ".compact")
+
+    def _finish_compaction(self, pending: dict):
+        staged = self._staged_vectors_file()
+        if staged.exists():
+            os.replace(staged, self.vectors_file)
+            _fsync_dir(self.vectors_file.parent)
+        self._install(build_index(self._load_vectors(pending["count"], pending["dim"]), self.spec))
+        store = self._store()
+        store.compact(store.tombstone_ids(limit=pending["total"]), pending["total"], {"compaction": None})
+        resident_index.invalidate()
+
+    def _recover_compaction(self):
+        pending = self._store().get_meta("compaction")
+        if pending:
+            pending = json.loads(pending)
+            logger.info(f"Finishing interrupted compaction ({pending['count']} chunks)")
+            self._finish_compaction(pending)
+        else:
+            self._staged_vectors_file().unlink(missing_ok=True)  # staged before the compaction was recorded: discard
+
+    # ---------- write-ahead log ----------
+    def _write_wal(self, base: int, records: List[dict], vectors: np.ndarray, cache_entries: Dict[str, dict], tombstones: List[int]):
+        header = json.dumps({
+            "base": base,
+            "count": len(records),
+            "dim": int(vectors.shape[1]),
+            "records": records,
+            "cache": cache_entries,
+            "tombstones": tombstones,
+        }, ensure_ascii=False).encode("utf-8")
+        with open(self.wal_file, "ab") as f:
+            f.write(WAL_HEADER.pack(WAL_MAGIC, len(header)))
+            f.write(header)
+            f.write(vectors.astype(np.float32).tobytes())
+            f.flush()
+            os.fsync(f.fileno())
+
+    def _truncate_wal(self):
+        with open(self.wal_file, "wb") as f:
+            f.flush()
+            os.fsync(f.fileno())
+
+    def _read_wal(self) -> List[Tuple[dict, np.ndarray]]:
+        if not self.wal_file.exists():
+            return []
+        data = self.wal_file.read_bytes()
+        entries, pos = [], 0
+        while pos + WAL_HEADER.size <= len(data):
+            magic, header_len = WAL_HEADER.unpack_from(data, pos)
+            if magic != WAL_MAGIC:
+                logger.warning(f"Corrupt WAL record at byte {pos}, ignoring the rest")
+                break
+            start = pos + WAL_HEADER.size
+            try:
+                header = json.loads(data[start:start + header_len])
+            except ValueError:
+                break  # torn write: the batch was never acknowledged
+            vec_bytes = header["count"] * header["dim"] * 4
+            end = start + header_len + vec_bytes
+            if end > len(data):
+                break
+            vectors = np.frombuffer(data[start + header_len:end], dtype=np.float32).reshape(header["count"], header["dim"])
+            entries.append((header, vectors))
+            pos = end
+        return entries
+
+    def _replay_wal(self):
+        entries = self._read_wal()
+        if not entries:
+            return
+        index = self._current_index()
+        for header, vectors in entries:
+            ntotal = index.ntotal if index is not None else 0
+            base, count = header["base"], header["count"]
+            if base + count <= ntotal:
+                continue  # already in index.bin
+            if base != ntotal:
+                logger.error(f"WAL batch at id {base} does not follow index size {ntotal}, skipping")
+                continue
+            logger.info(f"Replaying WAL batch of {count} chunks at id {base}")
+            index = self._apply(index, base, header["records"], vectors, header["cache"], header.get("tombstones", []))
+        self._truncate_wal()
+
+
+class _FileLock:
+    """Exclusive advisory lock shared by every process that writes the index,
+    plus the writer's thread lock for callers outside the writer thread"""
+    def __init__(self, path: Path, thread_lock: Optional[threading.Lock] = None):
+        self.path = path
+        self.thread_lock = thread_lock
+        self._fd = None
+
+    def __enter__(self):
+        if self.thread_lock is not None:
+            self.thread_lock.acquire()
+        if fcntl is not None:
+            self._fd = open(self.path, "a")
+            fcntl.flock(self._fd.fileno(), fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc):
+        if self._fd is not None:
+            fcntl.flock(self._fd.fileno(), fcntl.LOCK_UN)
+            self._fd.close()
+            self._fd = None
+        if self.thread_lock is not None:
+            self.thread_lock.release()
+
+
+_queue: Optional[IngestQueue] = None
+_queue_lock = threading.Lock()
+
+
+def get_ingest_queue() -> IngestQueue:
+    """Process-wide ingestion writer"""
+    global _queue
+    with _queue_lock:
+        if _queue is None:
+            _queue = IngestQueue()
+        return _queue
@@ -0,0 +1,121 @@
+import multiprocessing
+import os
+import re
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterator, List, Optional, Tuple
+import sys
+from pathlib import Path
+ROOT = Path(__file__).resolve().parents[4]
+
+if str(ROOT) not in sys.path:
+    sys.path.append(str(ROOT))
+
+from src.server.rag_server.common.config.rag_config import (
+    GLOBAL_IMAGE_DIR, PDF_PAGES_PER_TASK, PDF_EXTRACT_WORKERS, PDF_PARALLEL_MIN_PAGES
+)
+from src.common.logger.logger import get_logger
+
+logger = get_logger()
+
+IMAGE_LINK = re.compile(r'!\[\]\((.*?/images/)([^)]+)\)')
+
+
+def page_count(file_path: str) -> int:
+    import pymupdf
+    with pymupdf.open(file_path) as doc:
+        return doc.page_count
+
+
+def page_ranges(total: int, pages_per_task: int = PDF_PAGES_PER_TASK) -> List[Tuple[int, int]]:
+    """[start, stop) page ranges covering 0..total"""
+    step = max(1, pages_per_task)
+    return [(start, min(start + step, total)) for start in range(0, total, step)]
+
+
+def extract_pages(file_path: str, start: int, stop: int, image_dir: str = str(GLOBAL_IMAGE_DIR)) -> str:
+    """
+    Markdown for pages [start, stop), with image links re-pointed to images/.
+    Runs in worker processes, so it only touches the PDF and the image dir.
+    """
+    import pymupdf4llm
+    markdown = pymupdf4llm.to_markdown(
+        file_path,
+        pages=list(range(start, stop)),
+        write_images=True,
+        image_path=image_dir
+    )
+
+    #Re-point image links in the markdown
+    return IMAGE_LINK.sub(r'![](images/\2)', markdown.replace("\\", "/"))
+
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+
+def extract_workers() -> int:
+    return PDF_EXTRACT_WORKERS or min(4, os.cpu_count() or 1)
+
+
+def get_extract_pool() -> ProcessPoolExecutor:
+    """
+    Process pool shared by every PDF extraction, started on first use.
+    Workers are spawned rather than forked: the parent runs logger, ingest and
+    HTTP threads whose locks must not be copied into a child mid-operation.
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=extract_workers(), mp_context=multiprocessing.get_context("spawn"))
+        return _pool
+
+
+def iter_pdf_markdown(file_path: str, pages_per_task: int = PDF_PAGES_PER_TASK, caption: bool = True) -> Iterator[str]:
+    """
+    Yield a PDF's markdown one page range at a time, in page order.
+
+    Ranges are converted in parallel by the shared process pool; at most two
+    ranges per worker are in flight or waiting to be consumed, so memory stays
+    bounded however long the PDF is, and the pool keeps extracting ahead while
+    the caller chunks and embeds what it already has. PDFs shorter than
+    PDF_PARALLEL_MIN_PAGES are converted in-process.
+    """
+    GLOBAL_IMAGE_DIR.mkdir(parents=True, exist_ok=True)
+    if caption:
+        from src.server.rag_server.common.captioner import replace_images_with_captions
+
+    total = page_count(file_path)
+    ranges = page_ranges(total, pages_per_task)
+    logger.info(f"Extracting {total} pages from {file_path} in {len(ranges)} range(s)")
+
+    if total < PDF_PARALLEL_MIN_PAGES:
+        results = (extract_pages(file_path, start, stop) for start, stop in ranges)
+    else:
+        results = _parallel_results(file_path, ranges)
+
+    for markdown in results:
+        yield replace_images_with_captions(markdown) if caption else markdown
+
+
+def _parallel_results(file_path: str, ranges: List[Tuple[int, int]]) -> Iterator[str]:
+    pool = get_extract_pool()
+    window = 2 * extract_workers()
+    pending = deque()
+    remaining = iter(ranges)
+    try:
+        for start, stop in remaining:
+            pending.append(pool.submit(extract_pages, file_path, start, stop))
+            if len(pending) >= window:
+                break
+        while pending:
+            markdown = pending.popleft().result()
+            next_range = next(remaining, None)
+            if next_range is not None:
+                pending.append(pool.submit(extract_pages, file_path, *next_range))
+            yield markdown
+    finally:
+        # Caller stopped early (error or close()): drop ranges nobody will read
+        for future in pending:
+            future.cancel()
@@ -1,11 +1,8 @@
 from mcp.server.fastmcp import FastMCP
 import trafilatura
 import sys
-import faiss
 import numpy as np
-import uuid
 from pathlib import Path
-from tqdm import tqdm
 from typing import Optional
 import logging
 
@@ -18,10 +15,13 @@ if str(ROOT) not in sys.path:
 
 from src.server.rag_server.schema.rag_model import UrlInput, FilePathInput
 from src.server.rag_server.common.utils import (
-    get_embedding, semantic_merge, replace_images_with_captions, load_index_and_metadata, file_hash, save_index_and_metadata, extract_title_from_content, determine_source_type
+    get_embedding, replace_images_with_captions
 )
-from src.server.rag_server.common.config.rag_config import DOC_PATH, INDEX_CACHE
-from src.server.rag_server.common.content_extracter import extract_pdf, extract_webpage
+from src.server.rag_server.common.config.rag_config import DOC_PATH, INDEX_CACHE, SEARCH_MIN_SCORE
+from src.common.vector_index.index_factory import similarity_search
+from src.server.rag_server.common.index_store import get_index_snapshot
+from src.server.rag_server.common.chunk_store import get_chunk_store
+from src.server.rag_server.common.ingest_pipeline import IngestPipeline
 
 mcp = FastMCP("RagServer")
 logger = logging.getLogger("shadow_clone_agent")
@@ -39,17 +39,15 @@ def mcp_log(level, message):
 from pydantic import BaseModel
 class ProcessDoc_Input(BaseModel):
     input_path: Optional[str] = None
+    chunking_mode: Optional[str] = None  # "structure" | "similarity"; None -> CHUNKING_MODE
 
 
 from src.server.rag_server.schema.rag_model import UrlInput, MarkdownOutput, FilePathInput
-import trafilatura
-import pymupdf4llm
 import os
-import re
 
 
-from src.server.rag_server.common.config.rag_config import GLOBAL_IMAGE_DIR
 from src.server.rag_server.common.utils import replace_images_with_captions
+from src.server.rag_server.common.pdf_extractor import iter_pdf_markdown
 from src.common.logger.logger import get_logger
 
 logger = get_logger()  
@@ -79,24 +77,9 @@ def extract_pdf(input: FilePathInput) -> MarkdownOutput:
 
     if not os.path.exists(input.file_path):
         return MarkdownOutput(markdown=f"File not found: {input.file_path}")
-    
-    global_image_dir = GLOBAL_IMAGE_DIR
-    global_image_dir.mkdir(parents=True, exist_ok=True)
 
-    markdown = pymupdf4llm.to_markdown(
-        input.file_path,
-        write_images = True,
-        image_path = str(global_image_dir)
-    )
-
-    #Re-point image links in the markdown
-    markdown = re.sub(
-        r'!\[\]\((.*?/images/)([^)]+)\)',
-        r'![](images/\2)',
-        markdown.replace("\\", "/")
-    )
-        
-    markdown = replace_images_with_captions(markdown)
+    # Page ranges are converted in parallel worker processes and captioned as they arrive
+    markdown = "".join(iter_pdf_markdown(input.file_path))
     return MarkdownOutput(markdown=markdown)
 
 
@@ -107,58 +90,35 @@ class SearchQuery(BaseModel):
     min_score: float = 0.0  # Minimum similarity score threshold
 
 @mcp.tool()
-async def search_documents(query, top_k=5, include_context=True, min_score=0.8):
+async def search_documents(query, top_k=5, include_context=True, min_score=SEARCH_MIN_SCORE):
     """
     Search for information similar to the query in local documents and return the results.
+    Scores are cosine similarities (1.0 = identical); results below min_score are not returned.
     """
     try:
-        # Load index and metadata
-        index, metadata, _ = load_index_and_metadata()
+        # Resident index: only re-read from disk when a new version was written
+        snapshot = get_index_snapshot()
+        index, metadata = snapshot.index, snapshot.metadata
         
         if index is None or index.ntotal == 0:
             return {"results": [], "query": query, "total_results": 0}
         
-        logger.info(f"Successfully loaded index with {index.ntotal} vectors and {len(metadata)} metadata entries")
-        
         # Get embedding for query
         query_embedding = get_embedding(query)
         query_embedding = np.array([query_embedding], dtype=np.float32)
         
-        # Search
-        k = min(top_k * 2, index.ntotal)  # Fetch more results than needed for filtering
-        D, I = index.search(query_embedding, k)
-        
-        logger.info(f"Search returned {len(I[0])} initial results")
+        # Search: absolute cosine scores, min_score applied inside FAISS (range search);
+        # tombstoned (replaced/deleted) chunks are skipped by the search itself
+        hits = similarity_search(index, query_embedding, top_k, min_score=min_score, params=snapshot.search_params())
         
-        # Find max and min distances to normalize scores
-        if len(D[0]) > 0:
-            max_distance = max(D[0])
-            min_distance = min(D[0])
-            distance_range = max(max_distance - min_distance, 0.001)  # Prevent division by zero
-        else:
-            max_distance = 1.0
-            min_distance = 0.0
-            distance_range = 1.0
+        logger.info(f"Search returned {len(hits)} results above {min_score}")
             
         results = []
-        for i, (distance, idx) in enumerate(zip(D[0], I[0])):
+        for i, (idx, score) in enumerate(hits):
             if idx >= len(metadata) or idx < 0:
                 logger.warning(f"Invalid index {idx} found in search results (metadata length: {len(metadata)})")
                 continue
             
-            # Calculate normalized score (1.0 is best, 0.0 is worst)
-            if max_distance == min_distance:
-                # All distances are the same
-                score = 0.7  # Default reasonable score
-            else:
-                # Normalize to 0-1 range and invert (1 = closest match)
-                score = float(1.0 - ((distance - min_distance) / distance_range))
-            print(f"score: {score}")
-            # Skip results below the minimum score threshold
-            if score < min_score:
-                logger.debug(f"Skipping result {i} due to low score: {score} < {min_score}")
-                continue
-            
             # Extract metadata for this result
             result_meta = metadata[idx].copy()
             
@@ -187,9 +147,6 @@ async def search_documents(query, top_k=5, include_context=True, min_score=0.8):
             
             results.append(result)
         
-        # Sort by score and limit to requested number
-        results = sorted(results, key=lambda x: x["score"], reverse=True)[:top_k]
-        
         logger.info(f"Returning {len(results)} final filtered results")
         
         return {
@@ -221,11 +178,14 @@ async def process_documents(path :ProcessDoc_Input):
     - Generates vector embeddings for each chunk
     - Builds searchable FAISS vector index
     - Caches results to avoid reprocessing unchanged documents
+    - Replaces the chunks of changed documents instead of duplicating them
     
     Args:
         input_path (Optional[str]): Path to specific file or directory to process. 
                              If None, processes all supported files in the configured document directory.
                              Path can be absolute or relative to document directory.
+        chunking_mode (Optional[str]): "structure" (markdown structure + LLM for ambiguous boundaries)
+                             or "similarity" (sentence embeddings, no LLM calls). Defaults to CHUNKING_MODE.
     
     Returns:
         dict: A dictionary containing:
@@ -253,8 +213,8 @@ async def process_documents(path :ProcessDoc_Input):
     DOC_PATH.mkdir(exist_ok=True, parents=True)
     INDEX_CACHE.mkdir(exist_ok=True)
     
-    # Load cache and existing data
-    index, metadata, cache_meta = load_index_and_metadata()
+    # Stat + content hash of already indexed files (the index itself is owned by the ingest writer)
+    cache_entries = get_chunk_store().doc_cache_entries()
     
     # Determine which files to process
     if path.input_path:
@@ -283,128 +243,17 @@ async def process_documents(path :ProcessDoc_Input):
     
     mcp_log("INFO", f"Found {len(files_to_process)} files to process")
     
-    # Process files one by one
-    processed_count = 0
-    skipped_count = 0
-    error_count = 0
-    results = []
-    
-    for file in tqdm(files_to_process, desc="Processing documents"):
-        # Check cache first
-        fhash = file_hash(file)
-        if file.name in cache_meta and cache_meta[file.name] == fhash:
-            mcp_log("SKIP", f"Skipping unchanged file: {file.name}")
-            skipped_count += 1
-            continue
-        
-        mcp_log("PROC", f"Processing: {file.name}")
-        try:
-            ext = file.suffix.lower()
-            markdown = ""
-            url = None  # Initialize URL as None
-
-            if ext == ".pdf":
-                mcp_log("INFO", f"Using MuPDF4LLM to extract {file.name}")
-                markdown = extract_pdf(FilePathInput(file_path=str(file))).markdown
-
-            elif ext in [".html", ".htm", ".url"]:
-                mcp_log("INFO", f"Using Trafilatura to extract {file.name}")
-                if ext == ".url":
-                    with open(file, 'r', encoding='utf-8') as f:
-                        url = f.readline().strip()
-                    markdown = extract_webpage(UrlInput(url=url)).markdown
-                else:
-                    # For local HTML files, we need to read them first
-                    with open(file, 'r', encoding='utf-8', errors='ignore') as f:
-                        html_content = f.read()
-                    # Then use trafilatura to process the HTML content
-                    markdown = trafilatura.extract(
-                        html_content,
-                        include_comments=False,
-                        include_tables=True,
-                        include_images=True,
-                        output_format='markdown'
-                    ) or ""
-                    markdown = replace_images_with_captions(markdown)
-
-            else:
-                # For TXT and MD files, just read the content
-                with open(file, 'r', encoding='utf-8', errors='ignore') as f:
-                    markdown = f.read()
-
-            if not markdown.strip():
-                mcp_log("WARN", f"No content extracted from {file.name}")
-                continue
-
-            # Generate enhanced metadata fields
-            doc_id = str(uuid.uuid4())  # Generate unique doc_id
-            source_type = determine_source_type(ext)
-            title = extract_title_from_content(markdown, file.name)
-
-            if len(markdown.split()) < 10:
-                mcp_log("WARN", f"Content too short for semantic merge in {file.name} → Skipping chunking.")
-                chunks = [markdown.strip()]
-            else:
-                mcp_log("INFO", f"Running semantic merge on {file.name} with {len(markdown.split())} words")
-                chunks = semantic_merge(markdown)
-
-            # Process embeddings for this file
-            embeddings_for_file = []
-            new_metadata = []
-            for i, chunk in enumerate(tqdm(chunks, desc=f"Embedding {file.name}")):
-                embedding = get_embedding(chunk)
-                embeddings_for_file.append(embedding)
-                
-                # Enhanced metadata with all the requested fields
-                chunk_metadata = {
-                    "doc": file.name,  # Keep original field
-                    "doc_id": doc_id,  # New field: unique document ID
-                    "title": title,    # New field: extracted or fallback title
-                    "source_type": source_type,  # New field: type of document
-                    "chunk": chunk,    # Original field: the actual content
-                    "chunk_id": f"{doc_id}_{i}"  # Modified to use doc_id instead of file.stem
-                }
-                
-                # Add URL only if it exists
-                if url:
-                    chunk_metadata["url"] = url
-                
-                new_metadata.append(chunk_metadata)
-
-            if embeddings_for_file:
-                if index is None:
-                    dim = len(embeddings_for_file[0])
-                    index = faiss.IndexFlatL2(dim)
-                
-                # Add embeddings to index
-                index.add(np.stack(embeddings_for_file))
-                metadata.extend(new_metadata)
-                cache_meta[file.name] = fhash
-                
-                # Immediately save index and metadata
-                save_index_and_metadata(index, metadata, cache_meta)
-                mcp_log("SAVE", f"Saved FAISS index and metadata after processing {file.name}")
-                
-                results.append({
-                    "file": file.name,
-                    "doc_id": doc_id,
-                    "title": title,
-                    "status": "success",
-                    "chunks": len(chunks)
-                })
-                processed_count += 1
-            
-        except Exception as e:
-            mcp_log("ERROR", f"Failed to process {file.name}: {str(e)}")
-            error_count += 1
-            results.append({
-                "file": file.name,
-                "status": "error",
-                "error": str(e)
-            })
-    
-    # Final save (though likely not needed since we save after each file)
-    save_index_and_metadata(index, metadata, cache_meta)
+    # Staged pipeline: files are hashed, extracted, chunked, embedded and committed
+    # concurrently, with bounded queues between the stages
+    results, stages = await IngestPipeline(chunking_mode=path.chunking_mode, log=mcp_log).run(files_to_process, cache_entries)
+    processed_count = sum(1 for r in results if r["status"] == "success")
+    skipped_count = sum(1 for r in results if r["status"] == "skipped")
+    error_count = sum(1 for r in results if r["status"] == "error")
+    results = [r for r in results if r["status"] != "skipped"]
+    mcp_log("INFO", "Stage throughput: " + ", ".join(
+        f"{name} {stats['units_per_s']}/s ({stats['utilization']:.0%} busy)"
+        for name, stats in stages.items() if isinstance(stats, dict)
+    ))
     
     # Summary
     mcp_log("INFO", f"Processing complete. Processed: {processed_count}, Skipped: {skipped_count}, Errors: {error_count}")
@@ -416,7 +265,8 @@ async def process_documents(path :ProcessDoc_Input):
             "processed": processed_count,
             "skipped": skipped_count,
             "errors": error_count,
-            "results": results
+            "results": results,
+            "stages": stages
         }
     }
 
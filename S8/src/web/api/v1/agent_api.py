@@ -1,4 +1,5 @@
 from fastapi import FastAPI, HTTPException
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 import asyncio
 from typing import List, Dict, Any, Optional
@@ -17,16 +18,39 @@ if str(ROOT) not in sys.path:
     sys.path.append(str(ROOT))
 
 # Import your existing agent functionality
-from src.core.agent.agent import main as agent_main
+from src.core.agent.agent import main as agent_main, main_stream as agent_main_stream, create_dispatcher
+from src.core.agent.common.session import MultiMCP
 
 # Import memory components to access stored plans
 from src.core.agent.common.memory_store.memory import MemoryManager, MemoryItem
+from src.core.agent.common.llm.model_manager import get_model_manager
 from src.common.logger.logger import get_logger
 
 logger = get_logger()
 
 app = FastAPI(title="Agent-Based Search API")
 
+# One MCP dispatcher per API process: pooled server sessions are spawned once at
+# startup and shared by every request instead of being respawned per agent run
+dispatcher: Optional[MultiMCP] = None
+
+
+@app.on_event("startup")
+async def startup_event():
+    """Start the MCP servers once so requests reuse the pooled sessions"""
+    global dispatcher
+    dispatcher = await create_dispatcher()
+    logger.info("MCP dispatcher started")
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Stop the health monitor and close the pooled MCP sessions"""
+    global dispatcher
+    if dispatcher is not None:
+        await dispatcher.shutdown()
+        dispatcher = None
+
 # Define models similar to search_api.py for consistency
 class AgentQuery(BaseModel):
     query: str
@@ -328,6 +352,21 @@ def retrieve_vector_search_results(session_id: str) -> Optional[Dict[str, Any]]:
         logger.error(f"Error retrieving vector search results from memory: {e}", exc_info=True)
         return None
 
+def enhance_query(query: str) -> str:
+    """Ask for source URLs when the query looks like an information search"""
+    enhanced_query = query
+    
+    # If query seems like a search for information, explicitly request URLs
+    search_terms = ["find", "search", "look up", "research", "information about", "details on", "website", "link"]
+    if any(term in query.lower() for term in search_terms):
+        # Modify the query to explicitly ask for URLs if relevant
+        if not any(term in enhanced_query.lower() for term in ["include url", "provide url", "with source"]):
+            enhanced_query += " (Please include source URLs in your response if available)"
+    return enhanced_query
+
+def sse_event(event: str, data: Dict[str, Any]) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False, default=str)}\n\n"
+
 @app.post("/agent", response_model=AgentResponse)
 async def search(query_params: AgentQuery):
     """
@@ -340,20 +379,13 @@ async def search(query_params: AgentQuery):
         logger.info(f"Received search query: {query_params.query}")
         
         # Enhance the query to request source URLs if appropriate
-        enhanced_query = query_params.query
-        
-        # If query seems like a search for information, explicitly request URLs
-        search_terms = ["find", "search", "look up", "research", "information about", "details on", "website", "link"]
-        if any(term in query_params.query.lower() for term in search_terms):
-            # Modify the query to explicitly ask for URLs if relevant
-            if not any(term in enhanced_query.lower() for term in ["include url", "provide url", "with source"]):
-                enhanced_query += " (Please include source URLs in your response if available)"
+        enhanced_query = enhance_query(query_params.query)
         
         logger.info(f"Enhanced query: {enhanced_query}")
         session_id = query_params.session_id
         
         # Call your agent's main function with the enhanced query
-        agent_response = await agent_main(enhanced_query, session_id)
+        agent_response = await agent_main(enhanced_query, session_id, dispatcher=dispatcher)
         
         logger.info(f"Agent response: {agent_response}")
  
@@ -395,6 +427,44 @@ async def search(query_params: AgentQuery):
         logger.error(f"Search error: {e}", exc_info=True)
         return AgentResponse(results=f"An error occurred while processing your query: {str(e)}")
 
+@app.post("/agent/stream")
+async def search_stream(query_params: AgentQuery):
+    """
+    Streaming variant of /agent (Server-Sent Events).
+    
+    Emits step, perception, memory, plan, action and error events while the
+    agent runs, token events with final-answer text as the LLM generates it,
+    and a final event whose "results" matches the /agent response.
+    """
+    logger.info(f"Received streaming query: {query_params.query}")
+    enhanced_query = enhance_query(query_params.query)
+    
+    async def events():
+        try:
+            async for item in agent_main_stream(enhanced_query, query_params.session_id, dispatcher=dispatcher):
+                if item["event"] == "final":
+                    answer = item["data"]["answer"] or ""
+                    if answer.startswith("FINAL_ANSWER:"):
+                        answer = answer[len("FINAL_ANSWER:"):].strip()
+                    yield sse_event("final", {"results": answer})
+                else:
+                    yield sse_event(item["event"], item["data"])
+        except Exception as e:
+            logger.error(f"Streaming search error: {e}", exc_info=True)
+            yield sse_event("error", {"stage": "api", "message": f"An error occurred while processing your query: {str(e)}"})
+    
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.get("/agent/cache")
+async def cache_stats():
+    """Hit-rate metrics of the LLM response cache (perception / planning calls)"""
+    # Through the ModelManager, so the cache is built with the profile's llm.response_cache settings
+    return get_model_manager().cache_stats()
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8002)
\ No newline at end of file
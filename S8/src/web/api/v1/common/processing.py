@@ -1,18 +1,12 @@
-from fastapi import FastAPI, HTTPException
-from fastapi.middleware.cors import CORSMiddleware
+from fastapi import HTTPException
 from pydantic import BaseModel, HttpUrl
 from typing import Optional, List
+import asyncio
+import os
 import numpy as np
-import faiss
 import uuid
 from pathlib import Path
 import sys
-from PIL import Image  # Add pillow dependency
-from io import BytesIO
-
-# Import trafilatura and pymupdf4llm for better extraction
-import trafilatura
-import pymupdf4llm
 
 from pathlib import Path
 import sys
@@ -26,7 +20,7 @@ from src.common.logger.logger import get_logger
 logger = get_logger()
 
 
-from src.server.rag_server.common.config.rag_config import DOC_PATH, INDEX_CACHE
+from src.server.rag_server.common.config.rag_config import DOC_PATH, INGEST_COMMIT_CHUNKS
 
 # Define models
 class TextInput(BaseModel):
@@ -59,11 +53,44 @@ class SearchResponse(BaseModel):
     query: str
     total_results: int
 
-from src.server.rag_server.common.utils import get_embedding, replace_images_with_captions,semantic_merge,file_hash, load_index_and_metadata, save_index_and_metadata, extract_title_from_content, determine_source_type
+from src.server.rag_server.common.utils import embedding_client, semantic_merge,file_hash, check_file_cache, stream_chunks_and_embeddings
+from src.server.rag_server.common.chunk_store import DocCacheEntry, PENDING_HASH, get_chunk_store
+from src.server.rag_server.common.ingest_queue import get_ingest_queue
+from src.server.rag_server.common.pdf_extractor import iter_pdf_markdown
+
+
+def chunk_records(doc_id, title, source_type, chunks, url=None, start=0) -> List[dict]:
+    records = []
+    for i, chunk in enumerate(chunks, start):
+        chunk_metadata = {
+            "doc_id": doc_id,
+            "title": title,
+            "source_type": source_type,
+            "chunk": chunk,
+            "chunk_id": f"{doc_id}_{i}",
+        }
+        
+        # Add URL only if it exists
+        if url:
+            chunk_metadata["url"] = url
+            
+        records.append(chunk_metadata)
+    return records
+
+
+def content_file(doc_id) -> Path:
+    """Where the extracted text of a pdf/html document is kept"""
+    # Create a safe filename by replacing invalid characters
+    safe_filename = "".join(c if c.isalnum() or c in "-_." else "_" for c in doc_id)
+    # Truncate if too long (filesystem limits)
+    if len(safe_filename) > 200:
+        safe_filename = safe_filename[:200]
+    return DOC_PATH / f"{safe_filename}.txt"
 
 
-async def process_content(content, title, source_type, doc_id=None, url=None, filename=None):
-    """Process content and add to vector DB using improved chunking"""
+async def process_content(content, title, source_type, doc_id=None, url=None, filename=None, chunking_mode=None):
+    """Process content and add to vector DB using improved chunking.
+    chunking_mode: "structure" or "similarity" (see semantic_merge); None uses CHUNKING_MODE."""
     # Generate unique ID if not provided
     if not doc_id:
         doc_id = str(uuid.uuid4())
@@ -71,11 +98,8 @@ async def process_content(content, title, source_type, doc_id=None, url=None, fi
     # Create a content hash for cache checking
     content_hash = file_hash(content)
     
-    # Load existing index and metadata
-    index, metadata, cache_meta = load_index_and_metadata()
-    
     # Check if we've already processed this content
-    if doc_id in cache_meta and cache_meta[doc_id] == content_hash:
+    if get_chunk_store().cached_hash(doc_id) == content_hash:
         return {"status": "skipped", "message": f"Content already exists in index with ID {doc_id}", "doc_id": doc_id}
     
     # Create chunks using semantic merge instead of simple chunking
@@ -84,68 +108,31 @@ async def process_content(content, title, source_type, doc_id=None, url=None, fi
         chunks = [content.strip()]
     else:
         logger.info(f"Running semantic merge with {len(content.split())} words")
-        chunks = semantic_merge(content)
+        # Chunker fans LLM/embedding calls out on threads; keep the event loop free meanwhile
+        chunks = await asyncio.to_thread(semantic_merge, content, chunking_mode)
     
     if not chunks:
         raise HTTPException(status_code=400, detail="Content too short to process")
     
-    # Get embeddings for chunks
-    embeddings = []
-    new_metadata = []
-    
-    for i, chunk in enumerate(chunks):
-        try:
-            embedding = get_embedding(chunk)
-            embeddings.append(embedding)
-            
-            chunk_metadata = {
-                "doc_id": doc_id,
-                "title": title,
-                "source_type": source_type,
-                "chunk": chunk,
-                "chunk_id": f"{doc_id}_{i}",
-            }
-            
-            # Add URL only if it exists
-            if url:
-                chunk_metadata["url"] = url
-                
-            new_metadata.append(chunk_metadata)
-        except Exception as e:
-            logger.error(f"Failed to get embedding for chunk {i}: {e}")
-    
-    if not embeddings:
+    # Get embeddings for chunks (batched, concurrent, without blocking the event loop)
+    try:
+        embeddings = list(await embedding_client().aembed_batch(chunks))
+    except Exception as e:
+        logger.error(f"Failed to get embeddings for {len(chunks)} chunks: {e}")
         raise HTTPException(status_code=500, detail="Failed to generate any embeddings")
     
-    # Initialize index if needed
-    if index is None:
-        dim = len(embeddings[0])
-        index = faiss.IndexFlatL2(dim)
+    new_metadata = chunk_records(doc_id, title, source_type, chunks, url)
     
-    # Add embeddings to index
-    embeddings_array = np.stack(embeddings)
-    index.add(embeddings_array)
-    
-    # Update metadata
-    metadata.extend(new_metadata)
-    
-    # Update cache
-    cache_meta[doc_id] = content_hash
-    
-    # Save index and metadata
-    save_index_and_metadata(index, metadata, cache_meta)
+    # Hand off to the single index writer; concurrent ingests are batched into one commit
+    commit = await get_ingest_queue().asubmit(new_metadata, np.stack(embeddings), {doc_id: content_hash})
+    if commit["status"] == "skipped":
+        return {"status": "skipped", "message": f"Content already exists in index with ID {doc_id}", "doc_id": doc_id}
     
     # If it's a file type we want to save locally, save it
     if source_type in ["pdf", "html"]:
-        # Create a safe filename by replacing invalid characters
-        safe_filename = "".join(c if c.isalnum() or c in "-_." else "_" for c in doc_id)
-        # Truncate if too long (filesystem limits)
-        if len(safe_filename) > 200:
-            safe_filename = safe_filename[:200]
-        
         # Save content to file
         try:
-            with open(DOC_PATH / f"{safe_filename}.txt", "w", encoding="utf-8") as f:
+            with open(content_file(doc_id), "w", encoding="utf-8") as f:
                 f.write(content)
         except Exception as e:
             logger.error(f"Failed to save content file: {e}")
@@ -157,4 +144,89 @@ async def process_content(content, title, source_type, doc_id=None, url=None, fi
         "doc_id": doc_id,
         "title": title,
         "source_type": source_type
-    }
\ No newline at end of file
+    }
+
+
+async def process_pdf_file(pdf_path, title, doc_id=None, filename=None, chunking_mode=None, remove_file=False):
+    """Like process_content for a PDF on disk, without ever holding its full markdown,
+    chunks or vectors: page ranges are extracted in worker processes (iter_pdf_markdown),
+    chunked and embedded as they arrive, and committed in windows of INGEST_COMMIT_CHUNKS.
+    remove_file deletes pdf_path afterwards (uploaded temp files)."""
+    new_document = not doc_id
+    if new_document:
+        doc_id = str(uuid.uuid4())
+
+    target = content_file(doc_id)
+    partial = target.with_name(target.name + ".part")
+    writer = get_ingest_queue()
+    chunks, embeddings = [], []
+    committed, pending = 0, None
+    try:
+        # The PDF itself is hashed (streamed), so re-uploading the same file is skipped before any extraction:
+        # a new upload has a fresh doc_id, so its hash is looked up across every indexed document
+        store = get_chunk_store()
+        entry, unchanged = await asyncio.to_thread(check_file_cache, Path(pdf_path), store.cached_entry(doc_id))
+        existing = await asyncio.to_thread(store.find_by_hash, entry.hash) if new_document else None
+        if existing is not None:
+            unchanged, doc_id = True, existing[1].doc_id or existing[0]
+        if unchanged:
+            return {"status": "skipped", "message": f"Content already exists in index with ID {doc_id}", "doc_id": doc_id}
+
+        def submit_window(cache_entry):
+            # Windows reach the single writer in order; only the last one carries the content hash
+            nonlocal chunks, embeddings, committed
+            future = writer.submit(chunk_records(doc_id, title, "pdf", chunks, start=committed), np.stack(embeddings),
+                                   {doc_id: cache_entry}, continues=committed > 0)
+            committed += len(chunks)
+            chunks, embeddings = [], []
+            return asyncio.wrap_future(future)
+
+        with open(partial, "w", encoding="utf-8") as out:
+            segments = iter_pdf_markdown(str(pdf_path))
+            async for segment, segment_chunks, vectors in stream_chunks_and_embeddings(segments, chunking_mode):
+                out.write(segment)
+                if segment_chunks and len(chunks) >= INGEST_COMMIT_CHUNKS:
+                    # Flushed only once more chunks follow, so the last window is never empty
+                    if pending is not None:
+                        await pending  # at most one window waits on the writer while the next is embedded
+                    pending = submit_window(DocCacheEntry(hash=PENDING_HASH))
+                chunks.extend(segment_chunks)
+                embeddings.extend(vectors)
+
+        if not chunks:
+            logger.error(f"Could not extract text from PDF {filename or pdf_path}")
+            return {"status": "error", "message": "Could not extract text from PDF", "doc_id": doc_id}
+
+        if pending is not None:
+            await pending
+            pending = None
+        # Only the hash is kept: the stat of an uploaded temp file says nothing about the next upload
+        commit = await submit_window(DocCacheEntry(hash=entry.hash))
+        if commit["status"] == "skipped":  # single window, same content committed meanwhile
+            return {"status": "skipped", "message": f"Content already exists in index with ID {doc_id}", "doc_id": doc_id}
+
+        os.replace(partial, target)
+        logger.info(f"Indexed {committed} chunks from PDF {filename or pdf_path}")
+        return {
+            "status": "success",
+            "message": f"Added {committed} chunks to the index",
+            "doc_id": doc_id,
+            "title": title,
+            "source_type": "pdf"
+        }
+    except Exception as e:
+        logger.error(f"Error processing PDF {filename or pdf_path}: {e}")
+        if pending is not None:
+            await asyncio.gather(pending, return_exceptions=True)
+        cached = await asyncio.to_thread(get_chunk_store().cached_entry, doc_id)
+        if cached is not None and cached.hash == PENDING_HASH:
+            # Earlier windows already replaced the previous version; drop the half-ingested one too
+            await writer.adelete(doc_id)
+            target.unlink(missing_ok=True)
+        return {"status": "error", "message": str(e), "doc_id": doc_id}
+    finally:
+        for path in ([partial, pdf_path] if remove_file else [partial]):
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
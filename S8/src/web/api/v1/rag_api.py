@@ -2,6 +2,7 @@ from fastapi import FastAPI, UploadFile, File, Form, HTTPException, BackgroundTa
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel, HttpUrl
 from typing import Optional, List
+import asyncio
 import numpy as np
 import hashlib
 from pathlib import Path
@@ -12,7 +13,6 @@ import json
 import faiss
 from PIL import Image  # Add pillow dependency
 import trafilatura
-import pymupdf4llm
 
 from pathlib import Path
 import sys
@@ -22,8 +22,13 @@ if str(ROOT) not in sys.path:
     sys.path.append(str(ROOT))
 
 from src.server.rag_server.common.utils import get_embedding, replace_images_with_captions, load_index_and_metadata
-from src.web.api.v1.common.processing import process_content
-from src.server.rag_server.common.config.rag_config import GLOBAL_IMAGE_DIR
+from src.web.api.v1.common.processing import process_content, process_pdf_file, content_file
+from src.server.rag_server.common.pdf_extractor import page_count
+from src.server.rag_server.common.index_store import get_index_snapshot
+from src.server.rag_server.common.ingest_queue import get_ingest_queue
+from src.server.rag_server.common.chunker import CHUNKING_MODES
+from src.common.vector_index.index_factory import similarity_search
+from src.common.embedding.embedding_cache import get_embedding_cache
 from src.common.logger.logger import get_logger
 
 logger = get_logger()
@@ -44,6 +49,7 @@ class TextInput(BaseModel):
     content: str
     title: Optional[str] = None
     source_type: str = "text"
+    chunking_mode: Optional[str] = None  # "structure" | "similarity"
 
 class UrlInput(BaseModel):
     url: HttpUrl
@@ -53,7 +59,9 @@ class SearchQuery(BaseModel):
     query: str
     top_k: int = 5
     include_context: bool = True
-    min_score: float = 0.0  # Minimum similarity score threshold
+    min_score: float = 0.0  # Minimum cosine similarity (absolute, same meaning on every query)
+    nprobe: Optional[int] = None     # IVF lists to scan (default: IVF_NPROBE)
+    ef_search: Optional[int] = None  # HNSW candidate list size (default: HNSW_EF_SEARCH)
 
 class SearchResult(BaseModel):
     doc_id: str
@@ -79,18 +87,18 @@ async def search(query_params: SearchQuery):
     - **query**: The search query text
     - **top_k**: Maximum number of results to return (default: 5)
     - **include_context**: Whether to include the text chunks in results (default: true)
-    - **min_score**: Minimum similarity score threshold (default: 0.0)
+    - **min_score**: Minimum cosine similarity, 1.0 = identical (default: 0.0)
+    - **nprobe** / **ef_search**: Per-query recall vs latency knobs for IVF / HNSW indexes
     """
     
     try:
-        index, metadata, _ = load_index_and_metadata()
-        # Load index and metadata
+        # Resident index: only re-read from disk when a new version was written
+        snapshot = get_index_snapshot()
+        index, metadata = snapshot.index, snapshot.metadata
         if index is None or index.ntotal == 0:
             return SearchResponse(results=[], query=query_params.query, total_results=0)
         
         try:
-            logger.info(f"Successfully loaded index with {index.ntotal} vectors and {len(metadata)} metadata entries")
-            
             if index.ntotal == 0:
                 logger.warning("Index exists but contains no vectors")
                 return SearchResponse(results=[], query=query_params.query, total_results=0)
@@ -115,48 +123,20 @@ async def search(query_params: SearchQuery):
                 total_results=0
             )
         
-        # Search
-        k = min(query_params.top_k * 2, index.ntotal)  # Fetch more results than needed for filtering
-        D, I = index.search(query_embedding, k)
-        
-        logger.info(f"Search returned {len(I[0])} initial results")
-        logger.info(f"Raw distances: {D[0]}")  # Log the raw distances for debugging
+        # Search: absolute cosine scores, min_score applied inside FAISS (range search)
+        # Tombstoned (replaced/deleted) chunks are excluded inside FAISS, so top_k stays full
+        params = snapshot.search_params(nprobe=query_params.nprobe, ef_search=query_params.ef_search)
+        hits = similarity_search(index, query_embedding, query_params.top_k, min_score=query_params.min_score, params=params)
         
-        # Find max and min distances to normalize scores
-        if len(D[0]) > 0:
-            max_distance = max(D[0])
-            min_distance = min(D[0])
-            distance_range = max(max_distance - min_distance, 0.001)  # Prevent division by zero
-        else:
-            max_distance = 1.0
-            min_distance = 0.0
-            distance_range = 1.0
+        logger.info(f"Search returned {len(hits)} results above {query_params.min_score}")
             
         results = []
-        for i, (distance, idx) in enumerate(zip(D[0], I[0])):
+        for i, (idx, score) in enumerate(hits):
             if idx >= len(metadata) or idx < 0:
                 logger.warning(f"Invalid index {idx} found in search results (metadata length: {len(metadata)})")
                 continue
             
-            # Calculate normalized score (1.0 is best, 0.0 is worst)
-            # Inverting because smaller distance is better
-            if max_distance == min_distance:
-                # All distances are the same
-                score = 0.7  # Default reasonable score
-            else:
-                # Normalize to 0-1 range and invert (1 = closest match)
-                score = float(1.0 - ((distance - min_distance) / distance_range))
-                
-                # Alternative: use exponential decay formula
-                # score = float(math.exp(-distance))
-            
-            logger.info(f"Result {i}: distance={distance}, score={score}, min_score={query_params.min_score}")
-            
-            # Skip results below the minimum score threshold
-            effective_min_score = query_params.min_score
-            if score < effective_min_score:
-                logger.info(f"Skipping result {i} due to low score: {score} < {effective_min_score}")
-                continue
+            logger.info(f"Result {i}: score={score}")
             
             # Extract metadata for this result
             result_meta = metadata[idx].copy()
@@ -189,9 +169,6 @@ async def search(query_params: SearchQuery):
             
             results.append(result)
         
-        # Sort by score and limit to requested number
-        results = sorted(results, key=lambda x: x["score"], reverse=True)[:query_params.top_k]
-        
         logger.info(f"Returning {len(results)} final filtered results")
         
         return SearchResponse(
@@ -215,7 +192,7 @@ async def search(query_params: SearchQuery):
 #     - **query**: The search query text
 #     - **top_k**: Maximum number of results to return (default: 5)
 #     - **include_context**: Whether to include the text chunks in results (default: true)
-#     - **min_score**: Minimum similarity score threshold (default: 0.0)
+#     - **min_score**: Minimum cosine similarity, 1.0 = identical (default: 0.0)
 #     """
     
     
@@ -343,13 +320,17 @@ async def ingest_text(background_tasks: BackgroundTasks, text_input: TextInput):
     if not text_input.content.strip():
         raise HTTPException(status_code=400, detail="Text content cannot be empty")
     
+    if text_input.chunking_mode and text_input.chunking_mode not in CHUNKING_MODES:
+        raise HTTPException(status_code=400, detail=f"chunking_mode must be one of {CHUNKING_MODES}")
+    
     title = text_input.title or "Untitled Text Document"
     
     background_tasks.add_task(
         process_content, 
         text_input.content, 
         title, 
-        "text"
+        "text",
+        chunking_mode=text_input.chunking_mode
     )
     
     return {"status": "processing", "message": "Text content is being processed"}
@@ -430,7 +411,7 @@ async def ingest_pdf(
     pdf_file: UploadFile = File(...),
     title: Optional[str] = Form(None)
 ):
-    """Ingest content from PDF file using pymupdf4llm for better extraction"""
+    """Ingest content from PDF file using pymupdf4llm (parallel page ranges) for better extraction"""
     if not pdf_file.filename.lower().endswith('.pdf'):
         raise HTTPException(status_code=400, detail="File must be a PDF")
     
@@ -443,54 +424,40 @@ async def ingest_pdf(
         tmp.write(pdf_bytes)
         tmp_path = tmp.name
     
+    scheduled = False
     try:
-        # Create image directory
-        global_image_dir = GLOBAL_IMAGE_DIR
-        global_image_dir.mkdir(parents=True, exist_ok=True)
-        
-        # Extract PDF to markdown using pymupdf4llm
-        markdown = pymupdf4llm.to_markdown(
-            tmp_path,
-            write_images=True,
-            image_path=str(global_image_dir)
-        )
-        
-        # Re-point image links in the markdown
-        markdown = re.sub(
-            r'!\[\]\((.*?/images/)([^)]+)\)',
-            r'![](images/\2)',
-            markdown.replace("\\", "/")
-        )
-        
-        # Process images with captioning
-        markdown = replace_images_with_captions(markdown)
-        
-        if not markdown.strip():
+        # Cheap validity check; extraction itself runs in the background task
+        if await asyncio.to_thread(page_count, tmp_path) == 0:
             raise HTTPException(status_code=400, detail="Could not extract text from PDF")
         
         # Use provided title or filename
         final_title = title or pdf_file.filename
         
-        # Process the content with our semantic merge chunking
+        # Page ranges are extracted in worker processes and streamed into chunking/embedding;
+        # the task deletes the temp file when it is done
         background_tasks.add_task(
-            process_content, 
-            markdown, 
-            final_title, 
-            "pdf",
-            filename=pdf_file.filename
+            process_pdf_file,
+            tmp_path,
+            final_title,
+            filename=pdf_file.filename,
+            remove_file=True
         )
+        scheduled = True
         
         return {"status": "processing", "message": "PDF is being processed", "title": final_title}
     
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error processing PDF: {e}")
         raise HTTPException(status_code=500, detail=f"Failed to process PDF: {str(e)}")
     finally:
-        # Clean up the temp file
-        try:
-            os.unlink(tmp_path)
-        except:
-            pass
+        # Clean up the temp file unless the background task owns it
+        if not scheduled:
+            try:
+                os.unlink(tmp_path)
+            except:
+                pass
 
 @app.post("/ingest/universal")
 async def ingest_universal(
@@ -534,14 +501,31 @@ async def ingest_universal(
             detail="Invalid request. Please provide valid content_type and corresponding data"
         )
 
+@app.delete("/documents/{doc_id}")
+async def delete_document(doc_id: str):
+    """Remove a document from search. Its chunks are tombstoned at once and dropped
+    from the index at the next compaction."""
+    result = await get_ingest_queue().adelete(doc_id)
+    if result["status"] == "not_found":
+        raise HTTPException(status_code=404, detail=f"Document {doc_id} not found")
+    
+    # Saved copy of the extracted content (PDF / HTML ingests)
+    try:
+        os.unlink(content_file(doc_id))
+    except FileNotFoundError:
+        pass
+    
+    return {"status": "deleted", "doc_id": doc_id, "chunks": result["chunks"]}
+
 @app.get("/status")
 async def check_status():
     """Check the status of the ingestion system"""
     try:
-        index, metadata, cache_meta = load_index_and_metadata()
+        snapshot = get_index_snapshot()
+        index, metadata, cache_meta = snapshot.index, snapshot.metadata, snapshot.cache_meta
         
-        document_count = len(set(meta.get("doc_id", "") for meta in metadata)) if metadata else 0
-        chunk_count = len(metadata) if metadata else 0
+        document_count = metadata.document_count() if metadata else 0
+        chunk_count = snapshot.live_count
         
         return {
             "status": "online",
@@ -549,7 +533,10 @@ async def check_status():
             "chunks_indexed": chunk_count,
             "index_exists": index is not None,
             "metadata_exists": metadata is not None and len(metadata) > 0,
-            "cache_entries": len(cache_meta) if cache_meta else 0
+            "cache_entries": len(cache_meta) if cache_meta else 0,
+            "tombstoned_chunks": len(snapshot.tombstones),
+            "index_generation": snapshot.generation,
+            "embedding_cache": get_embedding_cache().stats()
         }
     except Exception as e:
         return {